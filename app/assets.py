@@ -0,0 +1,257 @@
+"""
+Doručování statických souborů a cachovaných HTML stránek.
+
+Soubory ze `static/` se načtou při startu do paměti, dostanou otisk
+obsahu v názvu (`css/app.3f2a9c1b.css`) a k nim předkomprimované varianty
+gzip a brotli. Adresa s otiskem se cachuje natrvalo (immutable), adresa
+bez otisku se u prohlížeče vždy revaliduje přes ETag. Stránky bez dat
+z requestu (index) se vyrenderují jednou a doručují stejně.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import threading
+from typing import Optional
+import logging
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli je volitelný, bez něj se posílá jen gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Cachovat vyrenderované stránky bez dat z requestu (0 = renderovat vždy, pro úpravy šablon)
+HTML_CACHE = os.environ.get("HTML_CACHE", "1") == "1"
+
+# Menší soubory se nekomprimují (hlavičky by zabraly víc, než komprese ušetří)
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "512"))
+
+# Délka otisku obsahu v názvu souboru (hex znaky sha256)
+FINGERPRINT_LENGTH = 12
+
+# Cache-Control pro adresy s otiskem a bez něj
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"
+
+# Typy obsahu, které má smysl komprimovat
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    """Kódování z hlavičky Accept-Encoding s nenulovou vahou."""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class CompressedBody:
+    """
+    Obsah odpovědi s předkomprimovanými variantami a ETagem.
+
+    Args:
+        data: Nekomprimovaný obsah
+        media_type: Content-Type
+    """
+
+    def __init__(self, data: bytes, media_type: str):
+        self.media_type = media_type
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.variants: dict[str, bytes] = {"identity": data}
+        if len(data) >= COMPRESS_MIN_SIZE and media_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed["br"] = brotli.compress(data, quality=11)
+            for encoding, body in compressed.items():
+                if len(body) < len(data):
+                    self.variants[encoding] = body
+
+    def etag(self, encoding: str) -> str:
+        suffix = "" if encoding == "identity" else f"-{encoding}"
+        return f'"{self.digest[:16]}{suffix}"'
+
+    def choose(self, headers: Headers) -> str:
+        """Vybere nejmenší variantu, kterou klient přijímá."""
+        accepted = _accepted_encodings(headers.get("accept-encoding", ""))
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return "identity"
+
+    def response(self, headers: Headers, cache_control: str) -> Response:
+        """Odpověď 200 s vybranou variantou, nebo 304 při shodě If-None-Match."""
+        encoding = self.choose(headers)
+        etag = self.etag(encoding)
+        response_headers = {"ETag": etag, "Cache-Control": cache_control}
+        if len(self.variants) > 1:
+            response_headers["Vary"] = "Accept-Encoding"
+        if_none_match = headers.get("if-none-match")
+        if if_none_match:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if etag in tags or "*" in tags:
+                return Response(status_code=304, headers=response_headers)
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], headers=response_headers, media_type=self.media_type)
+
+    def sizes(self) -> dict[str, int]:
+        return {encoding: len(body) for encoding, body in self.variants.items()}
+
+
+class StaticAsset:
+    """Jeden soubor ze static/ (obsah, varianty, adresa s otiskem)."""
+
+    def __init__(self, path: str, body: CompressedBody, mtime_ns: int):
+        self.path = path
+        self.body = body
+        self.mtime_ns = mtime_ns
+        root, ext = posixpath.splitext(path)
+        self.fingerprinted = f"{root}.{body.digest[:FINGERPRINT_LENGTH]}{ext}"
+
+
+class StaticAssets:
+    """
+    ASGI aplikace pro `/static` s otisky, předkomprimovanými variantami a ETagy.
+
+    Soubory se načtou při vytvoření. Soubor přidaný nebo změněný za běhu se
+    při požadavku na adresu bez otisku načte znovu.
+
+    Args:
+        directory: Adresář se statickými soubory
+        prefix: URL prefix, pod kterým je aplikace připojená
+    """
+
+    def __init__(self, directory: str, prefix: str = "/static"):
+        self.directory = os.path.realpath(directory)
+        self.prefix = prefix.rstrip("/")
+        self._assets: dict[str, StaticAsset] = {}
+        self._by_fingerprint: dict[str, StaticAsset] = {}
+        self._lock = threading.Lock()
+        self._scan()
+
+    def _scan(self):
+        total = {"identity": 0, "gzip": 0, "br": 0}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                rel = os.path.relpath(os.path.join(root, name), self.directory).replace(os.sep, "/")
+                asset = self._load(rel)
+                if asset is not None:
+                    for encoding, size in asset.body.sizes().items():
+                        total[encoding] += size
+        logger.info(f"Načteno {len(self._assets)} statických souborů: {total}")
+
+    def _load(self, rel: str) -> Optional[StaticAsset]:
+        """Načte soubor do paměti (None, pokud neexistuje nebo je mimo adresář)."""
+        full = os.path.realpath(os.path.join(self.directory, rel))
+        if not full.startswith(self.directory + os.sep):
+            return None
+        try:
+            st = os.stat(full)
+            with open(full, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        media_type = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+        asset = StaticAsset(rel, CompressedBody(data, media_type), st.st_mtime_ns)
+        with self._lock:
+            # Starší otisk zůstává platný (odkazuje na něj už vyrenderovaná stránka)
+            self._assets[rel] = asset
+            self._by_fingerprint[asset.fingerprinted] = asset
+        return asset
+
+    def _current(self, rel: str) -> Optional[StaticAsset]:
+        """Soubor podle adresy bez otisku (znovu načtený, pokud se na disku změnil)."""
+        with self._lock:
+            asset = self._assets.get(rel)
+        try:
+            mtime_ns = os.stat(os.path.join(self.directory, rel)).st_mtime_ns
+        except OSError:
+            return asset
+        if asset is None or asset.mtime_ns != mtime_ns:
+            asset = self._load(rel)
+        return asset
+
+    def url(self, path: str) -> str:
+        """Adresa souboru s otiskem obsahu (pro šablony); neznámý soubor dostane adresu bez otisku."""
+        rel = path.lstrip("/")
+        asset = self._current(rel)
+        return f"{self.prefix}/{asset.fingerprinted if asset else rel}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        assert scope["type"] == "http"
+        if scope["method"] not in ("GET", "HEAD"):
+            response = Response("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+            await response(scope, receive, send)
+            return
+        rel = scope["path"].lstrip("/")
+        with self._lock:
+            asset = self._by_fingerprint.get(rel)
+        cache_control = CACHE_IMMUTABLE
+        if asset is None:
+            asset = self._current(rel)
+            cache_control = CACHE_REVALIDATE
+        if asset is None:
+            response = Response("Not Found", status_code=404, media_type="text/plain")
+        else:
+            response = asset.body.response(Headers(scope=scope), cache_control)
+        await response(scope, receive, send)
+
+
+class PageCache:
+    """
+    Vyrenderované stránky, které nezávisí na requestu (index).
+
+    Stránka se vyrenderuje při prvním požadavku (nebo přes `warm`) a dál
+    se doručuje z paměti včetně komprimovaných variant a ETagu. S
+    HTML_CACHE=0 se renderuje při každém požadavku.
+
+    Args:
+        templates: Jinja2Templates aplikace
+    """
+
+    def __init__(self, templates, enabled: bool = HTML_CACHE):
+        self.templates = templates
+        self.enabled = enabled
+        self._pages: dict[str, CompressedBody] = {}
+        self._lock = threading.Lock()
+
+    def _render(self, name: str) -> CompressedBody:
+        html = self.templates.get_template(name).render()
+        return CompressedBody(html.encode("utf-8"), "text/html")
+
+    def get(self, name: str) -> CompressedBody:
+        if not self.enabled:
+            return self._render(name)
+        with self._lock:
+            page = self._pages.get(name)
+        if page is None:
+            page = self._render(name)
+            with self._lock:
+                self._pages[name] = page
+        return page
+
+    def warm(self, *names: str):
+        """Předem vyrenderuje a zkomprimuje stránky (při startu aplikace)."""
+        for name in names:
+            sizes = self.get(name).sizes()
+            logger.info(f"Stránka {name} připravena: {sizes}")
+
+    def response(self, name: str, headers: Headers) -> Response:
+        # Renderovaná stránka se u prohlížeče vždy revaliduje (po nasazení se mění)
+        return self.get(name).response(headers, CACHE_REVALIDATE)
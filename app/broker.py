@@ -0,0 +1,363 @@
+"""
+SSH broker - jeden proces drží všechna SSH spojení pro více web workerů.
+
+SSH session (paramiko transporty) žijí jen v procesu, který je otevřel.
+Při více uvicorn workerech proto SSH session drží samostatný proces
+brokera (`python -m app.broker`) se službou SSHService a workery k ní
+přistupují přes Unix socket pomocí BrokerClient. Request tak může
+obsloužit libovolný worker, broker ho podle session ID z cookie předá
+session, které patří.
+
+Protokol: JSON zprávy oddělené novým řádkem.
+    požadavek:  {"id": 1, "method": "run", "params": {...}}
+    odpověď:    {"id": 1, "result": ...} nebo {"id": 1, "error": {"type": ..., "message": ...}}
+    odběr:      {"id": 2, "method": "subscribe", "params": {"session_id": ...}}
+                -> {"id": 2, "event": [název, data]} (null = keepalive) až do
+                {"id": 3, "method": "unsubscribe", "params": {"subscription": 2}}
+
+Backpressure: broker čte z jednoho spojení nejvýše BROKER_MAX_INFLIGHT
+rozpracovaných požadavků, další čekají v socketu; klient drží stejný limit
+a zápis čeká na vyprázdnění bufferu. Pomalý odběratel událostí broker
+neblokuje - fronta odběru zahazuje nejstarší události.
+"""
+import asyncio
+import itertools
+import json
+import os
+import signal
+from typing import AsyncIterator, Optional
+import logging
+
+from app.events import EVENTS_QUEUE_SIZE
+from app.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Unix socket SSH brokera; když je nastavený, web workery drží SSH session přes broker
+SSH_BROKER_SOCKET = os.environ.get("SSH_BROKER_SOCKET", "")
+# Maximální počet rozpracovaných požadavků jednoho spojení (worker -> broker)
+BROKER_MAX_INFLIGHT = int(os.environ.get("BROKER_MAX_INFLIGHT", "64"))
+# Maximální velikost jedné zprávy v bytech
+BROKER_MAX_MESSAGE = 16 * 1024 * 1024
+
+# Metody služby, které lze volat přes broker
+BROKER_METHODS = (
+    "status", "run", "device_state", "submit_job", "list_jobs", "get_job", "cancel_job", "stats", "metrics"
+)
+
+
+class BrokerError(Exception):
+    """Broker není dostupný nebo operace v brokeru selhala neočekávanou chybou."""
+
+
+class _Connection:
+    """Zápis zpráv do socketu (jeden zapisovatel najednou, čeká na vyprázdnění bufferu)."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self._lock = asyncio.Lock()
+
+    async def send(self, message: dict):
+        data = json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+        async with self._lock:
+            self.writer.write(data)
+            await self.writer.drain()
+
+
+class BrokerServer:
+    """
+    Unix socket server nad SSHService.
+
+    Args:
+        service: Služba se SSH session (SSHService)
+        path: Cesta k Unix socketu
+        max_inflight: Maximální počet rozpracovaných požadavků jednoho spojení
+    """
+
+    def __init__(self, service, path: str, max_inflight: int = BROKER_MAX_INFLIGHT):
+        self.service = service
+        self.path = path
+        self.max_inflight = max_inflight
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = 0
+
+    async def start(self):
+        if os.path.exists(self.path):
+            # Socket po předchozím běhu
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, self.path, limit=BROKER_MAX_MESSAGE)
+        os.chmod(self.path, 0o600)
+        logger.info(f"SSH broker naslouchá na {self.path}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Obslouží jedno spojení workeru."""
+        self._connections += 1
+        connection = _Connection(writer)
+        slots = asyncio.Semaphore(self.max_inflight)
+        calls: set[asyncio.Task] = set()
+        subscriptions: dict[int, asyncio.Task] = {}
+        logger.info(f"SSH broker: připojen worker ({self._connections} spojení)")
+        try:
+            while True:
+                # Při plném počtu rozpracovaných požadavků se další nečtou
+                await slots.acquire()
+                line = await reader.readline()
+                if not line:
+                    slots.release()
+                    break
+                try:
+                    message = json.loads(line)
+                    request_id = message["id"]
+                    method = message["method"]
+                    params = message.get("params") or {}
+                except (ValueError, KeyError, TypeError) as e:
+                    slots.release()
+                    logger.error(f"SSH broker: neplatná zpráva: {e}")
+                    break
+                if method == "subscribe":
+                    slots.release()
+                    task = asyncio.create_task(self._stream(connection, request_id, params["session_id"]))
+                    subscriptions[request_id] = task
+                    task.add_done_callback(lambda _t, i=request_id: subscriptions.pop(i, None))
+                elif method == "unsubscribe":
+                    slots.release()
+                    task = subscriptions.pop(params.get("subscription"), None)
+                    if task is not None:
+                        task.cancel()
+                else:
+                    task = asyncio.create_task(self._call(connection, request_id, method, params, slots))
+                    calls.add(task)
+                    task.add_done_callback(calls.discard)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            logger.warning(f"SSH broker: spojení workeru přerušeno: {e}")
+        finally:
+            self._connections -= 1
+            for task in list(subscriptions.values()):
+                task.cancel()
+            # Rozběhnuté SSH operace doběhnou v executoru i bez odpovědi
+            for task in list(calls):
+                task.cancel()
+            writer.close()
+            logger.info(f"SSH broker: worker odpojen ({self._connections} spojení)")
+
+    async def _call(self, connection: _Connection, request_id: int, method: str, params: dict,
+                    slots: asyncio.Semaphore):
+        try:
+            if method not in BROKER_METHODS:
+                raise ValueError(f"Neznámá metoda brokera: {method}")
+            if method == "metrics":
+                # Metriky procesu brokera (SSH operace, session, úlohy)
+                result = await asyncio.to_thread(REGISTRY.render)
+            else:
+                result = await getattr(self.service, method)(**params)
+            response = {"id": request_id, "result": result}
+        except ValueError as e:
+            response = {"id": request_id, "error": {"type": "ValueError", "message": str(e)}}
+        except Exception as e:
+            logger.error(f"SSH broker: {method} selhalo: {e}")
+            response = {"id": request_id, "error": {"type": type(e).__name__, "message": str(e)}}
+        finally:
+            slots.release()
+        try:
+            await connection.send(response)
+        except (ConnectionError, RuntimeError):
+            pass
+
+    async def _stream(self, connection: _Connection, request_id: int, session_id: str):
+        """Posílá události kanálu session, dokud worker odběr nezruší."""
+        try:
+            async for event in self.service.subscribe(session_id):
+                await connection.send({"id": request_id, "event": event})
+        except (ConnectionError, RuntimeError):
+            pass
+
+
+class _Subscription:
+    """Fronta událostí jednoho odběru na straně workeru (při zaplnění zahodí nejstarší)."""
+
+    def __init__(self, queue_size: int):
+        self.queue: "asyncio.Queue[tuple[bool, Optional[list]]]" = asyncio.Queue(maxsize=queue_size)
+
+    def put(self, item: tuple[bool, Optional[list]]):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(item)
+
+
+class BrokerClient:
+    """
+    Přístup web workeru ke SSHService v procesu brokera (stejné rozhraní).
+
+    Spojení se otevře při prvním volání a po výpadku brokera se při dalším
+    volání naváže znovu. Rozpracovaná volání při výpadku skončí BrokerError.
+
+    Args:
+        path: Cesta k Unix socketu brokera
+        max_inflight: Maximální počet rozpracovaných volání tohoto workeru
+    """
+
+    def __init__(self, path: str, max_inflight: int = BROKER_MAX_INFLIGHT):
+        self.path = path
+        self.max_inflight = max_inflight
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._connection: Optional[_Connection] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._ids = itertools.count(1)
+        self._pending: dict[int, asyncio.Future] = {}
+        self._subscriptions: dict[int, _Subscription] = {}
+
+    async def _connect(self) -> _Connection:
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._connection is None:
+                try:
+                    reader, writer = await asyncio.open_unix_connection(self.path, limit=BROKER_MAX_MESSAGE)
+                except OSError as e:
+                    raise BrokerError(f"SSH broker není dostupný: {e}")
+                self._connection = _Connection(writer)
+                self._reader_task = asyncio.create_task(self._read_loop(reader, self._connection))
+                logger.info(f"Připojeno k SSH brokeru {self.path}")
+            return self._connection
+
+    async def _read_loop(self, reader: asyncio.StreamReader, connection: _Connection):
+        """Rozděluje odpovědi čekajícím voláním a události odběrům."""
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                request_id = message.get("id")
+                if "event" in message:
+                    subscription = self._subscriptions.get(request_id)
+                    if subscription is not None:
+                        subscription.put((True, message["event"]))
+                    continue
+                future = self._pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    error = message["error"]
+                    exc_type = ValueError if error.get("type") == "ValueError" else BrokerError
+                    future.set_exception(exc_type(error.get("message", "")))
+                else:
+                    future.set_result(message.get("result"))
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"Spojení s SSH brokerem přerušeno: {e}")
+        finally:
+            if self._connection is connection:
+                self._connection = None
+            connection.writer.close()
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(BrokerError("Spojení s SSH brokerem bylo přerušeno"))
+            self._pending.clear()
+            for subscription in self._subscriptions.values():
+                subscription.put((False, None))
+
+    async def _request(self, method: str, **params):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_inflight)
+        async with self._slots:
+            connection = await self._connect()
+            request_id = next(self._ids)
+            future = asyncio.get_running_loop().create_future()
+            self._pending[request_id] = future
+            try:
+                await connection.send({"id": request_id, "method": method, "params": params})
+            except (ConnectionError, RuntimeError) as e:
+                self._pending.pop(request_id, None)
+                raise BrokerError(f"SSH broker není dostupný: {e}")
+            return await future
+
+    async def start(self):
+        """Spojení se otevírá líně (broker může startovat souběžně s workery)."""
+
+    async def close(self):
+        if self._connection is not None:
+            self._connection.writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+
+    async def status(self, session_id: Optional[str]) -> dict:
+        return await self._request("status", session_id=session_id)
+
+    async def run(self, session_id: Optional[str], operation: str, **params) -> Optional[dict]:
+        return await self._request("run", session_id=session_id, operation=operation, **params)
+
+    async def device_state(self, session_id: Optional[str], refresh: bool = False) -> dict:
+        return await self._request("device_state", session_id=session_id, refresh=refresh)
+
+    async def submit_job(self, session_id: Optional[str], kind: str, params: dict) -> dict:
+        return await self._request("submit_job", session_id=session_id, kind=kind, params=params)
+
+    async def list_jobs(self, session_id: Optional[str], kind: Optional[str] = None,
+                        with_log: bool = False) -> list[dict]:
+        return await self._request("list_jobs", session_id=session_id, kind=kind, with_log=with_log)
+
+    async def get_job(self, session_id: Optional[str], job_id: str) -> Optional[dict]:
+        return await self._request("get_job", session_id=session_id, job_id=job_id)
+
+    async def cancel_job(self, session_id: Optional[str], job_id: str) -> Optional[dict]:
+        return await self._request("cancel_job", session_id=session_id, job_id=job_id)
+
+    async def stats(self) -> dict:
+        return await self._request("stats")
+
+    async def metrics(self) -> str:
+        return await self._request("metrics")
+
+    async def subscribe(self, session_id: str) -> AsyncIterator[Optional[tuple[str, dict]]]:
+        """Události kanálu session z brokera (None = keepalive); skončí při výpadku brokera."""
+        connection = await self._connect()
+        request_id = next(self._ids)
+        subscription = _Subscription(EVENTS_QUEUE_SIZE)
+        self._subscriptions[request_id] = subscription
+        try:
+            await connection.send({"id": request_id, "method": "subscribe", "params": {"session_id": session_id}})
+            while True:
+                alive, event = await subscription.queue.get()
+                if not alive:
+                    return
+                yield tuple(event) if event is not None else None
+        finally:
+            self._subscriptions.pop(request_id, None)
+            if self._connection is connection:
+                try:
+                    await connection.send({"id": next(self._ids), "method": "unsubscribe",
+                                           "params": {"subscription": request_id}})
+                except (ConnectionError, RuntimeError):
+                    pass
+
+
+async def serve(path: str):
+    """Spustí SSHService a broker na Unix socketu, běží do SIGTERM/SIGINT."""
+    from app.ssh_service import SSHService, register_gauges
+
+    service = SSHService()
+    register_gauges(service)
+    server = BrokerServer(service, path)
+    await service.start()
+    await server.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    logger.info("SSH broker končí")
+    await server.close()
+    await service.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(serve(SSH_BROKER_SOCKET or "/tmp/ssh-broker.sock"))
@@ -0,0 +1,234 @@
+"""
+Katalog binárních souborů v adresáři binaries.
+
+Výpis adresáře se cachuje a obnovuje jen při změně mtime adresáře
+(přidání, smazání, přejmenování souboru), případně po uplynutí
+CATALOG_REVALIDATE sekund (soubor přepsaný na místě). Hashe se počítají
+líně, jednou pro každou verzi souboru.
+"""
+import gzip
+import hashlib
+import os
+import shutil
+import threading
+import time
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Kořenový adresář aplikace (v kontejneru /app; templates, static, binaries)
+APP_ROOT = os.environ.get("APP_ROOT", "/app")
+
+# Cesta k binárním souborům v kontejneru
+BINARIES_PATH = os.path.join(APP_ROOT, "binaries")
+
+# Interval v sekundách, po kterém se znovu ověří velikost a mtime souborů v katalogu
+CATALOG_REVALIDATE = float(os.environ.get("CATALOG_REVALIDATE", "5"))
+
+# Adresář pro cache gzip artefaktů (klíčem je sha256 původního souboru)
+COMPRESSED_CACHE_DIR = os.environ.get("COMPRESSED_CACHE_DIR", "/tmp/lidl-gateway-gz")
+
+# Typy souborů v katalogu
+TYPE_SERIALGATEWAY = "serialgateway"
+TYPE_SX = "sx"
+TYPE_GBL = "gbl"
+TYPE_OTHER = "other"
+
+# Magické hodnoty na začátku souboru
+ELF_MAGIC = b"\x7fELF"
+GBL_HEADER_TAG = 0x03A617EB
+
+# Cache hashů lokálních souborů: (cesta, algoritmus) -> (velikost, mtime_ns, hash)
+_local_hash_cache: dict[tuple[str, str], tuple[int, int, str]] = {}
+_local_hash_lock = threading.Lock()
+
+
+def local_file_hash(path: str, algorithm: str = "md5") -> str:
+    """Vrací hash lokálního souboru (počítá se jednou pro každou verzi souboru)."""
+    st = os.stat(path)
+    key = (os.path.realpath(path), algorithm)
+    with _local_hash_lock:
+        cached = _local_hash_cache.get(key)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    result = digest.hexdigest()
+    with _local_hash_lock:
+        _local_hash_cache[key] = (st.st_size, st.st_mtime_ns, result)
+    return result
+
+
+def cached_file_hash(path: str, size: int, mtime_ns: int, algorithm: str = "sha256") -> Optional[str]:
+    """Vrací hash z cache, pokud je spočítaný pro danou verzi souboru (nepočítá ho)."""
+    with _local_hash_lock:
+        cached = _local_hash_cache.get((os.path.realpath(path), algorithm))
+    if cached and cached[0] == size and cached[1] == mtime_ns:
+        return cached[2]
+    return None
+
+
+def compressed_artifact(path: str, cache_dir: Optional[str] = None) -> str:
+    """
+    Vrací cestu ke gzip kopii souboru.
+
+    Kopie se vytvoří jednou pro každou verzi souboru (podle sha256)
+    a ukládá se do COMPRESSED_CACHE_DIR.
+    """
+    cache_dir = cache_dir or COMPRESSED_CACHE_DIR
+    target = os.path.join(cache_dir, local_file_hash(path, "sha256") + ".gz")
+    if os.path.exists(target):
+        return target
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        # mtime=0 - stejný vstup dá vždy stejný artefakt
+        with open(path, "rb") as src, gzip.GzipFile(tmp, "wb", compresslevel=9, mtime=0) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    logger.info(f"Vytvořen gzip artefakt {os.path.basename(path)}: {os.path.getsize(path)} -> {os.path.getsize(target)} bytes")
+    return target
+
+
+def detect_file_type(name: str, header: bytes) -> str:
+    """Rozpozná typ souboru podle názvu a prvních bytů."""
+    stem = os.path.splitext(name)[0].lower()
+    if stem == "sx":
+        return TYPE_SX
+    if header[:4] == ELF_MAGIC:
+        return TYPE_SERIALGATEWAY if "serialgateway" in stem else TYPE_OTHER
+    if name.lower().endswith(".gbl") or header[:4] == GBL_HEADER_TAG.to_bytes(4, "little"):
+        return TYPE_GBL
+    if "serialgateway" in stem:
+        return TYPE_SERIALGATEWAY
+    return TYPE_OTHER
+
+
+class CatalogEntry:
+    """Jeden soubor v katalogu (konkrétní verze podle velikosti a mtime)."""
+
+    __slots__ = ("name", "path", "size", "mtime_ns", "type")
+
+    def __init__(self, name: str, path: str, size: int, mtime_ns: int, file_type: str):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.type = file_type
+
+    @classmethod
+    def from_path(cls, name: str, path: str, st: os.stat_result) -> "CatalogEntry":
+        with open(path, "rb") as f:
+            header = f.read(16)
+        return cls(name, path, st.st_size, st.st_mtime_ns, detect_file_type(name, header))
+
+    def sha256(self) -> str:
+        """Vrací sha256 souboru (spočítá se při prvním použití)."""
+        return local_file_hash(self.path, "sha256")
+
+    def to_dict(self, with_hash: bool = False) -> dict:
+        """Převede záznam na dict pro API (sha256 jen pokud je spočítaný nebo vyžádaný)."""
+        return {
+            "name": self.name,
+            "size": self.size,
+            "type": self.type,
+            "sha256": self.sha256() if with_hash else cached_file_hash(self.path, self.size, self.mtime_ns),
+        }
+
+
+class BinaryCatalog:
+    """
+    Cachovaný katalog souborů v adresáři.
+
+    Bezpečné pro použití z více vláken.
+    """
+
+    def __init__(self, path: str = BINARIES_PATH, revalidate: float = CATALOG_REVALIDATE):
+        self.path = path
+        self.revalidate = revalidate
+        self._entries: dict[str, CatalogEntry] = {}
+        self._dir_mtime_ns: Optional[int] = None
+        self._validated_at = 0.0
+        self._lock = threading.Lock()
+        self._scans = 0
+
+    def _refresh(self):
+        """Obnoví katalog, pokud se adresář změnil (volat pod zámkem)."""
+        try:
+            dir_mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            self._entries = {}
+            self._dir_mtime_ns = None
+            return
+        now = time.monotonic()
+        if dir_mtime_ns == self._dir_mtime_ns and now - self._validated_at < self.revalidate:
+            return
+
+        entries = {}
+        try:
+            with os.scandir(self.path) as it:
+                for item in it:
+                    try:
+                        if not item.is_file():
+                            continue
+                        st = item.stat()
+                        entry = self._entries.get(item.name)
+                        if entry is None or entry.size != st.st_size or entry.mtime_ns != st.st_mtime_ns:
+                            entry = CatalogEntry.from_path(item.name, item.path, st)
+                        entries[item.name] = entry
+                    except OSError as e:
+                        logger.warning(f"Soubor {item.name} nelze načíst do katalogu: {e}")
+        except OSError as e:
+            logger.error(f"Chyba při čtení souborů: {e}")
+            return
+        if dir_mtime_ns != self._dir_mtime_ns:
+            self._scans += 1
+        self._entries = entries
+        self._dir_mtime_ns = dir_mtime_ns
+        self._validated_at = now
+
+    def files(self, file_type: Optional[str] = None, suffix: Optional[str] = None) -> list[CatalogEntry]:
+        """Vrací soubory seřazené podle názvu, volitelně jen daného typu / přípony."""
+        with self._lock:
+            self._refresh()
+            entries = list(self._entries.values())
+        if file_type:
+            entries = [e for e in entries if e.type == file_type]
+        if suffix:
+            suffix = suffix.lower()
+            entries = [e for e in entries if e.name.lower().endswith(suffix)]
+        return sorted(entries, key=lambda e: e.name)
+
+    def names(self, file_type: Optional[str] = None, suffix: Optional[str] = None) -> list[str]:
+        """Vrací názvy souborů (viz `files`)."""
+        return [e.name for e in self.files(file_type, suffix)]
+
+    def get(self, name: str) -> CatalogEntry:
+        """
+        Vrací záznam souboru podle názvu.
+
+        Raises:
+            ValueError: Pokud soubor v katalogu není
+        """
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(name)
+        if entry is None:
+            raise ValueError(f"Soubor {name} neexistuje")
+        return entry
+
+    def stats(self) -> dict:
+        """Vrací počet souborů a počet skenování adresáře."""
+        with self._lock:
+            return {"files": len(self._entries), "scans": self._scans}
+
+
+# Sdílený katalog adresáře binaries
+catalog = BinaryCatalog()
@@ -3,6 +3,7 @@ Logika dekódování AUSKEY z Lidl Silvercrest SmartKey Gateway.
 Převzato z lidl_auskey_decode_v0.3.py
 """
 from binascii import unhexlify
+from functools import lru_cache
 import struct
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
@@ -24,6 +25,37 @@ def _decode_kek(a):
     return bytes(kek)
 
 
+def _decode_kek_fast(a):
+    """
+    Dekóduje KEK čistě aritmeticky (bez struct, jedna alokace).
+    
+    Výraz c1 + c2 * -0x5d + '!' je modulo 256 roven (a[0] * b) % 0x5d + '!',
+    výsledek leží v rozsahu 33..125, takže převod na signed char nic nemění.
+    Výstup je shodný s _decode_kek.
+    """
+    if len(a) != 16:
+        raise ValueError(f"KEK incorrect length. Should be 16 was {len(a)}")
+    a0 = a[0]
+    return bytes([(a0 * b) % 0x5d + 0x21 for b in a])
+
+
+@lru_cache(maxsize=1024)
+def _aes_ecb(kek: bytes) -> Cipher:
+    """Vrací (cachovaný) AES ECB cipher pro daný KEK."""
+    return Cipher(algorithms.AES(kek), modes.ECB())
+
+
+def _decrypt_auskey(kek: bytes, encoded_key: bytes) -> dict:
+    """Dešifruje AUSKEY a vrací dict s 'auskey' a 'root_password'."""
+    decryptor = _aes_ecb(kek).decryptor()
+    auskey_bytes = decryptor.update(encoded_key) + decryptor.finalize()
+    auskey = auskey_bytes.decode("ascii")
+    return {
+        "auskey": auskey,
+        "root_password": auskey[-8:]
+    }
+
+
 def _get_bytes(hex_string):
     """
     Parsuje hex string a vrací bytes.
@@ -71,3 +103,18 @@ def decode_auskey(kek_hex: str, auskey_line1: str, auskey_line2: str) -> dict:
         }
     except Exception as e:
         raise ValueError(f"Chyba při dekódování: {str(e)}")
+
+
+def decode_auskey_fast(kek_hex: str, auskey_line1: str, auskey_line2: str) -> dict:
+    """
+    Varianta decode_auskey pro dávkové dekódování.
+    
+    Používá aritmetické odvození KEK a cachovaný cipher, výstup
+    (včetně chybových zpráv) je shodný s decode_auskey.
+    """
+    try:
+        kek = _decode_kek_fast(_get_bytes(kek_hex))
+        encoded_key = _get_bytes(auskey_line1) + _get_bytes(auskey_line2)
+        return _decrypt_auskey(kek, encoded_key)
+    except Exception as e:
+        raise ValueError(f"Chyba při dekódování: {str(e)}")
@@ -0,0 +1,141 @@
+"""
+Dávkové dekódování AUSKEY z CSV nebo JSON.
+
+Vstup (CSV): řádky `kek,auskey_line1,auskey_line2[,id]`, volitelně s hlavičkou.
+Vstup (JSON): seznam objektů s klíči kek, auskey_line1, auskey_line2 (a id).
+
+Použití z příkazové řádky:
+    python -m app.decode_batch dumps.csv
+    python -m app.decode_batch dumps.json --format json -o results.json
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from typing import Iterable, Iterator, Optional
+
+from app.decode import decode_auskey_fast
+
+# Sloupce vstupu v pořadí pro CSV bez hlavičky
+BATCH_COLUMNS = ("kek", "auskey_line1", "auskey_line2", "id")
+
+
+def iter_csv_rows(lines: Iterable[str]) -> Iterator[dict]:
+    """
+    Postupně čte řádky CSV (vhodné i pro streamovaný vstup).
+
+    Hlavička je nepovinná - pokud první řádek obsahuje sloupec `kek`,
+    použije se pro pojmenování sloupců.
+    """
+    columns: Optional[list[str]] = None
+    for values in csv.reader(lines):
+        values = [v.strip() for v in values]
+        if not values or not any(values) or values[0].startswith("#"):
+            continue
+        if columns is None:
+            if "kek" in (v.lower() for v in values):
+                columns = [v.lower() for v in values]
+                continue
+            columns = list(BATCH_COLUMNS)
+        yield dict(zip(columns, values))
+
+
+def iter_json_rows(text: str) -> Iterator[dict]:
+    """Načte řádky ze JSON seznamu objektů."""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Neplatný JSON: {e}")
+    if isinstance(data, dict):
+        data = data.get("rows", [])
+    if not isinstance(data, list):
+        raise ValueError("JSON musí obsahovat seznam řádků")
+    for row in data:
+        yield row if isinstance(row, dict) else {}
+
+
+def decode_rows(rows: Iterable[dict]) -> Iterator[dict]:
+    """
+    Dekóduje řádky a pro každý vrací výsledek nebo chybu.
+
+    Returns:
+        iterátor dict s klíči row, id a buď auskey + root_password, nebo error
+    """
+    for number, row in enumerate(rows, start=1):
+        result = {"row": number, "id": row.get("id")}
+        try:
+            kek = row.get("kek")
+            line1 = row.get("auskey_line1")
+            line2 = row.get("auskey_line2")
+            if not kek or not line1 or not line2:
+                raise ValueError("Chybí kek, auskey_line1 nebo auskey_line2")
+            result.update(decode_auskey_fast(kek, line1, line2))
+        except ValueError as e:
+            result["error"] = str(e)
+        yield result
+
+
+def decode_batch(rows: Iterable[dict]) -> dict:
+    """Dekóduje všechny řádky a vrací výsledky se souhrnem."""
+    started = time.perf_counter()
+    results = list(decode_rows(rows))
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for r in results if "error" in r)
+    return {
+        "rows": len(results),
+        "ok": len(results) - failed,
+        "failed": failed,
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "results": results,
+    }
+
+
+def rows_from_text(text: str) -> Iterator[dict]:
+    """Rozpozná formát (JSON / CSV) a vrací řádky."""
+    if text.lstrip().startswith(("[", "{")):
+        return iter_json_rows(text)
+    return iter_csv_rows(io.StringIO(text))
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Dávkové dekódování AUSKEY z CSV/JSON")
+    parser.add_argument("input", help="Vstupní soubor (CSV nebo JSON), '-' = stdin")
+    parser.add_argument("--format", choices=["csv", "json"], default="csv", help="Výstupní formát")
+    parser.add_argument("-o", "--output", help="Výstupní soubor (výchozí stdout)")
+    args = parser.parse_args(argv)
+
+    if args.input == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            text = f.read()
+
+    try:
+        batch = decode_batch(rows_from_text(text))
+    except ValueError as e:
+        print(f"Chyba: {e}", file=sys.stderr)
+        return 2
+
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump(batch, out, ensure_ascii=False, indent=2)
+            out.write("\n")
+        else:
+            writer = csv.writer(out)
+            writer.writerow(["row", "id", "auskey", "root_password", "error"])
+            for r in batch["results"]:
+                writer.writerow([r["row"], r.get("id") or "", r.get("auskey", ""),
+                                 r.get("root_password", ""), r.get("error", "")])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"Dekódováno {batch['ok']}/{batch['rows']} řádků za {batch['elapsed_ms']} ms", file=sys.stderr)
+    return 0 if batch["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
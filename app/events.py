@@ -0,0 +1,247 @@
+"""
+Rozesílání událostí do prohlížeče přes Server-Sent Events (SSE).
+
+Události se publikují do kanálu (session ID z cookie) z libovolného vlákna,
+typicky z SSH operace běžící v thread poolu. Odběratelé jsou SSE spojení
+prohlížeče, každé má vlastní omezenou frontu.
+"""
+import asyncio
+import codecs
+import json
+import os
+import threading
+import time
+from typing import AsyncIterator, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Velikost fronty událostí jednoho odběratele (při zaplnění se zahodí nejstarší)
+EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", "256"))
+# Interval keepalive komentáře SSE spojení v sekundách
+EVENTS_KEEPALIVE = float(os.environ.get("EVENTS_KEEPALIVE", "15"))
+# Minimální interval mezi událostmi průběhu přenosu v sekundách
+EVENTS_PROGRESS_INTERVAL = float(os.environ.get("EVENTS_PROGRESS_INTERVAL", "0.25"))
+# Nejvíc znaků výstupu příkazu čekajících na odeslání (při překročení se zahodí nejstarší)
+EVENTS_OUTPUT_BUFFER = int(os.environ.get("EVENTS_OUTPUT_BUFFER", "8192"))
+
+
+class _Subscriber:
+    """Fronta jednoho SSE spojení navázaná na jeho event loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.loop = loop
+        self.queue: "asyncio.Queue[tuple[str, dict]]" = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def put(self, item: tuple[str, dict]):
+        """Vloží událost, při plné frontě zahodí nejstarší (volat v event loopu)."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+
+class EventHub:
+    """
+    Rozesílání událostí odběratelům podle kanálu.
+
+    `publish` je bezpečné volat z libovolného vlákna, události se do front
+    odběratelů předávají přes `call_soon_threadsafe`.
+    """
+
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: dict[str, set[_Subscriber]] = {}
+        self._lock = threading.Lock()
+        self._published = 0
+
+    def publish(self, channel: Optional[str], event: str, data: dict):
+        """Odešle událost všem odběratelům kanálu (bez odběratelů se zahodí)."""
+        if not channel:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+            self._published += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.put, (event, data))
+            except RuntimeError:
+                # Event loop už neběží (ukončení aplikace)
+                pass
+
+    async def subscribe(self, channel: str, keepalive: float = EVENTS_KEEPALIVE) -> AsyncIterator[Optional[tuple[str, dict]]]:
+        """
+        Odebírá události kanálu, dokud iterace neskončí.
+
+        Po `keepalive` sekundách bez události vrací None (pro keepalive komentář).
+        """
+        subscriber = _Subscriber(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscriber)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._subscribers[channel]
+            if subscriber.dropped:
+                logger.debug(f"SSE odběratel zahodil {subscriber.dropped} událostí")
+
+    def stats(self) -> dict:
+        """Vrací počet kanálů, odběratelů a publikovaných událostí."""
+        with self._lock:
+            return {
+                "channels": len(self._subscribers),
+                "subscribers": sum(len(s) for s in self._subscribers.values()),
+                "published": self._published,
+            }
+
+
+def format_sse(event: Optional[tuple[str, dict]]) -> str:
+    """Naformátuje událost pro SSE (None = keepalive komentář)."""
+    if event is None:
+        return ": keepalive\n\n"
+    name, data = event
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class TransferProgress:
+    """
+    Callback průběhu přenosu, který publikuje rychlost a odhad zbývajícího času.
+
+    Volá se jako callback sftp přenosu `(název souboru, odesláno, celkem)`,
+    i z více vláken při souběžném nahrávání. Události se pro každý soubor
+    posílají nejvýše jednou za `interval` sekund, začátek a konec vždy.
+    """
+
+    def __init__(self, hub: EventHub, channel: Optional[str], target: str,
+                 interval: float = EVENTS_PROGRESS_INTERVAL):
+        self.hub = hub
+        self.channel = channel
+        self.target = target
+        self.interval = interval
+        self._started: dict[str, float] = {}
+        self._last_sent: dict[str, float] = {}
+
+    def __call__(self, filename: str, sent: int, total: int):
+        now = time.monotonic()
+        if sent == 0 or filename not in self._started:
+            self._started[filename] = now
+        done = sent >= total
+        if not done and sent and now - self._last_sent.get(filename, 0.0) < self.interval:
+            return
+        self._last_sent[filename] = now
+        elapsed = now - self._started[filename]
+        rate = sent / elapsed if elapsed > 0 else 0.0
+        self.hub.publish(self.channel, "progress", {
+            "target": self.target,
+            "file": filename,
+            "sent": sent,
+            "total": total,
+            "percent": round(sent / total * 100, 1) if total else 100.0,
+            "rate_bps": round(rate),
+            "eta_s": round((total - sent) / rate, 1) if rate > 0 else None,
+            "elapsed_s": round(elapsed, 2),
+            "done": done,
+        })
+
+    def for_file(self, filename: str):
+        """Vrací callback `(odesláno, celkem)` pro jeden soubor."""
+        return lambda sent, total: self(filename, sent, total)
+
+
+class CommandOutput:
+    """
+    Příjemce průběžného výstupu příkazu, který ho publikuje jako události `output`.
+
+    Výstup se slučuje a posílá nejvýše jednou za `interval` sekund, aby
+    rychle vypisující příkaz nezahltil SSE spojení. Čekající text je omezen
+    na `max_buffer` znaků; přebytek nejstarších znaků se zahodí a počet
+    se pošle v poli `dropped`. Zápis nikdy neblokuje, takže pomalý prohlížeč
+    nezdrží příkaz na gateway (sx musí stíhat časování XMODEM).
+    """
+
+    def __init__(self, hub: EventHub, channel: Optional[str], target: str,
+                 interval: float = EVENTS_PROGRESS_INTERVAL, max_buffer: int = EVENTS_OUTPUT_BUFFER):
+        self.hub = hub
+        self.channel = channel
+        self.target = target
+        self.interval = interval
+        self.max_buffer = max_buffer
+        # Čekající úseky [proud, text] v pořadí, jak přišly
+        self._pending: list[list[str]] = []
+        self._pending_size = 0
+        self._dropped = 0
+        self._decoders: dict[str, codecs.IncrementalDecoder] = {}
+        self._last_sent = 0.0
+        self._started = False
+        self._lock = threading.Lock()
+
+    def write(self, stream: str, data: bytes):
+        """Přidá blok výstupu (`stream` je "stdout" nebo "stderr")."""
+        decoder = self._decoders.get(stream)
+        if decoder is None:
+            decoder = self._decoders[stream] = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._append(stream, decoder.decode(data))
+        if time.monotonic() - self._last_sent >= self.interval:
+            self.flush()
+
+    def _append(self, stream: str, text: str):
+        if not text:
+            return
+        with self._lock:
+            if self._pending and self._pending[-1][0] == stream:
+                self._pending[-1][1] += text
+            else:
+                self._pending.append([stream, text])
+            self._pending_size += len(text)
+            self._trim()
+
+    def _trim(self):
+        """Zahodí nejstarší čekající text nad `max_buffer` znaků (volat se zámkem)."""
+        excess = self._pending_size - self.max_buffer
+        while excess > 0:
+            stream, text = self._pending[0]
+            if len(text) <= excess:
+                self._pending.pop(0)
+                cut = len(text)
+            else:
+                self._pending[0][1] = text[excess:]
+                cut = excess
+            self._pending_size -= cut
+            self._dropped += cut
+            excess -= cut
+
+    def flush(self, done: bool = False, exit_code: Optional[int] = None):
+        """Publikuje čekající výstup (i prázdný, pokud jde o konec příkazu)."""
+        with self._lock:
+            if not self._pending and not done:
+                return
+            chunks = [(stream, text) for stream, text in self._pending]
+            dropped = self._dropped
+            self._pending = []
+            self._pending_size = 0
+            self._dropped = 0
+            self._last_sent = time.monotonic()
+            # První událost příkazu - prohlížeč smaže výstup předchozího
+            start = not self._started
+            self._started = True
+        data = {"target": self.target, "start": start, "chunks": chunks, "dropped": dropped, "done": done}
+        if done:
+            data["exit_code"] = exit_code
+        self.hub.publish(self.channel, "output", data)
+
+    def close(self, exit_code: Optional[int] = None):
+        """Odešle zbytek výstupu s informací o skončení příkazu."""
+        for stream, decoder in self._decoders.items():
+            # Neúplný znak UTF-8 na konci výstupu
+            self._append(stream, decoder.decode(b"", final=True))
+        self.flush(done=True, exit_code=exit_code)
@@ -0,0 +1,285 @@
+"""
+Fleet režim - provedení SSH operací na mnoha gateway současně.
+
+Každé zařízení dostane vlastní SSHSession, operace se volají přes
+existující metody SSHSession a FirmwareUpgrade.
+"""
+import csv
+import io
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+import logging
+
+from pydantic import ValidationError
+
+from app.metrics import ERRORS
+from app.models import FleetDevice
+from app.ssh_operations import SSHSession, FirmwareUpgrade, get_file_path
+
+logger = logging.getLogger(__name__)
+
+# Horní mez souběžně obsluhovaných zařízení
+FLEET_MAX_CONCURRENCY = int(os.environ.get("FLEET_MAX_CONCURRENCY", "32"))
+
+
+def _upload_serialgateway(session: SSHSession, device: FleetDevice, params: dict) -> dict:
+    filename = params.get("filename")
+    if not filename:
+        raise ValueError("Chybí název souboru serialgateway")
+    return session.sync_file(get_file_path(filename), "/tuya/serialgateway")
+
+
+def _set_static_ip(session: SSHSession, device: FleetDevice, params: dict) -> dict:
+    if not device.static_ip:
+        raise ValueError("Zařízení nemá v inventáři statickou IP")
+    return session.set_static_ip(device.static_ip)
+
+
+# Dostupné operace: název -> funkce (session, zařízení, parametry běhu)
+FLEET_OPERATIONS: dict[str, Callable[[SSHSession, FleetDevice, dict], dict]] = {
+    "disable_monitor": lambda session, device, params: session.disable_ssh_monitor(),
+    "upload_serialgateway": _upload_serialgateway,
+    "update_tuya_start": lambda session, device, params: session.update_tuya_start(),
+    "set_static_ip": _set_static_ip,
+    "stop_serialgateway": lambda session, device, params: FirmwareUpgrade(session).stop_serialgateway(),
+    "restore_serialgateway": lambda session, device, params: FirmwareUpgrade(session).restore_serialgateway(),
+    "reboot": lambda session, device, params: session.reboot(),
+    "reboot_wait": lambda session, device, params: session.reboot_and_reconnect(),
+}
+
+
+def parse_inventory(text: str) -> list[FleetDevice]:
+    """
+    Načte inventář zařízení z CSV nebo JSON.
+
+    CSV: řádky `host,port,password[,static_ip]` (volitelně s hlavičkou),
+    JSON: seznam objektů s klíči host, port, password, static_ip.
+
+    Raises:
+        ValueError: Pokud je inventář prázdný nebo neplatný
+    """
+    text = text.strip()
+    if not text:
+        raise ValueError("Inventář je prázdný")
+
+    if text.startswith("["):
+        try:
+            rows = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Neplatný JSON inventáře: {e}")
+    else:
+        rows = []
+        for values in csv.reader(io.StringIO(text)):
+            values = [v.strip() for v in values]
+            if not values or not values[0] or values[0].startswith("#"):
+                continue
+            if values[0].lower() == "host":
+                continue
+            if len(values) < 3:
+                raise ValueError(f"Neplatný řádek inventáře: {','.join(values)}")
+            rows.append({
+                "host": values[0],
+                "port": values[1] or 22,
+                "password": values[2],
+                "static_ip": values[3] if len(values) > 3 and values[3] else None,
+            })
+
+    devices = []
+    for i, row in enumerate(rows, start=1):
+        try:
+            devices.append(FleetDevice(**row))
+        except (ValidationError, TypeError) as e:
+            raise ValueError(f"Neplatné zařízení č. {i} v inventáři: {e}")
+    if not devices:
+        raise ValueError("Inventář neobsahuje žádné zařízení")
+    return devices
+
+
+class FleetRun:
+    """
+    Jeden běh operací nad skupinou zařízení.
+
+    Zařízení se obsluhují paralelně (nejvýše `concurrency` najednou), na
+    každém se operace provedou v zadaném pořadí a při první chybě se
+    zbytek pro dané zařízení přeskočí. Průběh se vrací jako proud událostí.
+
+    Běh má vlastní SSH session mimo registr session a úlohy. Zrušení
+    (cancel nebo zavření generátoru run) je kooperativní - zařízení ve
+    frontě už nezačnou a rozběhnutá skončí po aktuální operaci.
+    """
+
+    def __init__(
+        self,
+        devices: list[FleetDevice],
+        operations: list[str],
+        concurrency: int = 8,
+        params: Optional[dict] = None,
+        connect_timeout: int = 30
+    ):
+        unknown = [op for op in operations if op not in FLEET_OPERATIONS]
+        if unknown:
+            raise ValueError(f"Neznámé operace: {', '.join(unknown)}")
+        if not operations:
+            raise ValueError("Není vybrána žádná operace")
+        self.devices = devices
+        self.operations = operations
+        self.concurrency = max(1, min(concurrency, FLEET_MAX_CONCURRENCY, len(devices)))
+        self.params = params or {}
+        self.connect_timeout = connect_timeout
+        self._events: "queue.Queue[dict]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._failures_by_operation: dict[str, int] = {}
+        self._cancel_event = threading.Event()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def cancel(self):
+        """Požádá o zrušení běhu (projeví se před další operací na každém zařízení)."""
+        if not self._cancel_event.is_set():
+            self._cancel_event.set()
+            logger.info("Fleet: požadavek na zrušení běhu")
+        # Vlákna skončí po dokončení rozběhnutých zařízení, na ně se nečeká
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+    def _run_device(self, index: int, device: FleetDevice) -> dict:
+        """Připojí se k zařízení a provede na něm všechny operace."""
+        started = time.monotonic()
+        session = SSHSession()
+        steps = []
+        failed_operation = None
+        error = None
+        cancelled = False
+        if self._cancel_event.is_set():
+            return self._device_result(index, device, "cancelled", None, "Běh byl zrušen", steps, started)
+        self._events.put({"event": "device_started", "index": index, "host": device.host, "port": device.port})
+        try:
+            for operation in ["connect"] + self.operations:
+                if self._cancel_event.is_set():
+                    cancelled = True
+                    break
+                step_started = time.monotonic()
+                try:
+                    if operation == "connect":
+                        session.connect(device.host, device.port, device.password, timeout=self.connect_timeout)
+                        result = {"status": "connected"}
+                    else:
+                        result = FLEET_OPERATIONS[operation](session, device, self.params)
+                except Exception as e:
+                    failed_operation = operation
+                    error = str(e)
+                    steps.append({
+                        "operation": operation,
+                        "status": "error",
+                        "message": error,
+                        "duration_ms": round((time.monotonic() - step_started) * 1000, 1),
+                    })
+                    self._events.put({"event": "step", "index": index, "host": device.host, "port": device.port, **steps[-1]})
+                    break
+                steps.append({
+                    "operation": operation,
+                    "status": result.get("status", "success"),
+                    "message": result.get("message", ""),
+                    "duration_ms": round((time.monotonic() - step_started) * 1000, 1),
+                })
+                self._events.put({"event": "step", "index": index, "host": device.host, "port": device.port, **steps[-1]})
+        finally:
+            session.disconnect()
+
+        if failed_operation:
+            with self._lock:
+                self._failures_by_operation[failed_operation] = self._failures_by_operation.get(failed_operation, 0) + 1
+            ERRORS.inc(f"fleet:{failed_operation}")
+            logger.warning(f"Fleet: {device.host}:{device.port} selhalo v kroku {failed_operation}: {error}")
+        if failed_operation:
+            status = "error"
+        elif cancelled:
+            status, error = "cancelled", "Běh byl zrušen"
+        else:
+            status = "success"
+        return self._device_result(index, device, status, failed_operation, error, steps, started)
+
+    @staticmethod
+    def _device_result(
+        index: int, device: FleetDevice, status: str, failed_operation: Optional[str],
+        error: Optional[str], steps: list, started: float
+    ) -> dict:
+        return {
+            "event": "device_done",
+            "index": index,
+            "host": device.host,
+            "port": device.port,
+            "status": status,
+            "failed_operation": failed_operation,
+            "error": error,
+            "steps": steps,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+
+    def _worker(self, index: int, device: FleetDevice):
+        try:
+            result = self._run_device(index, device)
+        except Exception as e:
+            # Neočekávaná chyba mimo operace - zařízení se počítá jako selhané
+            result = {
+                "event": "device_done", "index": index, "host": device.host, "port": device.port,
+                "status": "error", "failed_operation": None, "error": str(e),
+                "steps": [], "duration_ms": 0.0,
+            }
+        self._events.put(result)
+
+    def run(self) -> Iterator[dict]:
+        """
+        Spustí běh a postupně vrací události.
+
+        Události: device_started, step, device_done (výsledek zařízení)
+        a nakonec summary se souhrnem běhu. Zavření generátoru před
+        koncem (např. odpojený klient) běh zruší, na rozběhnuté operace
+        se přitom nečeká.
+        """
+        started = time.monotonic()
+        logger.info(f"Fleet: {len(self.devices)} zařízení, operace {', '.join(self.operations)}, souběžnost {self.concurrency}")
+        succeeded = 0
+        cancelled = 0
+        failed = []
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="fleet")
+        remaining = len(self.devices)
+        try:
+            for index, device in enumerate(self.devices):
+                self._pool.submit(self._worker, index, device)
+            while remaining:
+                event = self._events.get()
+                if event["event"] == "device_done":
+                    remaining -= 1
+                    if event["status"] == "success":
+                        succeeded += 1
+                    elif event["status"] == "cancelled":
+                        cancelled += 1
+                    else:
+                        failed.append(f"{event['host']}:{event['port']}")
+                yield event
+        finally:
+            if remaining:
+                self.cancel()
+            else:
+                self._pool.shutdown()
+
+        elapsed = time.monotonic() - started
+        summary = {
+            "event": "summary",
+            "devices": len(self.devices),
+            "succeeded": succeeded,
+            "failed": len(failed),
+            "failed_hosts": failed,
+            "cancelled": cancelled,
+            "failures_by_operation": self._failures_by_operation,
+            "concurrency": self.concurrency,
+            "elapsed_s": round(elapsed, 2),
+            "devices_per_minute": round(len(self.devices) / elapsed * 60, 2) if elapsed else None,
+        }
+        logger.info(f"Fleet dokončen: {succeeded}/{len(self.devices)} úspěšně za {elapsed:.1f} s")
+        yield summary
@@ -0,0 +1,288 @@
+"""
+Parser a kontrola firmware obrazů GBL (Gecko bootloader, Silicon Labs).
+
+GBL je posloupnost tagů (id a délka po 4 bytech little-endian, za nimi
+data): hlavička, informace o aplikaci, metadata, data programu a koncový
+tag s CRC32 celého souboru. Obraz se prochází přes mmap bez načtení do
+paměti. Zkrácený, poškozený nebo jiný soubor se tak odmítne dřív, než se
+zastaví serialgateway a cokoli se pošle na gateway. Výsledky se cachují
+podle sha256 souboru.
+"""
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from typing import Optional
+import logging
+
+from app.catalog import GBL_HEADER_TAG, catalog, local_file_hash
+
+logger = logging.getLogger(__name__)
+
+# Tagy GBL (UG266)
+GBL_TAG_HEADER = GBL_HEADER_TAG
+GBL_TAG_APPLICATION = 0xF40A0AF4
+GBL_TAG_BOOTLOADER = 0xF50909F5
+GBL_TAG_SE_UPGRADE = 0x5EA617EB
+GBL_TAG_METADATA = 0xF60808F6
+GBL_TAG_PROG = 0xFE0101FE
+GBL_TAG_ERASEPROG = 0xFD0303FD
+GBL_TAG_PROG_LZ4 = 0xFD0505FD
+GBL_TAG_PROG_LZMA = 0xFD0707FD
+GBL_TAG_CERTIFICATE = 0xF30B0BF3
+GBL_TAG_SIGNATURE = 0xF70A0AF7
+GBL_TAG_ENC_HEADER = 0xFA0606FA
+GBL_TAG_ENC_INIT = 0xFB0505FB
+GBL_TAG_ENC_DATA = 0xF90707F9
+GBL_TAG_END = 0xFC0404FC
+
+TAG_NAMES = {
+    GBL_TAG_HEADER: "header",
+    GBL_TAG_APPLICATION: "application",
+    GBL_TAG_BOOTLOADER: "bootloader",
+    GBL_TAG_SE_UPGRADE: "se_upgrade",
+    GBL_TAG_METADATA: "metadata",
+    GBL_TAG_PROG: "prog",
+    GBL_TAG_ERASEPROG: "eraseprog",
+    GBL_TAG_PROG_LZ4: "prog_lz4",
+    GBL_TAG_PROG_LZMA: "prog_lzma",
+    GBL_TAG_CERTIFICATE: "certificate",
+    GBL_TAG_SIGNATURE: "signature",
+    GBL_TAG_ENC_HEADER: "enc_header",
+    GBL_TAG_ENC_INIT: "enc_init",
+    GBL_TAG_ENC_DATA: "enc_data",
+    GBL_TAG_END: "end",
+}
+
+# Tagy s daty programu (u prog a eraseprog začínají adresou ve flash)
+PROGRAM_TAGS = (GBL_TAG_PROG, GBL_TAG_ERASEPROG, GBL_TAG_PROG_LZ4, GBL_TAG_PROG_LZMA, GBL_TAG_ENC_DATA)
+ADDRESSED_TAGS = (GBL_TAG_PROG, GBL_TAG_ERASEPROG)
+
+# Podporovaná hlavní verze formátu (hlavička verze 3.x)
+GBL_MAJOR_VERSION = 3
+
+# Příznaky typu obrazu v hlavičce
+GBL_TYPE_ENCRYPTED = 0x01
+GBL_TYPE_SIGNED = 0x100
+
+# Typ aplikace v tagu application (bitová maska)
+APPLICATION_TYPES = {
+    1 << 0: "zigbee",
+    1 << 1: "thread",
+    1 << 2: "flex",
+    1 << 3: "bluetooth",
+    1 << 4: "mcu",
+    1 << 5: "bluetooth_app",
+    1 << 6: "bootloader",
+    1 << 7: "zwave",
+}
+
+# Nejvýše tolik bytů metadat se zkouší číst jako JSON
+GBL_METADATA_MAX = 64 * 1024
+
+# Počet obrazů, jejichž výsledek se drží v cache (klíčem je sha256)
+GBL_CACHE_ENTRIES = 64
+
+# Verze stacku v názvu souboru: "..._7.4.gbl" nebo "..._678_..." (EmberZNet 6.7.8)
+_DOTTED_VERSION = re.compile(r"(?:^|[_-])(\d+(?:\.\d+)+)(?=[_.-]|$)")
+_PACKED_VERSION = re.compile(r"_(\d)(\d)(\d)_")
+
+_cache: dict[str, dict] = {}
+_cache_lock = threading.Lock()
+
+
+def _dotted(version: int) -> str:
+    """Verze uložená po bytech (major v nejvyšším bytu) jako text."""
+    return ".".join(str((version >> shift) & 0xFF) for shift in (24, 16, 8, 0))
+
+
+def _metadata(body) -> Optional[object]:
+    """Metadata obrazu: JSON (např. ezsp_version, sdk_version), jinak text nebo None."""
+    if len(body) > GBL_METADATA_MAX:
+        return None
+    raw = bytes(body).rstrip(b"\x00")
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text if text.isprintable() else None
+
+
+def parse_gbl(data) -> dict:
+    """
+    Projde tagy GBL obrazu (bytes nebo mmap) a vrací jeho popis.
+
+    Chyby obrazu se nevyhazují: výsledek má `valid` a seznamy `errors`
+    (obraz nelze použít) a `warnings` (obraz je použitelný, ale neobvyklý).
+    """
+    size = len(data)
+    errors: list[str] = []
+    warnings: list[str] = []
+    tags: dict[str, int] = {}
+    header = application = metadata = crc = None
+    program = {"tags": 0, "bytes": 0, "start": None, "end": None}
+    end = None
+    offset = 0
+    with memoryview(data) as view:
+        while offset < size:
+            if size - offset < 8:
+                errors.append(f"Zkrácený tag na pozici {offset} - soubor je zkrácený")
+                break
+            tag, length = struct.unpack_from("<II", view, offset)
+            name = TAG_NAMES.get(tag, f"0x{tag:08X}")
+            if offset == 0 and tag != GBL_TAG_HEADER:
+                errors.append("Soubor není GBL obraz (chybí hlavička)")
+                break
+            start = offset + 8
+            if start + length > size:
+                errors.append(f"Tag {name} na pozici {offset} přesahuje konec souboru - soubor je zkrácený")
+                break
+            tags[name] = tags.get(name, 0) + 1
+            if tag == GBL_TAG_HEADER and length >= 8:
+                version, image_type = struct.unpack_from("<II", view, start)
+                header = {
+                    "version": f"{version >> 24}.{(version >> 16) & 0xFF}",
+                    "major": version >> 24,
+                    "type": image_type,
+                    "encrypted": bool(image_type & GBL_TYPE_ENCRYPTED),
+                    "signed": bool(image_type & GBL_TYPE_SIGNED),
+                }
+            elif tag == GBL_TAG_APPLICATION and length >= 12:
+                app_type, version, capabilities = struct.unpack_from("<III", view, start)
+                application = {
+                    "type": app_type,
+                    "types": [label for bit, label in APPLICATION_TYPES.items() if app_type & bit],
+                    "version": version,
+                    "version_text": _dotted(version),
+                    "capabilities": capabilities,
+                    "product_id": bytes(view[start + 12:start + min(length, 28)]).hex() or None,
+                }
+            elif tag == GBL_TAG_METADATA:
+                metadata = _metadata(view[start:start + length])
+            elif tag in PROGRAM_TAGS:
+                program["tags"] += 1
+                if tag in ADDRESSED_TAGS and length >= 4:
+                    address = struct.unpack_from("<I", view, start)[0]
+                    program["bytes"] += length - 4
+                    program["start"] = address if program["start"] is None else min(program["start"], address)
+                    program["end"] = max(program["end"] or 0, address + length - 4)
+                else:
+                    program["bytes"] += length
+            elif tag == GBL_TAG_END:
+                if length < 4:
+                    errors.append("Koncový tag neobsahuje CRC")
+                    break
+                stored = struct.unpack_from("<I", view, start)[0]
+                # CRC32 od začátku souboru po pole s CRC (včetně hlavičky koncového tagu)
+                computed = zlib.crc32(view[:start])
+                crc = {"stored": f"{stored:08x}", "computed": f"{computed:08x}", "ok": stored == computed}
+                if stored != computed:
+                    errors.append("CRC32 obrazu nesouhlasí - soubor je poškozený")
+                end = start + length
+                break
+            offset = start + length
+
+    if not errors and end is None:
+        errors.append("Chybí koncový tag - soubor je zkrácený")
+    if end is not None and end < size:
+        warnings.append(f"Za koncovým tagem je {size - end} B navíc")
+    if header is not None and header["major"] != GBL_MAJOR_VERSION:
+        errors.append(f"Nepodporovaná verze formátu GBL {header['version']}")
+    if end is not None and not program["tags"]:
+        errors.append("Obraz neobsahuje data programu")
+    if end is not None:
+        if application is None:
+            warnings.append("Obraz neobsahuje informace o aplikaci")
+        elif "zigbee" not in application["types"]:
+            warnings.append("Obraz není označený jako Zigbee aplikace")
+        if header and header["encrypted"]:
+            warnings.append("Obraz je šifrovaný - bootloader modulu musí znát klíč")
+
+    hints = {}
+    if isinstance(metadata, dict):
+        for key in ("ezsp_version", "sdk_version", "fw_type", "baudrate"):
+            if metadata.get(key) is not None:
+                hints[key] = metadata[key]
+    if application is not None:
+        hints["application_version"] = application["version_text"]
+    return {
+        "valid": not errors,
+        "size": size,
+        "errors": errors,
+        "warnings": warnings,
+        "tags": tags,
+        "header": header,
+        "application": application,
+        "metadata": metadata,
+        "program": program,
+        "crc": crc,
+        "hints": hints,
+    }
+
+
+def name_hints(filename: str) -> dict:
+    """Verze stacku odvozená z názvu souboru (např. NCP_UHW_..._678_... -> 6.7.8)."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    match = _DOTTED_VERSION.search(stem)
+    if match:
+        return {"name_version": match.group(1)}
+    match = _PACKED_VERSION.search(stem + "_")
+    if match:
+        return {"name_version": ".".join(match.groups())}
+    return {}
+
+
+def inspect_gbl(path: str) -> dict:
+    """Vrací popis GBL souboru (viz parse_gbl), pro každou verzi souboru se počítá jednou."""
+    sha256 = local_file_hash(path, "sha256")
+    with _cache_lock:
+        cached = _cache.get(sha256)
+    if cached is not None:
+        return dict(cached)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            result = parse_gbl(b"")
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                result = parse_gbl(mapped)
+    result["sha256"] = sha256
+    with _cache_lock:
+        if len(_cache) >= GBL_CACHE_ENTRIES:
+            del _cache[next(iter(_cache))]
+        _cache[sha256] = result
+    if not result["valid"]:
+        logger.warning(f"Neplatný GBL obraz {os.path.basename(path)}: {'; '.join(result['errors'])}")
+    return dict(result)
+
+
+def inspect_firmware(filename: str) -> dict:
+    """
+    Popis firmware souboru z katalogu včetně nápověd z názvu souboru.
+
+    Raises:
+        ValueError: Pokud soubor v katalogu není
+    """
+    entry = catalog.get(filename)
+    result = inspect_gbl(entry.path)
+    result["name"] = entry.name
+    result["hints"] = {**name_hints(entry.name), **result["hints"]}
+    return result
+
+
+def check_firmware(filename: str) -> dict:
+    """
+    Kontrola firmware před upgrade (bez SSH): vrací popis platného obrazu.
+
+    Raises:
+        ValueError: Soubor neexistuje nebo není platný GBL obraz
+    """
+    result = inspect_firmware(filename)
+    if not result["valid"]:
+        raise ValueError(f"Firmware {filename} nelze použít: {'; '.join(result['errors'])}")
+    return result
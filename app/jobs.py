@@ -0,0 +1,432 @@
+"""
+Úlohy na pozadí pro dlouhé SSH operace (upgrade, nahrávání, reboot).
+
+Úloha se skládá z pojmenovaných kroků, které běží postupně v thread poolu
+SSH operací (serializovaně s ostatními operacemi nad stejnou session).
+Stav, časy a log úlohy lze číst kdykoli, změny se publikují jako SSE
+události `job` a `job_log` do kanálu vlastníka (session ID z cookie).
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+from app.events import CommandOutput, EventHub, TransferProgress
+from app.metrics import ERRORS, JOB_SECONDS, JOBS_FINISHED
+from app.ssh_executor import SSHExecutor
+from app.ssh_operations import OperationCancelled, SSHSession, FirmwareUpgrade, get_file_path
+
+logger = logging.getLogger(__name__)
+
+# Doba v sekundách, po kterou se dokončená úloha uchovává
+JOBS_RETENTION = int(os.environ.get("JOBS_RETENTION", "3600"))
+# Maximální počet uchovávaných úloh (nejstarší dokončené se zahodí)
+JOBS_MAX = int(os.environ.get("JOBS_MAX", "200"))
+# Maximální počet řádků logu jedné úlohy
+JOB_LOG_LINES = 500
+
+# Úloha, jejíž krok právě běží (vlákna spuštěná z kroku ji dědí přes kopii kontextu)
+_current_job: contextvars.ContextVar[Optional["Job"]] = contextvars.ContextVar("current_job", default=None)
+
+# Stavy úlohy a kroku
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+PENDING = "pending"
+SKIPPED = "skipped"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(OperationCancelled):
+    """Úloha byla zrušena uživatelem."""
+
+
+class Job:
+    """Jedna úloha se stavem, kroky a logem."""
+
+    def __init__(self, kind: str, owner: str, step_names: list[str], params: Optional[dict] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.params = params or {}
+        self.state = QUEUED
+        self.steps = [
+            {"name": name, "state": PENDING, "started_at": None, "finished_at": None, "message": ""}
+            for name in step_names
+        ]
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.log: list[str] = []
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.state not in FINISHED_STATES
+
+    def add_log(self, line: str):
+        with self._lock:
+            self.log.append(line)
+            if len(self.log) > JOB_LOG_LINES:
+                del self.log[:len(self.log) - JOB_LOG_LINES]
+
+    def to_dict(self, with_log: bool = True) -> dict:
+        """Snapshot úlohy pro API."""
+        with self._lock:
+            data = {
+                "id": self.id,
+                "kind": self.kind,
+                "state": self.state,
+                "params": self.params,
+                "steps": [dict(step) for step in self.steps],
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "duration_s": round((self.finished_at or time.time()) - self.started_at, 2) if self.started_at else None,
+                "cancel_requested": self.cancel_event.is_set(),
+                "result": self.result,
+                "error": self.error,
+            }
+            if with_log:
+                data["log"] = list(self.log)
+            return data
+
+
+class JobContext:
+    """Kontext předávaný krokům úlohy (log, zrušení, průběh přenosu)."""
+
+    def __init__(self, job: Job, hub: Optional[EventHub]):
+        self.job = job
+        self.hub = hub
+
+    def log(self, message: str):
+        """Zapíše řádek do logu úlohy (přes logging, zachytí ho handler úloh)."""
+        logger.info(message)
+
+    def check_cancelled(self):
+        """Vyhodí JobCancelled, pokud bylo požádáno o zrušení."""
+        if self.job.cancel_event.is_set():
+            raise JobCancelled("Úloha byla zrušena")
+
+    def cancellable(self, callback: Optional[Callable] = None) -> Callable:
+        """Obalí callback průběhu kontrolou zrušení (rozběhnutý přenos přeruší výjimkou JobCancelled)."""
+        def wrapped(*args):
+            self.check_cancelled()
+            if callback is not None:
+                callback(*args)
+        return wrapped
+
+    def progress(self, target: str) -> Optional[TransferProgress]:
+        """Callback průběhu přenosu publikovaný do kanálu vlastníka úlohy."""
+        if self.hub is None:
+            return None
+        return TransferProgress(self.hub, self.job.owner, target)
+
+    def output(self, target: str) -> Optional[CommandOutput]:
+        """Příjemce průběžného výstupu příkazu publikovaný do kanálu vlastníka úlohy."""
+        if self.hub is None:
+            return None
+        return CommandOutput(self.hub, self.job.owner, target)
+
+
+# Krok úlohy: (název, funkce(kontext) -> dict s výsledkem nebo None)
+JobStep = tuple[str, Callable[[JobContext], Optional[dict]]]
+
+
+class _JobLogHandler(logging.Handler):
+    """
+    Přeposílá log záznamy běžící úlohy do logu úlohy.
+
+    Úloha se určí z kontextu, takže se zachytí i záznamy z vláken, která
+    krok spustí s kopií kontextu (např. souběžné nahrávání souborů).
+    """
+
+    def __init__(self, manager: "JobManager"):
+        super().__init__(level=logging.INFO)
+        self.manager = manager
+        self.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s", "%H:%M:%S"))
+
+    def emit(self, record: logging.LogRecord):
+        job = _current_job.get()
+        if job is None or self.manager._jobs.get(job.id) is not job:
+            return
+        try:
+            line = self.format(record)
+        except Exception:
+            return
+        job.add_log(line)
+        self.manager._publish(job, "job_log", {"id": job.id, "line": line})
+
+
+class JobManager:
+    """
+    Správa úloh na pozadí.
+
+    Úlohy běží přes SSHExecutor, takže se nepromíchají s ostatními
+    operacemi nad stejnou session a HTTP requesty na ně nečekají.
+    Zrušení je kooperativní - projeví se před dalším krokem, nahrávání
+    souborů se přeruší u nejbližšího bloku (flash Zigbee modulu se nepřerušuje).
+    """
+
+    def __init__(
+        self,
+        executor: SSHExecutor,
+        hub: Optional[EventHub] = None,
+        retention: int = JOBS_RETENTION,
+        max_jobs: int = JOBS_MAX
+    ):
+        self.executor = executor
+        self.hub = hub
+        self.retention = retention
+        self.max_jobs = max_jobs
+        self._jobs: dict[str, Job] = {}
+        self._tasks: set = set()
+        self._lock = threading.Lock()
+        self._log_handler = _JobLogHandler(self)
+        logging.getLogger("app").addHandler(self._log_handler)
+
+    def _publish(self, job: Job, event: str, data: dict):
+        if self.hub is not None:
+            self.hub.publish(job.owner, event, data)
+
+    def _changed(self, job: Job):
+        self._publish(job, "job", job.to_dict(with_log=False))
+
+    def submit(
+        self,
+        owner: str,
+        kind: str,
+        session: Any,
+        steps: list[JobStep],
+        params: Optional[dict] = None,
+        on_finish: Optional[Callable[[Job], None]] = None
+    ) -> Job:
+        """
+        Založí úlohu a naplánuje její běh (volat z event loopu).
+
+        Args:
+            owner: Vlastník úlohy (session ID z cookie)
+            kind: Typ úlohy (upgrade, upload_files, ...)
+            session: Session, nad kterou se kroky serializují
+            steps: Kroky úlohy v pořadí provedení
+            on_finish: Volitelná funkce volaná po skončení úlohy (v event loopu)
+        """
+        self.expire()
+        job = Job(kind, owner, [name for name, _ in steps], params)
+        with self._lock:
+            self._jobs[job.id] = job
+        logger.info(f"Úloha {job.id} ({kind}) založena")
+        self._changed(job)
+
+        async def run():
+            try:
+                await self.executor.run(session, self._execute, job, steps)
+            except Exception as e:
+                logger.error(f"Úloha {job.id} skončila neočekávanou chybou: {e}")
+                if job.active:
+                    self._finish(job, FAILED, 0, error=str(e))
+            finally:
+                if on_finish is not None:
+                    try:
+                        on_finish(job)
+                    except Exception as e:
+                        logger.error(f"Chyba po dokončení úlohy {job.id}: {e}")
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def _set_step(self, job: Job, index: int, **fields):
+        with job._lock:
+            job.steps[index].update(fields)
+
+    def _execute(self, job: Job, steps: list[JobStep]):
+        """Provede kroky úlohy (běží ve vlákně SSH executoru)."""
+        token = _current_job.set(job)
+        context = JobContext(job, self.hub)
+        try:
+            with job._lock:
+                job.state = RUNNING
+                job.started_at = time.time()
+            self._changed(job)
+            for index, (name, fn) in enumerate(steps):
+                try:
+                    context.check_cancelled()
+                except JobCancelled:
+                    self._finish(job, CANCELLED, index, error="Úloha byla zrušena")
+                    return
+                self._set_step(job, index, state=RUNNING, started_at=time.time())
+                self._changed(job)
+                logger.info(f"Krok: {name}")
+                try:
+                    result = fn(context)
+                except JobCancelled as e:
+                    self._set_step(job, index, state=CANCELLED, finished_at=time.time(), message=str(e))
+                    self._finish(job, CANCELLED, index + 1, error=str(e))
+                    return
+                except Exception as e:
+                    logger.error(f"Krok {name} selhal: {e}")
+                    self._set_step(job, index, state=FAILED, finished_at=time.time(), message=str(e))
+                    self._finish(job, FAILED, index + 1, error=str(e))
+                    return
+                message = result.get("message", "") if isinstance(result, dict) else ""
+                self._set_step(job, index, state=SUCCEEDED, finished_at=time.time(), message=message)
+                with job._lock:
+                    job.result = result if isinstance(result, dict) else job.result
+                self._changed(job)
+            self._finish(job, SUCCEEDED, len(steps))
+        finally:
+            _current_job.reset(token)
+
+    def _finish(self, job: Job, state: str, skip_from: int, error: Optional[str] = None):
+        """Nastaví konečný stav úlohy, zbylé kroky označí jako přeskočené."""
+        with job._lock:
+            for step in job.steps[skip_from:]:
+                if step["state"] == PENDING:
+                    step["state"] = SKIPPED
+            job.state = state
+            job.error = error
+            job.finished_at = time.time()
+        JOBS_FINISHED.inc(job.kind, state)
+        if job.started_at is not None:
+            JOB_SECONDS.observe(job.finished_at - job.started_at, job.kind)
+        if state == FAILED:
+            ERRORS.inc(f"job:{job.kind}")
+        logger.info(f"Úloha {job.id} ({job.kind}) skončila: {state}")
+        self._changed(job)
+
+    def get(self, owner: Optional[str], job_id: str) -> Optional[Job]:
+        """Vrací úlohu vlastníka, jinak None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+    def list_jobs(self, owner: Optional[str], kind: Optional[str] = None) -> list[Job]:
+        """Vrací úlohy vlastníka od nejnovější."""
+        self.expire()
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if j.owner == owner and (kind is None or j.kind == kind)]
+        return sorted(jobs, key=lambda j: j.created_at, reverse=True)
+
+    def cancel(self, owner: Optional[str], job_id: str) -> Optional[Job]:
+        """Požádá o zrušení úlohy (projeví se před dalším krokem nebo u dalšího bloku nahrávání)."""
+        job = self.get(owner, job_id)
+        if job is None:
+            return None
+        if job.active and not job.cancel_event.is_set():
+            job.cancel_event.set()
+            logger.info(f"Úloha {job.id} ({job.kind}): požadavek na zrušení")
+            self._changed(job)
+        return job
+
+    def expire(self) -> int:
+        """Zahodí dokončené úlohy starší než retence a nad kapacitu."""
+        now = time.time()
+        with self._lock:
+            finished = sorted(
+                (j for j in self._jobs.values() if not j.active),
+                key=lambda j: j.finished_at or 0
+            )
+            overflow = len(self._jobs) - self.max_jobs
+            removed = 0
+            for job in finished:
+                if now - (job.finished_at or now) >= self.retention or overflow > 0:
+                    del self._jobs[job.id]
+                    overflow -= 1
+                    removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        """Vrací počty úloh podle stavu."""
+        with self._lock:
+            states: dict[str, int] = {}
+            for job in self._jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {"jobs": len(self._jobs), "states": states, "retention": self.retention}
+
+    def close(self):
+        """Odpojí log handler (při ukončení aplikace)."""
+        logging.getLogger("app").removeHandler(self._log_handler)
+
+
+# Definice úloh: funkce vracejí seznam kroků
+
+def upgrade_steps(session: SSHSession, ezsp_version: str, restore: bool = True,
+                  engine: Optional[str] = None, firmware_filename: Optional[str] = None) -> list[JobStep]:
+    """
+    Kroky upgrade firmware: flash Zigbee modulu, restart s čekáním na návrat
+    zařízení a (volitelně) obnovení serialgateway.
+    """
+    upgrade = FirmwareUpgrade(session)
+
+    def flash(ctx: JobContext) -> dict:
+        return upgrade.flash_firmware(
+            ezsp_version, ctx.output("flash"), engine, firmware_filename, ctx.progress("flash")
+        )
+
+    steps: list[JobStep] = [
+        ("Nahrání firmware do Zigbee modulu", flash),
+        ("Restart a znovupřipojení", lambda ctx: session.reboot_and_reconnect()),
+    ]
+    if restore:
+        steps.append(("Obnovení serialgateway", lambda ctx: upgrade.restore_serialgateway()))
+    return steps
+
+
+def upload_files_steps(session: SSHSession, firmware_filename: str, transfer: Optional[str] = None) -> list[JobStep]:
+    """Kroky nahrání upgrade souborů (sx.bin a firmware .gbl)."""
+    upgrade = FirmwareUpgrade(session)
+    return [
+        ("Nahrání sx.bin a firmware", lambda ctx: upgrade.upload_upgrade_files(
+            firmware_filename, ctx.cancellable(ctx.progress("firmware")), transfer
+        )),
+    ]
+
+
+def upload_serialgateway_steps(session: SSHSession, filename: str, transfer: Optional[str] = None) -> list[JobStep]:
+    """Kroky nahrání serialgateway."""
+    local_path = get_file_path(filename)
+
+    def upload(ctx: JobContext) -> dict:
+        progress = ctx.progress("serialgateway")
+        # Atomicky, zrušení uprostřed přenosu nechá na zařízení původní serialgateway
+        result = session.sync_file(
+            local_path, "/tuya/serialgateway",
+            callback=ctx.cancellable(progress.for_file(filename) if progress else None),
+            transfer=transfer, atomic=True
+        )
+        return {**result, "message": f"{filename} nahrán" if result["transferred"] else f"{filename} je na zařízení shodný"}
+
+    return [("Nahrání serialgateway", upload)]
+
+
+def reboot_steps(session: SSHSession) -> list[JobStep]:
+    """Kroky restartu zařízení s čekáním na jeho návrat."""
+    return [("Restart a znovupřipojení", lambda ctx: session.reboot_and_reconnect())]
+
+
+# Typy úloh: název -> funkce (session, parametry úlohy) vracející kroky
+JOB_KINDS: dict[str, Callable[[SSHSession, dict], list[JobStep]]] = {
+    "upgrade": lambda session, params: upgrade_steps(
+        session, params["ezsp_version"], params["restore"], params.get("engine"), params.get("firmware_filename")
+    ),
+    "upload_files": lambda session, params: upload_files_steps(
+        session, params["firmware_filename"], params.get("transfer")
+    ),
+    "upload_serialgateway": lambda session, params: upload_serialgateway_steps(
+        session, params["filename"], params.get("transfer")
+    ),
+    "reboot": lambda session, params: reboot_steps(session),
+}
@@ -2,23 +2,34 @@
 FastAPI aplikace pro Lidl Gateway Hack.
 """
 from fastapi import FastAPI, Request, HTTPException, Depends, Form
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from starlette.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
+import asyncio
+import json
 import os
 import logging
 import uuid
-from typing import Dict
 
 from app.decode import decode_auskey
+from app.decode_batch import decode_batch, rows_from_text
 from app.models import (
     DecodeRequest, DecodeResponse,
     SSHConnectRequest, SSHStatusResponse, SSHOperationResponse,
     UploadSerialgatewayRequest, SetStaticIPRequest, FileListResponse,
     FirmwareUpgradeRequest
 )
-from app.ssh_operations import SSHSession, FirmwareUpgrade, get_available_files, get_file_path
+from app.ssh_operations import FLASH_ENGINE, FLASH_ENGINES, get_file_path
+from app.catalog import APP_ROOT, catalog
+from app.gbl import check_firmware, inspect_firmware
+from app.assets import PageCache, StaticAssets
+from app.ssh_service import SSHService, register_gauges
+from app.broker import SSH_BROKER_SOCKET, BrokerClient
+from app.fleet import FleetRun, parse_inventory
+from app.events import format_sse
+from app.metrics import (
+    REGISTRY, CONTENT_TYPE, DECODE_SECONDS, ERRORS, MetricsMiddleware, label_exposition, merge_expositions
+)
 
 # Konfigurace logování
 logging.basicConfig(
@@ -38,35 +49,62 @@ app.add_middleware(
     same_site="lax",
 )
 
-# Templates
-templates = Jinja2Templates(directory="/app/templates")
+# Metriky HTTP requestů (doba podle šablony routy)
+app.add_middleware(MetricsMiddleware)
+
+# Static files (otisky v názvech, předkomprimované varianty, ETag)
+static_assets = StaticAssets(os.path.join(APP_ROOT, "static"))
+app.mount("/static", static_assets, name="static")
+
+# Templates (`static_url('css/app.css')` vrací adresu s otiskem)
+templates = Jinja2Templates(directory=os.path.join(APP_ROOT, "templates"))
+templates.env.globals["static_url"] = static_assets.url
+
+# Vyrenderované stránky bez dat z requestu
+page_cache = PageCache(templates)
+
+# SSH session, úlohy a události: v procesu aplikace, nebo s více workery
+# přes SSH broker (session musí žít v jednom procesu)
+if SSH_BROKER_SOCKET:
+    ssh_service = BrokerClient(SSH_BROKER_SOCKET)
+else:
+    ssh_service = SSHService()
+    # Okamžité hodnoty pro /metrics (čtou se až při výpisu)
+    register_gauges(ssh_service)
+
+
+@app.on_event("startup")
+async def start_ssh_service():
+    """Spustí reaper a kontrolu spojení SSH session na pozadí."""
+    await ssh_service.start()
+
 
-# Static files
-app.mount("/static", StaticFiles(directory="/app/static"), name="static")
+@app.on_event("startup")
+async def warm_pages():
+    """Vyrenderuje a zkomprimuje hlavní stránku předem."""
+    await asyncio.to_thread(page_cache.warm, "index.html")
 
-# In-memory storage pro SSH session (klíč = session ID)
-ssh_sessions: Dict[str, SSHSession] = {}
 
+@app.on_event("shutdown")
+async def shutdown_ssh_service():
+    """Zastaví reaper, odpojí session a ukončí thread pool pro SSH operace."""
+    await ssh_service.close()
 
-def get_ssh_session(request: Request) -> SSHSession:
-    """Získá SSH session z in-memory storage."""
+
+def get_session_id(request: Request) -> str:
+    """Vrací session ID z cookie, případně vytvoří nové."""
     session_id = request.session.get("session_id")
     if not session_id:
         # Vytvoření nového session ID
         session_id = str(uuid.uuid4())
         request.session["session_id"] = session_id
-    
-    # Vytvoření nebo načtení SSH session
-    if session_id not in ssh_sessions:
-        ssh_sessions[session_id] = SSHSession()
-    
-    return ssh_sessions[session_id]
+    return session_id
 
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
-    """Hlavní stránka aplikace."""
-    return templates.TemplateResponse("index.html", {"request": request})
+    """Hlavní stránka aplikace (z cache, volá ji i healthcheck)."""
+    return page_cache.response("index.html", request.headers)
 
 
 # API endpointy pro dekódování
@@ -79,18 +117,21 @@ async def decode(
 ):
     """Dekóduje AUSKEY a root password."""
     try:
-        result = decode_auskey(kek, auskey_line1, auskey_line2)
+        with DECODE_SECONDS.time("single"):
+            result = decode_auskey(kek, auskey_line1, auskey_line2)
         # Vracíme HTML partial pro HTMX
         return templates.TemplateResponse(
             "partials/decode_result.html",
             {"request": req, **result}
         )
     except ValueError as e:
+        ERRORS.inc("decode")
         return templates.TemplateResponse(
             "partials/decode_result.html",
             {"request": req, "error": str(e)}
         )
     except Exception as e:
+        ERRORS.inc("decode")
         logger.error(f"Chyba při dekódování: {e}")
         return templates.TemplateResponse(
             "partials/decode_result.html",
@@ -98,6 +139,51 @@ async def decode(
         )
 
 
+# Maximální velikost vstupu pro dávkové dekódování
+DECODE_BATCH_MAX_BYTES = 10 * 1024 * 1024
+
+
+@app.post("/api/decode/batch")
+async def decode_batch_endpoint(req: Request):
+    """
+    Dávkově dekóduje AUSKEY z CSV nebo JSON.
+    
+    Přijímá multipart upload (pole `file`) nebo přímo tělo requestu
+    (text/csv, application/json), které se čte po částech.
+    """
+    try:
+        if req.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await req.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise ValueError("Chybí soubor (pole file)")
+            data = bytearray()
+            while chunk := await upload.read(65536):
+                data += chunk
+                if len(data) > DECODE_BATCH_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail="Vstup je příliš velký")
+        else:
+            data = bytearray()
+            async for chunk in req.stream():
+                data += chunk
+                if len(data) > DECODE_BATCH_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail="Vstup je příliš velký")
+        text = data.decode("utf-8-sig")
+        # Dekódování běží mimo event loop (CPU)
+        return await asyncio.to_thread(_decode_batch_timed, text)
+    except UnicodeDecodeError:
+        ERRORS.inc("decode_batch")
+        raise HTTPException(status_code=400, detail="Vstup není v kódování UTF-8")
+    except ValueError as e:
+        ERRORS.inc("decode_batch")
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _decode_batch_timed(text: str) -> dict:
+    with DECODE_SECONDS.time("batch"):
+        return decode_batch(rows_from_text(text))
+
+
 # API endpointy pro SSH operace
 @app.post("/api/ssh/connect")
 async def ssh_connect(
@@ -108,8 +194,7 @@ async def ssh_connect(
 ):
     """Připojí se k SSH serveru."""
     try:
-        session = get_ssh_session(req)
-        result = session.connect(host, port, password)
+        await ssh_service.run(get_session_id(req), "connect", host=host, port=port, password=password)
         # Uložení informací do session
         req.session["ssh_host"] = host
         req.session["ssh_port"] = port
@@ -138,12 +223,8 @@ async def ssh_connect(
 async def ssh_disconnect(req: Request):
     """Odpojí SSH session."""
     try:
-        session = get_ssh_session(req)
-        session.disconnect()
+        await ssh_service.run(req.session.get("session_id"), "disconnect")
         # Vyčištění session
-        session_id = req.session.get("session_id")
-        if session_id and session_id in ssh_sessions:
-            del ssh_sessions[session_id]
         req.session.pop("ssh_host", None)
         req.session.pop("ssh_port", None)
         return {"status": "disconnected"}
@@ -154,31 +235,94 @@ async def ssh_disconnect(req: Request):
 
 @app.get("/api/ssh/status", response_model=SSHStatusResponse)
 async def ssh_status(req: Request):
-    """Vrací status SSH připojení."""
+    """
+    Vrací status SSH připojení.
+    
+    Prohlížeč dostává změny stavu průběžně jako SSE událost `ssh_status`,
+    endpoint slouží pro jednorázový dotaz.
+    """
     try:
-        session = get_ssh_session(req)
-        if session.is_connected():
-            host = req.session.get("ssh_host") or session.host
-            port = req.session.get("ssh_port") or session.port
-            return SSHStatusResponse(
-                connected=True,
-                host=host,
-                port=port
-            )
-        else:
-            return SSHStatusResponse(connected=False)
+        return SSHStatusResponse(**await ssh_service.status(req.session.get("session_id")))
     except:
         return SSHStatusResponse(connected=False)
 
 
+@app.get("/api/ssh/device-state")
+async def ssh_device_state(req: Request, refresh: bool = False):
+    """
+    Vrací snapshot stavu zařízení: SSH monitor, tuya_start.sh, serialgateway, IP eth1 a udhcpc.
+    
+    Stav se zjišťuje jedním příkazem na gateway a drží se v cache session,
+    po operaci, která zařízení mění, se zahodí (SSE událost `device_state`
+    se `stale: true`). `refresh=true` ho zjistí znovu.
+    """
+    try:
+        return await ssh_service.device_state(get_session_id(req), refresh=refresh)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Chyba při zjišťování stavu zařízení: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/ssh/executor")
+async def ssh_executor_stats():
+    """Vrací čítače thread poolu pro SSH operace."""
+    return (await ssh_service.stats())["executor"]
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Metriky aplikace ve formátu Prometheus.
+
+    Výpis je za worker, který request obsloužil (label `worker` s PID),
+    a s SSH brokerem navíc za broker (`worker="broker"`).
+    """
+    # Statistiky session se sbírají pod zámkem registru, proto mimo event loop;
+    # s SSH brokerem se přidají jeho metriky (SSH operace, session, úlohy)
+    body = merge_expositions(
+        label_exposition(await asyncio.to_thread(REGISTRY.render), worker=str(os.getpid())),
+        label_exposition(await ssh_service.metrics(), worker="broker"),
+    )
+    return PlainTextResponse(body, media_type=CONTENT_TYPE)
+
+
+@app.get("/api/ssh/sessions")
+async def ssh_sessions_stats():
+    """Vrací statistiky registru SSH session a sdílených transportů."""
+    stats = await ssh_service.stats()
+    return {**stats["sessions"], "transports": stats["transports"]}
+
+
+@app.get("/api/events")
+async def events(req: Request):
+    """
+    Proud událostí pro prohlížeč (Server-Sent Events).
+    
+    Posílá průběh operací (např. `progress` při nahrávání souborů)
+    a změny stavu SSH spojení (`ssh_status`, první hned po připojení)
+    pro session z cookie.
+    """
+    session_id = get_session_id(req)
+    
+    async def stream():
+        yield format_sse(("ssh_status", await ssh_service.status(session_id)))
+        async for event in ssh_service.subscribe(session_id):
+            yield format_sse(event)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/api/ssh/disable-monitor", response_model=SSHOperationResponse)
 async def ssh_disable_monitor(req: Request):
     """Vypne SSH monitor."""
     try:
-        session = get_ssh_session(req)
-        if not session.is_connected():
-            raise HTTPException(status_code=400, detail="SSH není připojeno")
-        result = session.disable_ssh_monitor()
+        result = await ssh_service.run(get_session_id(req), "disable_ssh_monitor")
         return SSHOperationResponse(**result)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -190,17 +334,14 @@ async def ssh_disable_monitor(req: Request):
 @app.post("/api/ssh/upload-serialgateway")
 async def ssh_upload_serialgateway(
     req: Request,
-    filename: str = Form(...)
+    filename: str = Form(...),
+    transfer: str = Form(None)
 ):
-    """Nahraje serialgateway.bin na server."""
+    """Nahraje serialgateway.bin na server (transfer: sftp / gzip)."""
     try:
-        session = get_ssh_session(req)
-        if not session.is_connected():
-            raise HTTPException(status_code=400, detail="SSH není připojeno")
-        
-        local_path = get_file_path(filename)
-        result = session.upload_file(local_path, "/tuya/serialgateway")
-        return result
+        return await ssh_service.run(
+            get_session_id(req), "sync_serialgateway", filename=filename, transfer=transfer
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -212,10 +353,7 @@ async def ssh_upload_serialgateway(
 async def ssh_update_tuya_start(req: Request):
     """Upraví tuya_start.sh."""
     try:
-        session = get_ssh_session(req)
-        if not session.is_connected():
-            raise HTTPException(status_code=400, detail="SSH není připojeno")
-        result = session.update_tuya_start()
+        result = await ssh_service.run(get_session_id(req), "update_tuya_start")
         return SSHOperationResponse(**result)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -231,10 +369,7 @@ async def ssh_set_static_ip(
 ):
     """Nastaví statickou IP."""
     try:
-        session = get_ssh_session(req)
-        if not session.is_connected():
-            raise HTTPException(status_code=400, detail="SSH není připojeno")
-        result = session.set_static_ip(ip)
+        result = await ssh_service.run(get_session_id(req), "set_static_ip", ip=ip)
         return SSHOperationResponse(**result)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -247,14 +382,8 @@ async def ssh_set_static_ip(
 async def ssh_reboot(req: Request):
     """Restartuje zařízení."""
     try:
-        session = get_ssh_session(req)
-        if not session.is_connected():
-            raise HTTPException(status_code=400, detail="SSH není připojeno")
-        result = session.reboot()
+        result = await ssh_service.run(get_session_id(req), "reboot")
         # Vyčištění session po rebootu
-        session_id = req.session.get("session_id")
-        if session_id and session_id in ssh_sessions:
-            del ssh_sessions[session_id]
         req.session.pop("ssh_host", None)
         req.session.pop("ssh_port", None)
         return SSHOperationResponse(**result)
@@ -266,30 +395,55 @@ async def ssh_reboot(req: Request):
 
 
 @app.get("/api/files/list", response_model=FileListResponse)
-async def list_files():
-    """Vrací seznam dostupných binárních souborů."""
+async def list_files(type: str = None, suffix: str = None):
+    """Vrací seznam dostupných binárních souborů (volitelně jen daného typu / přípony)."""
     try:
-        files = get_available_files()
+        files = catalog.names(file_type=type, suffix=suffix)
         return FileListResponse(files=files)
     except Exception as e:
         logger.error(f"Chyba při čtení souborů: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/files/catalog")
+async def files_catalog(type: str = None, suffix: str = None, hashes: bool = False):
+    """
+    Vrací katalog binárních souborů s velikostí, typem a sha256.
+    
+    sha256 je vyplněný, pokud už byl spočítaný; s `hashes=true` se
+    dopočítá pro všechny soubory (mimo event loop).
+    """
+    try:
+        entries = catalog.files(file_type=type, suffix=suffix)
+        files = await asyncio.to_thread(lambda: [e.to_dict(with_hash=hashes) for e in entries])
+        return {"files": files}
+    except Exception as e:
+        logger.error(f"Chyba při čtení souborů: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/firmware/inspect")
+async def firmware_inspect(filename: str):
+    """
+    Vrací popis firmware souboru (.gbl): platnost, verze, nápovědy k EZSP.
+    
+    Obraz se kontroluje bez připojení ke gateway; výsledek je v cache podle sha256.
+    """
+    try:
+        return await asyncio.to_thread(inspect_firmware, filename)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Chyba při kontrole firmware: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # API endpointy pro upgrade firmware
 @app.post("/api/firmware/stop-serialgateway")
 async def firmware_stop_serialgateway(req: Request):
     """Zastaví serialgateway před upgrade."""
     try:
-        session = get_ssh_session(req)
-        if not session.is_connected():
-            return templates.TemplateResponse(
-                "partials/firmware_status.html",
-                {"request": req, "status": "error", "message": "SSH není připojeno"},
-                status_code=400
-            )
-        upgrade = FirmwareUpgrade(session)
-        result = upgrade.stop_serialgateway()
+        result = await ssh_service.run(get_session_id(req), "stop_serialgateway")
         return templates.TemplateResponse(
             "partials/firmware_status.html",
             {"request": req, **result}
@@ -312,19 +466,15 @@ async def firmware_stop_serialgateway(req: Request):
 @app.post("/api/firmware/upload-files")
 async def firmware_upload_files(
     req: Request,
-    firmware_filename: str = Form(...)
+    firmware_filename: str = Form(...),
+    transfer: str = Form(None)
 ):
-    """Nahraje soubory potřebné pro upgrade."""
+    """Nahraje soubory potřebné pro upgrade (transfer: sftp / gzip)."""
     try:
-        session = get_ssh_session(req)
-        if not session.is_connected():
-            return templates.TemplateResponse(
-                "partials/firmware_status.html",
-                {"request": req, "status": "error", "message": "SSH není připojeno"},
-                status_code=400
-            )
-        upgrade = FirmwareUpgrade(session)
-        result = upgrade.upload_upgrade_files(firmware_filename)
+        await asyncio.to_thread(check_firmware, firmware_filename)
+        result = await ssh_service.run(
+            get_session_id(req), "upload_upgrade_files", firmware_filename=firmware_filename, transfer=transfer
+        )
         return templates.TemplateResponse(
             "partials/firmware_status.html",
             {"request": req, **result}
@@ -348,33 +498,26 @@ async def firmware_upload_files(
 async def firmware_upgrade(
     req: Request,
     firmware_filename: str = Form(None),
-    ezsp_version: str = Form("V7")
+    ezsp_version: str = Form("V7"),
+    engine: str = Form(None)
 ):
     """Provede upgrade firmware Zigbee modulu."""
     try:
-        session = get_ssh_session(req)
-        if not session.is_connected():
-            return templates.TemplateResponse(
-                "partials/firmware_status.html",
-                {"request": req, "status": "error", "message": "SSH není připojeno"},
-                status_code=400
-            )
-        # Ověření, že firmware soubor existuje na serveru
+        # Ověření firmware souboru na serveru dřív, než se cokoli pošle na gateway
         if firmware_filename:
             try:
-                get_file_path(firmware_filename)
-            except ValueError:
+                await asyncio.to_thread(check_firmware, firmware_filename)
+            except ValueError as e:
                 return templates.TemplateResponse(
                     "partials/firmware_status.html",
-                    {"request": req, "status": "error", "message": f"Firmware soubor {firmware_filename} nebyl nalezen"},
+                    {"request": req, "status": "error", "message": str(e)},
                     status_code=400
                 )
-        upgrade = FirmwareUpgrade(session)
-        result = upgrade.perform_upgrade(ezsp_version)
+        result = await ssh_service.run(
+            get_session_id(req), "perform_upgrade",
+            ezsp_version=ezsp_version, engine=engine, firmware_filename=firmware_filename
+        )
         # Vyčištění session po rebootu
-        session_id = req.session.get("session_id")
-        if session_id and session_id in ssh_sessions:
-            del ssh_sessions[session_id]
         req.session.pop("ssh_host", None)
         req.session.pop("ssh_port", None)
         return templates.TemplateResponse(
@@ -400,15 +543,7 @@ async def firmware_upgrade(
 async def firmware_restore_serialgateway(req: Request):
     """Obnoví serialgateway po upgrade."""
     try:
-        session = get_ssh_session(req)
-        if not session.is_connected():
-            return templates.TemplateResponse(
-                "partials/firmware_status.html",
-                {"request": req, "status": "error", "message": "SSH není připojeno"},
-                status_code=400
-            )
-        upgrade = FirmwareUpgrade(session)
-        result = upgrade.restore_serialgateway()
+        result = await ssh_service.run(get_session_id(req), "restore_serialgateway")
         return templates.TemplateResponse(
             "partials/firmware_status.html",
             {"request": req, **result}
@@ -428,6 +563,201 @@ async def firmware_restore_serialgateway(req: Request):
         )
 
 
+# API endpointy pro úlohy na pozadí
+def job_response(req: Request, job: dict, status_code: int = 200):
+    """Vrací úlohu jako HTML partial (HTMX) nebo JSON."""
+    if req.headers.get("HX-Request"):
+        return templates.TemplateResponse(
+            "partials/job_status.html",
+            {"request": req, "job": job},
+            status_code=status_code
+        )
+    return JSONResponse(job, status_code=status_code)
+
+
+def job_error(req: Request, message: str, status_code: int):
+    """Vrací chybu založení úlohy ve formátu podle typu requestu."""
+    if req.headers.get("HX-Request"):
+        return templates.TemplateResponse(
+            "partials/firmware_status.html",
+            {"request": req, "status": "error", "message": message},
+            status_code=status_code
+        )
+    raise HTTPException(status_code=status_code, detail=message)
+
+
+@app.post("/api/jobs/upgrade")
+async def job_upgrade(
+    req: Request,
+    firmware_filename: str = Form(None),
+    ezsp_version: str = Form("V7"),
+    restore: bool = Form(False),
+    engine: str = Form(None)
+):
+    """
+    Spustí upgrade firmware jako úlohu na pozadí.
+    
+    Flash Zigbee modulu, restart s čekáním na návrat zařízení
+    a při `restore` obnovení serialgateway. `engine` volí, kdo posílá
+    firmware do modulu: "device" (sx na gateway) nebo "host" (XMODEM z aplikace).
+    """
+    try:
+        if ezsp_version not in ("V7", "V8"):
+            raise ValueError("EZSP verze musí být V7 nebo V8")
+        if engine and engine not in FLASH_ENGINES:
+            raise ValueError(f"Neznámý způsob nahrání firmware: {engine}")
+        if (engine or FLASH_ENGINE) == "host" and not firmware_filename:
+            raise ValueError("Pro nahrání firmware z aplikace je nutné zvolit firmware soubor")
+        if firmware_filename:
+            await asyncio.to_thread(check_firmware, firmware_filename)
+        job = await ssh_service.submit_job(
+            get_session_id(req), "upgrade",
+            {"firmware_filename": firmware_filename, "ezsp_version": ezsp_version, "restore": restore, "engine": engine}
+        )
+        return job_response(req, job, status_code=202)
+    except ValueError as e:
+        return job_error(req, str(e), 400)
+
+
+@app.post("/api/jobs/upload-files")
+async def job_upload_files(
+    req: Request,
+    firmware_filename: str = Form(...),
+    transfer: str = Form(None)
+):
+    """Nahraje upgrade soubory (sx.bin a firmware) jako úlohu na pozadí."""
+    try:
+        await asyncio.to_thread(check_firmware, firmware_filename)
+        job = await ssh_service.submit_job(
+            get_session_id(req), "upload_files", {"firmware_filename": firmware_filename, "transfer": transfer}
+        )
+        return job_response(req, job, status_code=202)
+    except ValueError as e:
+        return job_error(req, str(e), 400)
+
+
+@app.post("/api/jobs/upload-serialgateway")
+async def job_upload_serialgateway(
+    req: Request,
+    filename: str = Form(...),
+    transfer: str = Form(None)
+):
+    """Nahraje serialgateway jako úlohu na pozadí."""
+    try:
+        get_file_path(filename)
+        job = await ssh_service.submit_job(
+            get_session_id(req), "upload_serialgateway", {"filename": filename, "transfer": transfer}
+        )
+        return job_response(req, job, status_code=202)
+    except ValueError as e:
+        return job_error(req, str(e), 400)
+
+
+@app.post("/api/jobs/reboot")
+async def job_reboot(req: Request):
+    """Restartuje zařízení jako úlohu na pozadí (počká na návrat a znovu se připojí)."""
+    try:
+        job = await ssh_service.submit_job(get_session_id(req), "reboot", {})
+        return job_response(req, job, status_code=202)
+    except ValueError as e:
+        return job_error(req, str(e), 400)
+
+
+@app.get("/api/jobs")
+async def jobs_list(req: Request, kind: str = None):
+    """Vrací úlohy aktuální session (od nejnovější, bez logu)."""
+    return {"jobs": await ssh_service.list_jobs(req.session.get("session_id"), kind)}
+
+
+@app.get("/api/jobs/stats")
+async def jobs_stats():
+    """Vrací počty úloh podle stavu."""
+    return (await ssh_service.stats())["jobs"]
+
+
+@app.get("/api/jobs/latest/view", response_class=HTMLResponse)
+async def job_latest_view(req: Request, kind: str = None):
+    """HTML partial s poslední úlohou session (obnovení stavu po reloadu stránky)."""
+    jobs = await ssh_service.list_jobs(req.session.get("session_id"), kind, with_log=True)
+    if not jobs:
+        return HTMLResponse('<span class="text-sm text-gray-500">✗ Nevykonáno</span>')
+    return templates.TemplateResponse("partials/job_status.html", {"request": req, "job": jobs[0]})
+
+
+@app.get("/api/jobs/{job_id}")
+async def job_detail(req: Request, job_id: str):
+    """Vrací stav, kroky a log úlohy."""
+    job = await ssh_service.get_job(req.session.get("session_id"), job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Úloha nenalezena")
+    return job
+
+
+@app.get("/api/jobs/{job_id}/view", response_class=HTMLResponse)
+async def job_view(req: Request, job_id: str):
+    """HTML partial se stavem úlohy (pro HTMX polling)."""
+    job = await ssh_service.get_job(req.session.get("session_id"), job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Úloha nenalezena")
+    return templates.TemplateResponse("partials/job_status.html", {"request": req, "job": job})
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def job_cancel(req: Request, job_id: str):
+    """Požádá o zrušení úlohy (projeví se před dalším krokem)."""
+    job = await ssh_service.cancel_job(req.session.get("session_id"), job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Úloha nenalezena")
+    return job_response(req, job)
+
+
+# API endpointy pro fleet režim
+@app.post("/api/fleet/run")
+async def fleet_run(
+    request: Request,
+    inventory: str = Form(...),
+    operations: str = Form(...),
+    concurrency: int = Form(8),
+    filename: str = Form(None)
+):
+    """
+    Provede operace na skupině zařízení z inventáře.
+    
+    Vrací proud JSON řádků (NDJSON) s průběhem pro každé zařízení
+    a souhrnem na konci. Odpojení klienta běh zruší.
+    """
+    try:
+        devices = parse_inventory(inventory)
+        if filename:
+            get_file_path(filename)
+        run = FleetRun(
+            devices,
+            [op.strip() for op in operations.split(",") if op.strip()],
+            concurrency=concurrency,
+            params={"filename": filename}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def stream():
+        events = run.run()
+        finished = False
+        try:
+            # Události se čekají v threadpoolu, event loop zůstává volný
+            while (event := await asyncio.to_thread(next, events, None)) is not None:
+                if await request.is_disconnected():
+                    break
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+            else:
+                finished = True
+        finally:
+            # Odpojení klienta Starlette ohlásí i zrušením streamu, zařízení ve frontě už nezačnou
+            if not finished:
+                run.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,381 @@
+"""
+Metriky aplikace ve formátu Prometheus (text exposition 0.0.4).
+
+Vlastní minimální implementace bez dalších závislostí: čítače, gauge
+a histogramy s labely. Zápis je levný (jeden zámek na metriku, alokace
+jen při prvním výskytu kombinace labelů), takže se dá volat z event loopu
+i z vláken SSH operací. Hodnoty labelů musí mít omezený počet variant
+(šablona routy, název operace), nikdy ne např. celou URL.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Sequence, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Hranice histogramů doby trvání v sekundách
+DURATION_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0,
+)
+# Hranice histogramu propustnosti v bytech za sekundu (16 KiB/s až 64 MiB/s)
+THROUGHPUT_BUCKETS = tuple(float(2 ** i * 1024) for i in range(4, 17))
+
+# Starlette doplní `; charset=utf-8` sám
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Společný základ metrik (název, popis, názvy labelů, zámek)."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _check(self, labelvalues: LabelValues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"Metrika {self.name} očekává labely {self.labelnames}")
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        """Vrací vzorky (název, labely, hodnota) pro výpis."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotónně rostoucí čítač (název by měl končit `_total`)."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        """Přičte `amount` k čítači s danými hodnotami labelů."""
+        with self._lock:
+            current = self._values.get(labelvalues)
+            if current is None:
+                self._check(labelvalues)
+                current = 0.0
+            self._values[labelvalues] = current + amount
+
+    def value(self, *labelvalues: str) -> float:
+        with self._lock:
+            return self._values.get(labelvalues, 0.0)
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, k), v) for k, v in items]
+
+
+class Gauge(_Metric):
+    """
+    Okamžitá hodnota.
+
+    S `fn` se hodnota čte až při výpisu metrik - funkce vrací číslo,
+    případně dict {hodnoty labelů: číslo}.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        fn: Optional[Callable[[], Union[float, dict[LabelValues, float]]]] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+        self._values: dict[LabelValues, float] = {}
+
+    def set(self, value: float, *labelvalues: str):
+        self._check(labelvalues)
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        with self._lock:
+            current = self._values.get(labelvalues)
+            if current is None:
+                self._check(labelvalues)
+                current = 0.0
+            self._values[labelvalues] = current + amount
+
+    def dec(self, *labelvalues: str, amount: float = 1.0):
+        self.inc(*labelvalues, amount=-amount)
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        if self.fn is not None:
+            try:
+                result = self.fn()
+            except Exception as e:
+                logger.warning(f"Hodnotu metriky {self.name} nelze zjistit: {e}")
+                return []
+            items = sorted(result.items()) if isinstance(result, dict) else [((), result)]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, k), float(v)) for k, v in items]
+
+
+class Histogram(_Metric):
+    """Histogram s pevnými hranicemi (počty se kumulují až při výpisu)."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # hodnoty labelů -> [počty v jednotlivých přihrádkách (+Inf na konci), součet, počet]
+        self._values: dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        """Zaznamená jednu hodnotu."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                self._check(labelvalues)
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, *labelvalues: str) -> Iterator[None]:
+        """Změří dobu běhu bloku (v sekundách), i když blok skončí výjimkou."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def count(self, *labelvalues: str) -> int:
+        with self._lock:
+            state = self._values.get(labelvalues)
+            return state[2] if state else 0
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        result = []
+        bounds = [_format_value(b) for b in self.buckets] + ["+Inf"]
+        names = self.labelnames + ("le",)
+        for labelvalues, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                result.append((f"{self.name}_bucket", _format_labels(names, labelvalues + (bound,)), cumulative))
+            labels = _format_labels(self.labelnames, labelvalues)
+            result.append((f"{self.name}_sum", labels, total))
+            result.append((f"{self.name}_count", labels, count))
+        return result
+
+
+class MetricsRegistry:
+    """Seznam registrovaných metrik a jejich výpis."""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metrika {metric.name} už je registrovaná")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        """Vrací všechny metriky v textovém formátu Prometheus."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# Sdílený registr metrik aplikace (vypisuje ho endpoint /metrics)
+REGISTRY = MetricsRegistry()
+
+
+def label_exposition(text: str, **labels: str) -> str:
+    """Přidá ke všem vzorkům výpisu metrik další labely (např. worker="broker")."""
+    extra = _format_labels(tuple(labels), tuple(labels.values()))[1:-1]
+    lines = []
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, brace, rest = line.partition("{")
+            if brace:
+                line = f"{name}{{{extra},{rest}"
+            else:
+                name, _, value = line.partition(" ")
+                line = f"{name}{{{extra}}} {value}"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def merge_expositions(*texts: str) -> str:
+    """
+    Spojí výpisy metrik více procesů (web worker a SSH broker) do jednoho.
+
+    Vzorky se řadí pod hlavičku své metriky a nesčítají se - výpisy
+    procesů se mají předem odlišit labelem (viz label_exposition), jinak
+    vyhraje první výskyt. Gauge se mezi procesy sčítat nedají.
+    """
+    headers: dict[str, list[str]] = {}
+    samples: dict[str, dict[str, str]] = {}
+    current = None
+    for text in texts:
+        for line in text.splitlines():
+            if line.startswith("# "):
+                current = line.split(" ", 3)[2]
+                family = headers.setdefault(current, [])
+                samples.setdefault(current, {})
+                if line not in family:
+                    family.append(line)
+            elif line and current is not None:
+                key, _, value = line.rpartition(" ")
+                samples[current].setdefault(key, value)
+    blocks = []
+    for name, family in headers.items():
+        lines = family + [f"{key} {value}" for key, value in samples[name].items()]
+        blocks.append("\n".join(lines))
+    return "\n".join(blocks) + "\n"
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (), fn=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames, fn))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Metriky aplikace
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds",
+    "Doba zpracování HTTP requestu do začátku odpovědi",
+    ("method", "route", "status"),
+)
+SSH_CONNECT_SECONDS = histogram("ssh_connect_duration_seconds", "Doba navázání SSH spojení (včetně SFTP)")
+SSH_COMMAND_SECONDS = histogram(
+    "ssh_command_duration_seconds", "Doba provedení příkazu přes SSH (RTT včetně běhu příkazu)", ("channel",)
+)
+SSH_STREAM_BYTES = counter("ssh_stream_bytes_total", "Byty výstupu příkazů čtené průběžně z exec kanálu", ("stream",))
+SSH_PING_SECONDS = histogram("ssh_ping_rtt_seconds", "RTT kontroly SSH spojení (global request)")
+SSH_OPERATION_SECONDS = histogram(
+    "ssh_operation_duration_seconds", "Doba SSH operace v executoru (bez čekání ve frontě)", ("operation",)
+)
+SSH_EXECUTOR_WAIT_SECONDS = histogram("ssh_executor_wait_seconds", "Doba čekání SSH operace ve frontě executoru")
+UPLOAD_BYTES = counter("sftp_upload_bytes_total", "Odeslané byty při nahrávání souborů", ("transfer",))
+UPLOAD_SECONDS = histogram("sftp_upload_duration_seconds", "Doba nahrání souboru", ("transfer",))
+UPLOAD_THROUGHPUT = histogram(
+    "sftp_upload_throughput_bytes_per_second", "Propustnost nahrání souboru (velikost souboru / doba)",
+    ("transfer",), THROUGHPUT_BUCKETS,
+)
+XMODEM_BLOCKS = counter("xmodem_blocks_total", "Odpovědi přijímače na bloky XMODEM (ack/nak/timeout)", ("result",))
+DECODE_SECONDS = histogram("decode_duration_seconds", "Doba dekódování AUSKEY", ("kind",))
+JOBS_FINISHED = counter("jobs_finished_total", "Dokončené úlohy na pozadí podle druhu a stavu", ("kind", "state"))
+JOB_SECONDS = histogram("job_duration_seconds", "Doba běhu úlohy na pozadí", ("kind",))
+ERRORS = counter("app_errors_total", "Chyby podle operace", ("operation",))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware, které měří dobu HTTP requestů podle šablony routy.
+
+    Doba se měří do začátku odpovědi (`http.response.start`), u streamovaných
+    odpovědí (SSE) tedy do odeslání hlaviček, ne do konce spojení.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Optional[dict] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        recorded = False
+
+        async def send_timed(message):
+            nonlocal recorded
+            if message["type"] == "http.response.start" and not recorded:
+                recorded = True
+                self._record(scope, message["status"], started)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            if not recorded:
+                self._record(scope, 500, started)
+
+    def _record(self, scope, status: int, started: float):
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, scope["method"], self._route(scope), str(status)
+        )
+
+    def _route(self, scope) -> str:
+        """Vrací šablonu routy (např. `/api/jobs/{job_id}`) podle endpointu, který request obsloužil."""
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._routes is None:
+            routes = {}
+            for route in getattr(scope.get("app"), "routes", []):
+                target = getattr(route, "endpoint", None) or getattr(route, "app", None)
+                if target is not None:
+                    routes[target] = route.path
+            self._routes = routes
+        return self._routes.get(endpoint, "unmatched")
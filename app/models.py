@@ -51,8 +51,12 @@ class SSHConnectRequest(BaseModel):
 class SSHStatusResponse(BaseModel):
     """Response model pro SSH status."""
     connected: bool
+    state: str = "disconnected"
     host: str | None = None
     port: int | None = None
+    rtt_ms: float | None = None
+    last_reboot_s: float | None = None
+    handshake: dict | None = None
 
 
 class SSHOperationResponse(BaseModel):
@@ -118,3 +122,25 @@ class FirmwareUpgradeRequest(BaseModel):
         if v not in ["V7", "V8"]:
             raise ValueError("EZSP verze musí být V7 nebo V8")
         return v
+
+
+class FleetDevice(BaseModel):
+    """Zařízení v inventáři pro fleet režim."""
+    host: str = Field(..., description="IP adresa gateway")
+    port: int = Field(22, ge=1, le=65535, description="SSH port")
+    password: str = Field(..., min_length=1, description="Root heslo")
+    static_ip: str | None = Field(None, description="Statická IP pro operaci set_static_ip")
+    
+    @field_validator('host', 'static_ip')
+    @classmethod
+    def validate_ip(cls, v: str | None) -> str | None:
+        """Validuje IP adresu."""
+        if v is None:
+            return v
+        ip_pattern = r'^(\d{1,3}\.){3}\d{1,3}$'
+        if not re.match(ip_pattern, v):
+            raise ValueError("Neplatná IP adresa")
+        parts = v.split('.')
+        if not all(0 <= int(part) <= 255 for part in parts):
+            raise ValueError("Neplatná IP adresa")
+        return v
@@ -0,0 +1,225 @@
+"""
+Registr SSH session s omezenou velikostí a vypršením nečinných session.
+"""
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+import logging
+
+from app.ssh_operations import SSHSession, SSH_PING_TIMEOUT, STATE_CONNECTED, STATE_DEGRADED, STATE_LOST
+
+logger = logging.getLogger(__name__)
+
+# Maximální počet session v paměti (nejdéle nepoužité se vyřadí)
+SSH_SESSIONS_MAX = int(os.environ.get("SSH_SESSIONS_MAX", "64"))
+# Doba nečinnosti v sekundách, po které se session odpojí a vyřadí
+SSH_SESSION_IDLE_TTL = int(os.environ.get("SSH_SESSION_IDLE_TTL", "3600"))
+# Interval běhu reaperu v sekundách
+SSH_SESSION_REAP_INTERVAL = int(os.environ.get("SSH_SESSION_REAP_INTERVAL", "60"))
+# Interval kontroly připojených session v sekundách (RTT, detekce ztraceného spojení, 0 = vypnuto)
+SSH_HEALTH_INTERVAL = float(os.environ.get("SSH_HEALTH_INTERVAL", "5"))
+
+
+class SessionRegistry:
+    """
+    Registr SSH session (klíč = session ID z cookie).
+
+    Session se řadí podle posledního použití (LRU). Při překročení
+    kapacity se vyřadí nejdéle nepoužitá session, nečinné session
+    odpojuje reaper. Session s rozpracovanou operací se nevyřazují.
+    Změny stavu spojení session se předávají do `on_state_change`
+    jako `(session ID, status)`.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = SSH_SESSIONS_MAX,
+        idle_ttl: int = SSH_SESSION_IDLE_TTL,
+        in_use: Optional[Callable[[Any], bool]] = None,
+        on_state_change: Optional[Callable[[str, dict], None]] = None
+    ):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._in_use = in_use or (lambda session: False)
+        self._on_state_change = on_state_change
+        self._sessions: "OrderedDict[str, SSHSession]" = OrderedDict()
+        self._last_used: dict[str, float] = {}
+        # Vyřazené session čekající na odpojení (odpojuje reaper mimo event loop)
+        self._evicted: list[SSHSession] = []
+        self._lock = threading.Lock()
+        self._created = 0
+        self._evicted_idle = 0
+        self._evicted_lru = 0
+        self._closed_transports = 0
+        self._leaked = 0
+        self._health_checks = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: Optional[str]) -> Optional[SSHSession]:
+        """Vrací existující session (a označí ji jako použitou), jinak None."""
+        if not session_id:
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._touch(session_id)
+            return session
+
+    def get_or_create(self, session_id: str) -> SSHSession:
+        """Vrací session pro dané ID, případně vytvoří novou."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = SSHSession()
+                if self._on_state_change is not None:
+                    session.on_state_change = functools.partial(self._on_state_change, session_id)
+                self._sessions[session_id] = session
+                self._created += 1
+                self._evict_lru()
+            self._touch(session_id)
+            return session
+
+    def remove(self, session_id: Optional[str]) -> Optional[SSHSession]:
+        """Odebere session z registru (neodpojuje ji)."""
+        if not session_id:
+            return None
+        with self._lock:
+            self._last_used.pop(session_id, None)
+            return self._sessions.pop(session_id, None)
+
+    def _touch(self, session_id: str):
+        """Přesune session na konec LRU pořadí (volat pod zámkem)."""
+        self._sessions.move_to_end(session_id)
+        self._last_used[session_id] = time.monotonic()
+
+    def _evict_lru(self):
+        """Vyřadí nejdéle nepoužité session nad kapacitu (volat pod zámkem)."""
+        overflow = len(self._sessions) - self.max_sessions
+        if overflow <= 0:
+            return
+        for session_id in list(self._sessions):
+            if overflow <= 0:
+                break
+            session = self._sessions[session_id]
+            if self._in_use(session):
+                continue
+            del self._sessions[session_id]
+            self._last_used.pop(session_id, None)
+            self._evicted.append(session)
+            self._evicted_lru += 1
+            overflow -= 1
+        if overflow > 0:
+            logger.warning(f"Registr SSH session je přeplněn ({len(self._sessions)}/{self.max_sessions}), všechny session jsou aktivní")
+
+    def reap(self) -> int:
+        """
+        Odpojí nečinné a vyřazené session.
+
+        Blokující (zavírá paramiko transporty), volat mimo event loop.
+
+        Returns:
+            počet odpojených session
+        """
+        now = time.monotonic()
+        with self._lock:
+            for session_id, session in list(self._sessions.items()):
+                if now - self._last_used.get(session_id, now) < self.idle_ttl:
+                    continue
+                if self._in_use(session):
+                    continue
+                del self._sessions[session_id]
+                self._last_used.pop(session_id, None)
+                self._evicted.append(session)
+                self._evicted_idle += 1
+            evicted, self._evicted = self._evicted, []
+
+        for session in evicted:
+            self._close(session)
+        if evicted:
+            logger.info(f"Vyřazeno {len(evicted)} SSH session, aktivních {len(self._sessions)}")
+        return len(evicted)
+
+    def check_health(self, timeout: float = SSH_PING_TIMEOUT) -> dict:
+        """
+        Zkontroluje spojení všech připojených session.
+
+        Kontroly se odešlou všem session najednou a pak se čeká na odpovědi,
+        celá kontrola tedy trvá nejvýše `timeout`. Blokující, volat mimo event loop.
+
+        Returns:
+            počty session podle stavu spojení
+        """
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._health_checks += 1
+        pings = [(session, session.ping_start()) for session in sessions]
+        states: dict[str, int] = {}
+        for session, ping in pings:
+            state = session.ping_finish(ping, timeout) if ping is not None else session.state
+            states[state] = states.get(state, 0) + 1
+        return states
+
+    def _close(self, session: SSHSession):
+        """Odpojí vyřazenou session a ověří, že transport opravdu skončil."""
+        host = session.host
+        transport = None
+        try:
+            if session.client:
+                transport = session.client.get_transport()
+        except Exception:
+            transport = None
+        # Transport sdílený s další session po odpojení zůstává (zavře ho poslední)
+        last_user = session.transport_users() <= 1
+        if transport is not None and transport.is_active() and last_user:
+            with self._lock:
+                self._closed_transports += 1
+        session.disconnect()
+        if transport is not None and transport.is_active() and last_user:
+            with self._lock:
+                self._leaked += 1
+            logger.warning(f"SSH transport se nepodařilo zavřít: {host}")
+
+    def close_all(self):
+        """Odpojí všechny session (při ukončení aplikace)."""
+        with self._lock:
+            sessions = list(self._sessions.values()) + self._evicted
+            self._sessions.clear()
+            self._last_used.clear()
+            self._evicted = []
+        for session in sessions:
+            self._close(session)
+
+    def stats(self) -> dict:
+        """
+        Vrací počty živých, vyřazených a uniklých session.
+
+        Počítá se z posledního známého stavu session (bez kontroly transportu),
+        výpis statistik tak nemění stav spojení ani neposílá události.
+        """
+        with self._lock:
+            states = [s.state for s in self._sessions.values()]
+            counters = {
+                "health_checks": self._health_checks,
+                "max": self.max_sessions,
+                "idle_ttl": self.idle_ttl,
+                "created": self._created,
+                "evicted_idle": self._evicted_idle,
+                "evicted_lru": self._evicted_lru,
+                "closed_transports": self._closed_transports,
+                "leaked": self._leaked,
+            }
+        return {
+            "live": len(states),
+            "connected": sum(1 for state in states if state in (STATE_CONNECTED, STATE_DEGRADED)),
+            "degraded": states.count(STATE_DEGRADED),
+            "lost": states.count(STATE_LOST),
+            **counters,
+        }
@@ -0,0 +1,149 @@
+"""
+Omezený executor pro blokující SSH operace.
+
+Paramiko je čistě synchronní, proto všechny operace nad SSHSession
+běží ve vyhrazeném thread poolu mimo event loop. Operace nad jednou
+session se serializují, aby se dva requesty nepromíchaly na jednom
+transportu.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+import logging
+
+from app.metrics import ERRORS, SSH_EXECUTOR_WAIT_SECONDS, SSH_OPERATION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Počet vláken pro SSH operace (jedno vlákno = jedna souběžná operace)
+SSH_EXECUTOR_WORKERS = int(os.environ.get("SSH_EXECUTOR_WORKERS", "8"))
+
+
+class SSHExecutor:
+    """Thread pool pro SSH operace se serializací per session."""
+
+    def __init__(self, max_workers: int = SSH_EXECUTOR_WORKERS):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="ssh-executor"
+        )
+        # Zámky per session (asyncio), klíčem je samotný objekt session
+        self._locks: "weakref.WeakKeyDictionary[Any, asyncio.Lock]" = weakref.WeakKeyDictionary()
+        # Počet čekajících a běžících operací per session
+        self._pending: "weakref.WeakKeyDictionary[Any, int]" = weakref.WeakKeyDictionary()
+        self._stats_lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _get_lock(self, session: Any) -> asyncio.Lock:
+        """Vrací zámek pro danou session (vytvoří ho při prvním použití)."""
+        lock = self._locks.get(session)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[session] = lock
+        return lock
+
+    def is_busy(self, session: Any) -> bool:
+        """Zjistí, zda nad session čeká nebo běží nějaká operace."""
+        return self._pending.get(session, 0) > 0
+
+    def _finish_pending(self, session: Any):
+        """Sníží počet rozpracovaných operací nad session."""
+        remaining = self._pending.get(session, 1) - 1
+        if remaining > 0:
+            self._pending[session] = remaining
+        else:
+            self._pending.pop(session, None)
+
+    def _run_timed(self, queued_at: float, fn: Callable, *args, **kwargs) -> Any:
+        """Spustí funkci ve vlákně a započítá dobu čekání ve frontě a dobu běhu."""
+        started = time.monotonic()
+        waited = started - queued_at
+        with self._stats_lock:
+            self._queued -= 1
+            self._running += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        SSH_EXECUTOR_WAIT_SECONDS.observe(waited)
+        # Název operace pro metriky, např. "SSHSession.connect" (i pro partial)
+        target = fn.func if isinstance(fn, partial) else fn
+        operation = getattr(target, "__qualname__", None) or getattr(target, "__name__", "unknown")
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            with self._stats_lock:
+                self._failed += 1
+            ERRORS.inc(operation)
+            raise
+        finally:
+            SSH_OPERATION_SECONDS.observe(time.monotonic() - started, operation)
+            with self._stats_lock:
+                self._running -= 1
+                self._completed += 1
+
+    async def run(self, session: Any, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Spustí blokující funkci nad session v thread poolu.
+
+        Operace nad stejnou session běží postupně, operace nad různými
+        session paralelně (až do velikosti poolu).
+
+        Args:
+            session: Objekt session, podle kterého se serializuje
+            fn: Blokující funkce (typicky metoda SSHSession)
+        """
+        queued_at = time.monotonic()
+        with self._stats_lock:
+            self._queued += 1
+        self._pending[session] = self._pending.get(session, 0) + 1
+        lock = self._get_lock(session)
+
+        def _release(_future):
+            lock.release()
+            self._finish_pending(session)
+
+        try:
+            await lock.acquire()
+        except BaseException:
+            # Request zrušený dřív, než se operace dostala do poolu
+            with self._stats_lock:
+                self._queued -= 1
+            self._finish_pending(session)
+            raise
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._pool,
+            partial(self._run_timed, queued_at, fn, *args, **kwargs)
+        )
+        # Zámek se uvolní až po doběhnutí vlákna, i když se request zruší
+        future.add_done_callback(_release)
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        """Vrací čítače fronty a doby čekání."""
+        with self._stats_lock:
+            started = self._completed + self._running
+            return {
+                "workers": self.max_workers,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait_avg_ms": round(self._wait_total / started * 1000, 2) if started else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 2),
+            }
+
+    def shutdown(self):
+        """Ukončí thread pool (běžící operace doběhnou)."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -2,24 +2,317 @@
 SSH operace na Lidl Gateway zařízení.
 """
 import paramiko
+import concurrent.futures
+import contextvars
+import functools
 import os
-from typing import Optional
+import random
+import re
+import select
+import shlex
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Optional
 import logging
 
+from paramiko.sftp_file import SFTPFile
+
+from app.catalog import catalog, compressed_artifact, local_file_hash
+from app.gbl import check_firmware
+from app.metrics import (
+    SSH_COMMAND_SECONDS, SSH_CONNECT_SECONDS, SSH_PING_SECONDS, SSH_STREAM_BYTES,
+    UPLOAD_BYTES, UPLOAD_SECONDS, UPLOAD_THROUGHPUT
+)
+from app.ssh_profiles import HANDSHAKE_PHASES, SSH_HANDSHAKE_SECONDS, ConnectionProfile
+from app.ssh_transports import SharedTransport, transport_pool
+from app.xmodem import SerialBridge, XmodemSender
+
 logger = logging.getLogger(__name__)
 
-# Cesta k binárním souborům v kontejneru
-BINARIES_PATH = "/app/binaries"
+# Příkazy, jejichž nenulový exit code je v pořádku (killall vrací 1, pokud proces neběží)
+TOLERATED_FAILURES = ("killall",)
+
+# Výchozí režim spouštění příkazů přes trvalý shell kanál (1 = zapnuto)
+SSH_SHELL_MODE = os.environ.get("SSH_SHELL_MODE", "0") == "1"
+
+# Velikost jednoho SFTP write požadavku v bytech (paramiko posílá nejvýše 32 KiB)
+SFTP_REQUEST_SIZE = int(os.environ.get("SFTP_REQUEST_SIZE", "32768"))
+# Maximální počet nepotvrzených write požadavků při nahrávání (okno pipeline)
+SFTP_PREFETCH_WINDOW = int(os.environ.get("SFTP_PREFETCH_WINDOW", "32"))
+
+# Nahrávání upgrade souborů souběžně, každý soubor po vlastním SFTP kanálu (1 = zapnuto)
+SFTP_PARALLEL_UPLOADS = os.environ.get("SFTP_PARALLEL_UPLOADS", "1") == "1"
+# Celkový časový limit souběžného nahrávání v sekundách
+SFTP_UPLOAD_DEADLINE = float(os.environ.get("SFTP_UPLOAD_DEADLINE", "600"))
+
+# Nejdelší čekání v sekundách na návrat zařízení po rebootu
+REBOOT_WAIT_TIMEOUT = float(os.environ.get("REBOOT_WAIT_TIMEOUT", "180"))
+# Počáteční a maximální interval mezi pokusy o spojení na port 22 (exponenciální backoff)
+REBOOT_PROBE_INITIAL = float(os.environ.get("REBOOT_PROBE_INITIAL", "1"))
+REBOOT_PROBE_MAX = float(os.environ.get("REBOOT_PROBE_MAX", "10"))
+
+# Způsob přenosu souborů: "sftp" (výchozí) nebo "gzip" (komprimovaně přes exec kanál do gunzip)
+SSH_TRANSFER_MODE = os.environ.get("SSH_TRANSFER_MODE", "sftp")
+TRANSFER_MODES = ("sftp", "gzip")
+
+# Kdo posílá firmware do Zigbee modulu: "device" (sx na gateway) nebo "host" (XMODEM z aplikace)
+FLASH_ENGINE = os.environ.get("FLASH_ENGINE", "device")
+FLASH_ENGINES = ("device", "host")
+
+# Interval paramiko keepalive paketů v sekundách (udrží spojení přes NAT, 0 = vypnuto)
+SSH_KEEPALIVE_INTERVAL = int(os.environ.get("SSH_KEEPALIVE_INTERVAL", "15"))
+# Jak dlouho v sekundách čekat na odpověď na kontrolu spojení
+SSH_PING_TIMEOUT = float(os.environ.get("SSH_PING_TIMEOUT", "4"))
+# Počet kontrol bez odpovědi za sebou, po kterém se spojení považuje za ztracené
+SSH_PING_MAX_MISSES = int(os.environ.get("SSH_PING_MAX_MISSES", "2"))
+# Vyhlazené RTT v ms, nad kterým je spojení označeno jako zhoršené
+SSH_DEGRADED_RTT_MS = float(os.environ.get("SSH_DEGRADED_RTT_MS", "500"))
+
+# SSH okno kanálu průběžně čteného příkazu v bytech (víc výstupu gateway nepošle, dokud se nepřečte)
+SSH_STREAM_WINDOW = int(os.environ.get("SSH_STREAM_WINDOW", "65536"))
+# Kolik posledních bytů stdout a stderr průběžně čteného příkazu se drží pro výsledek
+SSH_STREAM_TAIL = int(os.environ.get("SSH_STREAM_TAIL", "16384"))
+# Interval v sekundách, po kterém se příjemci výstupu ohlásí nečinnost příkazu (flush)
+SSH_STREAM_IDLE = float(os.environ.get("SSH_STREAM_IDLE", "0.25"))
+
+# Jak dlouho v sekundách platí snapshot stavu zařízení v cache session (změny mimo aplikaci)
+DEVICE_STATE_MAX_AGE = float(os.environ.get("DEVICE_STATE_MAX_AGE", "300"))
+
+# Soubory, jejichž existence je součástí stavu zařízení
+DEVICE_STATE_FILES = (
+    "/tuya/ssh_monitor.sh",
+    "/tuya/ssh_monitor.original.sh",
+    "/tuya/tuya_start.sh",
+    "/tuya/tuya_start.original.sh",
+    "/tuya/serialgateway",
+    "/tuya/serialgateway_norun",
+)
+
+# Skript zjišťující stav zařízení jedním příkazem (řádky "klíč hodnota")
+DEVICE_STATE_SCRIPT = "\n".join([
+    f'for f in {" ".join(DEVICE_STATE_FILES)}; do if [ -e "$f" ]; then echo "exists $f"; fi; done',
+    # Vypnutý monitor obsahuje jen "#!/bin/sh" (žádný řádek s příkazem)
+    "echo \"monitor_lines $(grep -c '^ *[^# ]' /tuya/ssh_monitor.sh 2>/dev/null)\"",
+    "echo \"autostart $(grep -c '^/tuya/serialgateway' /tuya/tuya_start.sh 2>/dev/null)\"",
+    'echo "serialgateway_pids $(pidof serialgateway 2>/dev/null)"',
+    'echo "udhcpc_pids $(pidof udhcpc 2>/dev/null)"',
+    "echo \"eth1 $(ifconfig eth1 2>/dev/null | grep 'inet ')\"",
+    'echo "boot_id $(cat /proc/sys/kernel/random/boot_id 2>/dev/null)"',
+])
+
+# Stavy SSH spojení
+STATE_DISCONNECTED = "disconnected"
+STATE_CONNECTED = "connected"
+STATE_DEGRADED = "degraded"
+STATE_LOST = "lost"
+STATE_REBOOTING = "rebooting"
+
+# Callback průběhu přenosu: (odesláno bytů, celkem bytů), stejně jako u sftp.put
+ProgressCallback = Callable[[int, int], None]
+
+
+class OperationCancelled(Exception):
+    """Operaci přerušil callback průběhu na žádost uživatele (např. zrušení úlohy)."""
+
+
+class ShellChannel:
+    """
+    Dlouho žijící shell kanál pro spouštění příkazů bez otevírání nových kanálů.
+    
+    Každý příkaz se pošle na stdin shellu, za ním se vypíše unikátní značka
+    s exit codem na stdout a značka na stderr, podle kterých se výstup rozdělí.
+    """
+    
+    def __init__(self, transport: paramiko.Transport, timeout: int = 30):
+        self.channel = transport.open_session(timeout=timeout)
+        self.channel.invoke_shell()
+        # Zahození případného výstupu login shellu (profil apod.)
+        self.run("true", timeout=timeout)
+    
+    def is_alive(self) -> bool:
+        """Zkontroluje, zda shell stále běží."""
+        return not (
+            self.channel.closed
+            or self.channel.eof_received
+            or self.channel.exit_status_ready()
+        )
+    
+    def run(self, command: str, timeout: int = 30) -> tuple[str, str, int]:
+        """
+        Provede příkaz v shellu.
+        
+        Returns:
+            tuple (stdout, stderr, exit_code)
+        """
+        marker = f"__LGH_{uuid.uuid4().hex}__"
+        # Subshell jako u exec kanálu (sh -c), exit v příkazu neukončí shell
+        framed = (
+            f"(\n{command}\n) </dev/null\n"
+            f"printf '\\n{marker} %d\\n' $?; printf '\\n{marker}\\n' >&2\n"
+        )
+        try:
+            self.channel.sendall(framed.encode("utf-8"))
+            return self._read_until(marker.encode("ascii"), timeout)
+        except Exception:
+            # Stav shellu je po chybě neznámý, kanál se už nepoužije
+            self.close()
+            raise
+    
+    def _read_until(self, marker: bytes, timeout: int) -> tuple[str, str, int]:
+        """Čte stdout a stderr, dokud nedorazí obě značky."""
+        out_pattern = re.compile(b"\n" + marker + b" (-?\\d+)\n")
+        err_marker = b"\n" + marker + b"\n"
+        out = bytearray()
+        err = bytearray()
+        out_match = None
+        err_end = -1
+        deadline = time.monotonic() + timeout
+        while out_match is None or err_end < 0:
+            if not (self.channel.recv_ready() or self.channel.recv_stderr_ready()):
+                if not self.is_alive():
+                    raise EOFError("Shell kanál byl ukončen")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout("Vypršel časový limit příkazu")
+                select.select([self.channel], [], [], remaining)
+                continue
+            while self.channel.recv_ready():
+                out += self.channel.recv(32768)
+            while self.channel.recv_stderr_ready():
+                err += self.channel.recv_stderr(32768)
+            if out_match is None:
+                out_match = out_pattern.search(out, max(0, len(out) - len(marker) - 65536))
+            if err_end < 0:
+                err_end = err.find(err_marker)
+        return (
+            out[:out_match.start()].decode('utf-8', errors='ignore'),
+            err[:err_end].decode('utf-8', errors='ignore'),
+            int(out_match.group(1))
+        )
+    
+    def close(self):
+        """Zavře shell kanál."""
+        try:
+            self.channel.close()
+        except Exception:
+            pass
+
+
+class CommandStream:
+    """
+    Příkaz v exec kanálu, jehož výstup se čte po blocích, jak přichází.
+    
+    Kanál se otevírá s malým SSH oknem (`window_size`): dokud čtenář blok
+    nepřevezme, gateway další výstup neodešle a zapisující proces se na ní
+    zablokuje. V paměti je tak nejvýše jedno okno na kanál bez ohledu na
+    délku výstupu. `timeout` je nejdelší doba bez výstupu (jako u exec_command).
+    
+    Iterace vrací dvojice (stream, data), kde stream je "stdout" nebo "stderr";
+    po jejím skončení je v `exit_code` exit code příkazu.
+    """
+    
+    def __init__(self, transport: paramiko.Transport, command: str, timeout: float = 30,
+                 window_size: int = SSH_STREAM_WINDOW):
+        self.timeout = timeout
+        self.exit_code: Optional[int] = None
+        self.channel = transport.open_session(window_size=window_size, timeout=timeout)
+        self.channel.exec_command(command)
+        self._last_data = time.monotonic()
+    
+    def read(self, wait: float) -> Optional[list[tuple[str, bytes]]]:
+        """
+        Počká nejvýše `wait` sekund na výstup a vrátí bloky, které jsou k dispozici.
+        
+        Returns:
+            seznam bloků (prázdný, pokud nic nepřišlo), None po skončení příkazu
+        
+        Raises:
+            socket.timeout: příkaz nic nevypsal ani neskončil po dobu `timeout`
+        """
+        channel = self.channel
+        if not (channel.recv_ready() or channel.recv_stderr_ready()):
+            if channel.exit_status_ready() or channel.closed:
+                # Po exit status už výstup nepřijde, jen se dočte zbytek
+                if not (channel.recv_ready() or channel.recv_stderr_ready()):
+                    self.exit_code = channel.recv_exit_status()
+                    return None
+            else:
+                remaining = self._last_data + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout("Vypršel časový limit příkazu")
+                select.select([channel], [], [], min(wait, remaining))
+        chunks = []
+        # Nejvýše jeden blok z každého proudu - zbytek počká v okně kanálu
+        if channel.recv_stderr_ready():
+            chunks.append(("stderr", channel.recv_stderr(32768)))
+        if channel.recv_ready():
+            chunks.append(("stdout", channel.recv(32768)))
+        if chunks:
+            self._last_data = time.monotonic()
+            for stream, data in chunks:
+                SSH_STREAM_BYTES.inc(stream, amount=len(data))
+        return chunks
+    
+    def __iter__(self):
+        while True:
+            chunks = self.read(self.timeout)
+            if chunks is None:
+                return
+            yield from chunks
+    
+    def close(self):
+        """Zavře kanál (běžící příkaz dostane při zápisu SIGPIPE)."""
+        try:
+            self.channel.close()
+        except Exception:
+            pass
+    
+    def __enter__(self) -> "CommandStream":
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 class SSHSession:
     """Správa SSH session."""
     
-    def __init__(self):
+    def __init__(self, shell_mode: bool = SSH_SHELL_MODE, profile: Optional[ConnectionProfile] = None):
         self.client: Optional[paramiko.SSHClient] = None
         self.sftp: Optional[paramiko.SFTPClient] = None
         self.host: Optional[str] = None
         self.port: Optional[int] = None
+        # Volitelný trvalý shell kanál místo exec kanálu pro každý příkaz
+        self.shell_mode = shell_mode
+        # Profil handshaku (pořadí algoritmů), výchozí podle SSH_PROFILE
+        self.profile = profile
+        # Podíl na transportu sdíleném se session připojenými ke stejné gateway
+        self._shared: Optional[SharedTransport] = None
+        # Doba fází a vyjednané algoritmy posledního připojení
+        self.handshake: Optional[dict] = None
+        self._shell: Optional[ShellChannel] = None
+        # Shell kanál zvládne jen jeden příkaz naráz (souběžné nahrávání volá příkazy z více vláken)
+        self._shell_lock = threading.Lock()
+        # Další SFTP kanály pro souběžné nahrávání (drží se do odpojení, otevření stojí několik RTT)
+        self._spare_sftp: list[paramiko.SFTPClient] = []
+        self._shell_unavailable = False
+        # Na zařízení chybí gunzip (komprimovaný přenos se nepoužije)
+        self._gunzip_missing = False
+        # Heslo posledního připojení (pro znovupřipojení po rebootu)
+        self._password: Optional[str] = None
+        # Výsledek posledního restartu s čekáním (doba, počet pokusů)
+        self.last_reboot: Optional[dict] = None
+        # Stav spojení a vyhlazené RTT z kontrol spojení (viz ping_start)
+        self.state = STATE_DISCONNECTED
+        self.rtt_ms: Optional[float] = None
+        self._missed_pings = 0
+        # Volá se se status() při každé změně stavu spojení
+        self.on_state_change: Optional[Callable[[dict], None]] = None
+        # Poslední snapshot stavu zařízení a kdy byl zjištěn (time.monotonic)
+        self._device_state: Optional[dict] = None
+        self._device_state_at = 0.0
     
     def connect(self, host: str, port: int, password: str, timeout: int = 30) -> dict:
         """
@@ -28,23 +321,48 @@ class SSHSession:
         Returns:
             dict s statusem připojení
         """
+        if self.client:
+            # Opakované připojení - kanály a podíl na předchozím transportu se uvolní
+            self._close_channels()
+            self._release_transport()
         try:
-            self.client = paramiko.SSHClient()
-            self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            self.client.connect(
-                hostname=host,
-                port=port,
-                username="root",
-                password=password,
-                timeout=timeout,
-                look_for_keys=False,
-                allow_agent=False
-            )
-            self.sftp = self.client.open_sftp()
+            started = time.perf_counter()
+            shared, reused = transport_pool.acquire(host, port, password, timeout, profile=self.profile)
+            self._shared = shared
+            self.client = shared.client
+            self.client.get_transport().set_keepalive(SSH_KEEPALIVE_INTERVAL)
+            sftp_started = time.perf_counter()
+            try:
+                # Vlastní SFTP kanál session i nad sdíleným transportem
+                self.sftp = self.client.open_sftp()
+            except BaseException:
+                self._release_transport()
+                raise
+            done = time.perf_counter()
+            handshake = dict(shared.handshake, shared=reused)
+            SSH_HANDSHAKE_SECONDS.observe(done - sftp_started, "sftp", handshake["profile"])
+            SSH_CONNECT_SECONDS.observe(done - started)
+            handshake["sftp_ms"] = round((done - sftp_started) * 1000, 2)
+            self.handshake = handshake
             self.host = host
             self.port = port
-            logger.info(f"SSH připojení úspěšné: {host}:{port}")
-            return {"status": "connected", "host": host, "port": port}
+            self._password = password
+            self.rtt_ms = None
+            self._missed_pings = 0
+            self._device_state = None
+            self._set_state(STATE_CONNECTED)
+            if reused:
+                logger.info(
+                    f"SSH připojení úspěšné: {host}:{port} (sdílené spojení, "
+                    f"{transport_pool.users(shared)} session, sftp {handshake['sftp_ms']} ms)"
+                )
+            else:
+                logger.info(
+                    f"SSH připojení úspěšné: {host}:{port} (profil {handshake['profile']}, "
+                    + ", ".join(f"{phase} {handshake[f'{phase}_ms']} ms" for phase in HANDSHAKE_PHASES)
+                    + f", {handshake['kex']}/{handshake['cipher']}/{handshake['mac']}/{handshake['host_key_type']})"
+                )
+            return {"status": "connected", "host": host, "port": port, "handshake": handshake}
         except paramiko.AuthenticationException:
             logger.error("SSH autentizace selhala")
             raise ValueError("Špatné heslo nebo uživatel")
@@ -55,33 +373,147 @@ class SSHSession:
             logger.error(f"Připojení selhalo: {e}")
             raise ValueError(f"Nelze se připojit k {host}:{port} - {str(e)}")
     
-    def disconnect(self):
-        """Odpojí SSH session."""
+    def _close_channels(self):
+        """Zavře kanály session (shell, SFTP), transport nechá."""
+        self._close_spare_sftp()
+        if self._shell:
+            self._shell.close()
+        self._shell = None
+        self._shell_unavailable = False
+        self._gunzip_missing = False
         if self.sftp:
             try:
                 self.sftp.close()
             except:
                 pass
-        if self.client:
-            try:
-                self.client.close()
-            except:
-                pass
-        self.client = None
         self.sftp = None
+    
+    def _release_transport(self, close: bool = False):
+        """Uvolní podíl na sdíleném transportu (poslední uživatel nebo `close` ho zavře)."""
+        shared, self._shared = self._shared, None
+        self.client = None
+        if shared is not None:
+            transport_pool.release(shared, close=close)
+    
+    def transport_users(self) -> int:
+        """Počet session sdílejících transport této session (0 = nepřipojeno)."""
+        return transport_pool.users(self._shared) if self._shared is not None else 0
+    
+    def disconnect(self):
+        """Odpojí SSH session (sdílený transport zavře až poslední session)."""
+        self._close_channels()
+        self._release_transport()
         self.host = None
         self.port = None
+        self._password = None
+        self.rtt_ms = None
+        self._device_state = None
+        self._set_state(STATE_DISCONNECTED)
         logger.info("SSH odpojeno")
     
     def is_connected(self) -> bool:
-        """Zkontroluje, zda je SSH připojeno."""
+        """Zkontroluje, zda je SSH připojeno (zaniklý transport označí jako ztracené spojení)."""
         if not self.client:
             return False
         try:
             transport = self.client.get_transport()
-            return transport and transport.is_active()
+            active = bool(transport and transport.is_active())
         except:
-            return False
+            active = False
+        if not active and self.state in (STATE_CONNECTED, STATE_DEGRADED):
+            self._set_state(STATE_LOST)
+        return active
+    
+    def _set_state(self, state: str):
+        """Nastaví stav spojení a při změně zavolá on_state_change."""
+        if state == self.state:
+            return
+        self.state = state
+        logger.debug(f"Stav SSH spojení {self.host}:{self.port}: {state}")
+        self._notify_state()
+    
+    def _notify_state(self):
+        """Předá aktuální stav spojení do on_state_change."""
+        if self.on_state_change is not None:
+            try:
+                self.on_state_change(self.status())
+            except Exception as e:
+                logger.error(f"Chyba při oznámení stavu SSH spojení: {e}")
+    
+    def status(self) -> dict:
+        """Vrací stav spojení pro API a SSE událost `ssh_status`."""
+        return {
+            "connected": self.state in (STATE_CONNECTED, STATE_DEGRADED),
+            "state": self.state,
+            "host": self.host,
+            "port": self.port,
+            "rtt_ms": self.rtt_ms,
+            "last_reboot_s": self.last_reboot["duration_s"] if self.last_reboot else None,
+            "handshake": self.handshake if self.client else None,
+        }
+    
+    def ping_start(self) -> Optional["_Ping"]:
+        """
+        Spustí kontrolu spojení (global request s odpovědí), nečeká na odpověď.
+        
+        Server na neznámý požadavek odpoví odmítnutím, i to stačí pro změření RTT.
+        Request posílá Transport.global_request ve vlastním vlákně, výsledek
+        s vlastním časovým limitem vyhodnotí `ping_finish`.
+        
+        Returns:
+            rozběhnutá kontrola, nebo None pokud session není připojená
+        """
+        if not self.is_connected():
+            return None
+        shared = self._shared
+        with shared.ping_lock:
+            ping = shared.ping
+            if ping is not None and not ping.done.is_set():
+                # Kontrola transportu už běží (sdílený transport nebo dosud
+                # nezodpovězená předchozí kontrola), čeká se na stejnou odpověď
+                return ping
+            ping = _Ping(self.client.get_transport())
+            shared.ping = ping
+        return ping
+    
+    def ping_finish(self, ping: "_Ping", timeout: float = SSH_PING_TIMEOUT) -> str:
+        """
+        Počká na odpověď na kontrolu spojení a aktualizuje stav a RTT.
+        
+        Returns:
+            nový stav spojení
+        """
+        answered = ping.wait(max(0.0, ping.sent_at + timeout - time.monotonic()))
+        if not self.is_connected():
+            return self.state
+        if answered:
+            SSH_PING_SECONDS.observe(ping.answered_at - ping.sent_at)
+            rtt = (ping.answered_at - ping.sent_at) * 1000
+            # Vyhlazení jako u TCP (nový vzorek má váhu 1/4)
+            self.rtt_ms = round(rtt if self.rtt_ms is None else self.rtt_ms * 0.75 + rtt * 0.25, 1)
+            self._missed_pings = 0
+            degraded = self.rtt_ms > SSH_DEGRADED_RTT_MS
+        else:
+            self._missed_pings += 1
+            if self._missed_pings >= SSH_PING_MAX_MISSES:
+                logger.warning(f"SSH spojení {self.host}:{self.port} neodpovídá, považuji ho za ztracené")
+                self._mark_lost()
+                return self.state
+            degraded = True
+        if self.state == STATE_DEGRADED and degraded:
+            # Zhoršené spojení - prohlížeč dostává aktuální RTT
+            self._notify_state()
+        elif self.state in (STATE_CONNECTED, STATE_DEGRADED):
+            self._set_state(STATE_DEGRADED if degraded else STATE_CONNECTED)
+        return self.state
+    
+    def _mark_lost(self):
+        """Zavře nereagující transport (i ostatním session, které ho sdílí), údaje pro znovupřipojení ponechá."""
+        self._shell = None
+        self._spare_sftp = []
+        self._release_transport(close=True)
+        self.sftp = None
+        self._set_state(STATE_LOST)
     
     def execute_command(self, command: str, timeout: int = 30) -> tuple[str, str, int]:
         """
@@ -93,16 +525,167 @@ class SSHSession:
         if not self.is_connected():
             raise ValueError("SSH není připojeno")
         
+        if self.shell_mode:
+            with self._shell_lock:
+                shell = self._get_shell()
+                if shell is not None:
+                    try:
+                        with SSH_COMMAND_SECONDS.time("shell"):
+                            return shell.run(command, timeout=timeout)
+                    except Exception as e:
+                        self._shell = None
+                        logger.error(f"Chyba při provádění příkazu v shell kanálu: {e}")
+                        raise ValueError(f"Chyba při provádění příkazu: {str(e)}")
+        
         try:
-            stdin, stdout, stderr = self.client.exec_command(command, timeout=timeout)
-            exit_code = stdout.channel.recv_exit_status()
-            stdout_text = stdout.read().decode('utf-8', errors='ignore')
-            stderr_text = stderr.read().decode('utf-8', errors='ignore')
+            with SSH_COMMAND_SECONDS.time("exec"):
+                stdin, stdout, stderr = self.client.exec_command(command, timeout=timeout)
+                exit_code = stdout.channel.recv_exit_status()
+                stdout_text = stdout.read().decode('utf-8', errors='ignore')
+                stderr_text = stderr.read().decode('utf-8', errors='ignore')
             return stdout_text, stderr_text, exit_code
         except Exception as e:
             logger.error(f"Chyba při provádění příkazu: {e}")
             raise ValueError(f"Chyba při provádění příkazu: {str(e)}")
     
+    def stream_command(self, command: str, timeout: float = 30) -> CommandStream:
+        """
+        Spustí příkaz v exec kanálu a vrací jeho průběžně čtený výstup.
+        
+        Volající čte výstup iterací a kanál zavře (context manager);
+        shell režim se nepoužije, každý příkaz má vlastní kanál.
+        """
+        if not self.is_connected():
+            raise ValueError("SSH není připojeno")
+        try:
+            return CommandStream(self.client.get_transport(), command, timeout=timeout)
+        except Exception as e:
+            logger.error(f"Chyba při spouštění příkazu: {e}")
+            raise ValueError(f"Chyba při provádění příkazu: {str(e)}")
+    
+    def run_streamed(self, command: str, output=None, timeout: float = 30,
+                     tail: int = SSH_STREAM_TAIL) -> tuple[str, str, int]:
+        """
+        Provede příkaz a jeho výstup průběžně předává příjemci `output`.
+        
+        Příjemce (např. events.CommandOutput) má metody write(stream, data),
+        flush() volanou, když příkaz chvíli nic nevypsal, a close(exit_code).
+        Pro výsledek se drží jen posledních `tail` bytů každého proudu,
+        paměť tedy neroste s délkou výstupu.
+        
+        Returns:
+            tuple (konec stdout, konec stderr, exit_code)
+        """
+        kept = {"stdout": bytearray(), "stderr": bytearray()}
+        exit_code = -1
+        try:
+            with SSH_COMMAND_SECONDS.time("stream"), self.stream_command(command, timeout) as stream:
+                while True:
+                    chunks = stream.read(SSH_STREAM_IDLE)
+                    if chunks is None:
+                        break
+                    for name, data in chunks:
+                        buffer = kept[name]
+                        buffer += data
+                        if len(buffer) > tail:
+                            del buffer[:len(buffer) - tail]
+                        if output is not None:
+                            output.write(name, data)
+                    if not chunks and output is not None:
+                        output.flush()
+                exit_code = stream.exit_code
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Chyba při provádění příkazu: {e}")
+            raise ValueError(f"Chyba při provádění příkazu: {str(e)}")
+        finally:
+            if output is not None:
+                output.close(exit_code)
+        return (
+            kept["stdout"].decode('utf-8', errors='ignore'),
+            kept["stderr"].decode('utf-8', errors='ignore'),
+            exit_code
+        )
+    
+    def _get_shell(self) -> Optional[ShellChannel]:
+        """Vrací živý shell kanál, případně otevře nový (None = použít exec kanál)."""
+        if self._shell is not None and self._shell.is_alive():
+            return self._shell
+        if self._shell is not None:
+            logger.warning("Shell kanál skončil, otevírám nový")
+            self._shell.close()
+            self._shell = None
+        if self._shell_unavailable:
+            return None
+        try:
+            self._shell = ShellChannel(self.client.get_transport())
+        except Exception as e:
+            # Shell nejde otevřít - do odpojení se používají exec kanály
+            logger.warning(f"Shell kanál nelze otevřít, používám exec kanály: {e}")
+            self._shell_unavailable = True
+        return self._shell
+    
+    def execute_batch(
+        self,
+        commands: list[str],
+        timeout: int = 30,
+        allow_failure: tuple[str, ...] = TOLERATED_FAILURES
+    ) -> list[tuple[str, str, int]]:
+        """
+        Provede sekvenci příkazů v jednom exec kanálu (jeden round trip).
+        
+        Každý krok je na stdout i stderr ohraničen značkou s exit codem,
+        takže výstupy zůstávají oddělené. Pokud krok selže a neobsahuje
+        žádný z podřetězců allow_failure, zbytek sekvence se nespustí.
+        
+        Returns:
+            list tuple (stdout, stderr, exit_code) pro každý provedený krok
+        """
+        if not self.is_connected():
+            raise ValueError("SSH není připojeno")
+        if not commands:
+            return []
+        
+        marker = f"__LGH_{uuid.uuid4().hex}__"
+        lines = []
+        stops = []
+        for i, cmd in enumerate(commands):
+            # Skupina { } na samostatných řádcích kvůli heredoc v příkazech
+            lines.append(f"{{\n{cmd}\n}} </dev/null")
+            lines.append(
+                f"__rc=$?; printf '\\n{marker} {i} %d\\n' $__rc; "
+                f"printf '\\n{marker} {i} %d\\n' $__rc >&2"
+            )
+            stops.append(not any(pattern in cmd for pattern in allow_failure))
+            if stops[-1]:
+                lines.append('[ $__rc -eq 0 ] || exit $__rc')
+        script = "\n".join(lines) + "\n"
+        
+        stdout_text, stderr_text, exit_code = self.execute_command(script, timeout=timeout)
+        return _split_batch_output(marker, stdout_text, stderr_text, exit_code, stops)
+    
+    def run_steps(
+        self,
+        commands: list[str],
+        error_message: str,
+        timeout: int = 30,
+        allow_failure: tuple[str, ...] = TOLERATED_FAILURES
+    ) -> list[tuple[str, str, int]]:
+        """
+        Provede příkazy dávkou a vyhodí ValueError u prvního netolerovaného selhání.
+        
+        Args:
+            error_message: Prefix chybové zprávy (doplní se stderr kroku)
+        """
+        results = self.execute_batch(commands, timeout=timeout, allow_failure=allow_failure)
+        for cmd, (stdout, stderr, exit_code) in zip(commands, results):
+            if exit_code != 0 and not any(pattern in cmd for pattern in allow_failure):
+                raise ValueError(f"{error_message}: {stderr}")
+        if len(results) < len(commands):
+            raise ValueError(f"{error_message}: sekvence příkazů nebyla dokončena")
+        return results
+    
     def disable_ssh_monitor(self) -> dict:
         """Vypne SSH monitor."""
         commands = [
@@ -110,30 +693,27 @@ class SSHSession:
             'echo "#!/bin/sh" >/tuya/ssh_monitor.sh'
         ]
         
-        for cmd in commands:
-            stdout, stderr, exit_code = self.execute_command(cmd)
-            if exit_code != 0:
-                raise ValueError(f"Chyba při vypínání SSH monitoru: {stderr}")
+        self.run_steps(commands, "Chyba při vypínání SSH monitoru")
         
         return {"status": "success", "message": "SSH monitor byl vypnut"}
     
-    def upload_file(self, local_path: str, remote_path: str) -> dict:
+    def upload_file(self, local_path: str, remote_path: str, callback: Optional[ProgressCallback] = None) -> dict:
         """
         Nahraje soubor na vzdálený server.
         
         Args:
             local_path: Cesta k lokálnímu souboru
             remote_path: Cesta na vzdáleném serveru
+            callback: Volitelný callback průběhu (odesláno, celkem)
         """
         if not self.is_connected() or not self.sftp:
             raise ValueError("SSH není připojeno")
         
         try:
-            # Získání velikosti souboru
-            file_size = os.path.getsize(local_path)
-            
             # Nahrání souboru
-            self.sftp.put(local_path, remote_path)
+            started = time.monotonic()
+            file_size = self.put_streamed(local_path, remote_path, callback)
+            _record_upload("sftp", file_size, file_size, time.monotonic() - started)
             
             # Nastavení oprávnění
             self.sftp.chmod(remote_path, 0o755)
@@ -144,6 +724,364 @@ class SSHSession:
             logger.error(f"Chyba při nahrávání souboru: {e}")
             raise ValueError(f"Chyba při nahrávání souboru: {str(e)}")
     
+    def put_streamed(
+        self,
+        local_path: str,
+        remote_path: str,
+        callback: Optional[ProgressCallback] = None,
+        request_size: int = SFTP_REQUEST_SIZE,
+        window: int = SFTP_PREFETCH_WINDOW,
+        sftp: Optional[paramiko.SFTPClient] = None
+    ) -> int:
+        """
+        Nahraje soubor po blocích s pipeliningem SFTP write požadavků.
+        
+        Na potvrzení každého bloku se nečeká, v letu je nejvýše `window`
+        požadavků po `request_size` bytech. Po každém bloku se volá callback.
+        Bez `sftp` se použije hlavní SFTP klient session.
+        
+        Returns:
+            počet odeslaných bytů
+        
+        Raises:
+            IOError: Pokud velikost souboru na zařízení nesouhlasí
+        """
+        sftp = sftp or self.sftp
+        request_size = max(1024, min(request_size, SFTPFile.MAX_REQUEST_SIZE))
+        window = max(1, window)
+        file_size = os.path.getsize(local_path)
+        sent = 0
+        blocks = 0
+        if callback:
+            callback(0, file_size)
+        with open(local_path, "rb") as local_file:
+            with sftp.open(remote_path, "wb", bufsize=0) as remote_file:
+                remote_file.set_pipelined(True)
+                while chunk := local_file.read(request_size):
+                    blocks += 1
+                    # Každý `window`-tý blok jde bez pipeliningu: paramiko u něj počká
+                    # na potvrzení všech nepotvrzených bloků a ověří jejich stav
+                    barrier = blocks % window == 0
+                    if barrier:
+                        remote_file.set_pipelined(False)
+                    remote_file.write(chunk)
+                    if barrier:
+                        remote_file.set_pipelined(True)
+                    sent += len(chunk)
+                    if callback:
+                        callback(sent, file_size)
+        # close() počká na potvrzení všech zbývajících požadavků
+        remote_size = sftp.stat(remote_path).st_size
+        if remote_size != sent:
+            raise IOError(f"Velikost nesouhlasí: odesláno {sent}, na zařízení {remote_size}")
+        return sent
+    
+    def remote_file_hash(self, remote_path: str) -> Optional[tuple[str, str]]:
+        """
+        Spočítá hash souboru na zařízení (busybox sha256sum, případně md5sum).
+        
+        sha256 má přednost, protože ho pro soubory z katalogu už máme spočítaný.
+        
+        Returns:
+            tuple (algoritmus, hash) nebo None, pokud hash nelze zjistit
+        """
+        path = shlex.quote(remote_path)
+        stdout, stderr, exit_code = self.execute_command(
+            f'h=$(sha256sum {path} 2>/dev/null) && echo "sha256 ${{h%% *}}" || '
+            f'{{ h=$(md5sum {path} 2>/dev/null) && echo "md5 ${{h%% *}}"; }}'
+        )
+        parts = stdout.split()
+        if exit_code != 0 or len(parts) != 2 or parts[0] not in ("md5", "sha256"):
+            return None
+        return parts[0], parts[1].lower()
+    
+    def put_gzip(
+        self,
+        local_path: str,
+        remote_path: str,
+        callback: Optional[ProgressCallback] = None,
+        timeout: int = 300,
+        sftp: Optional[paramiko.SFTPClient] = None
+    ) -> Optional[int]:
+        """
+        Nahraje gzip kopii souboru přes exec kanál do `gunzip -c > cíl`.
+        
+        Komprimovaná kopie se bere z lokální cache (podle sha256 souboru).
+        Po přenosu se výsledný soubor ověří hashem (sha256sum / md5sum),
+        případně aspoň velikostí. Callback dostává komprimované byty.
+        
+        Returns:
+            počet odeslaných (komprimovaných) bytů, nebo None pokud
+            na zařízení chybí gunzip
+        
+        Raises:
+            IOError: Pokud gunzip selže nebo soubor na zařízení nesouhlasí
+        """
+        artifact = compressed_artifact(local_path)
+        total = os.path.getsize(artifact)
+        sent = 0
+        if callback:
+            callback(0, total)
+        
+        channel = self.client.get_transport().open_session(timeout=timeout)
+        try:
+            channel.settimeout(timeout)
+            channel.exec_command(f"gunzip -c > {shlex.quote(remote_path)}")
+            with open(artifact, "rb") as f:
+                while chunk := f.read(SFTP_REQUEST_SIZE):
+                    channel.sendall(chunk)
+                    sent += len(chunk)
+                    if callback:
+                        callback(sent, total)
+            channel.shutdown_write()
+            if not channel.status_event.wait(timeout):
+                raise IOError("Vypršel časový limit rozbalení na zařízení")
+            exit_code = channel.recv_exit_status()
+            stderr = channel.makefile_stderr("rb").read().decode("utf-8", errors="replace").strip()
+        finally:
+            channel.close()
+        
+        if exit_code == 127:
+            self._gunzip_missing = True
+            logger.warning("Na zařízení chybí gunzip, používám SFTP")
+            return None
+        if exit_code != 0:
+            raise IOError(f"gunzip selhal ({exit_code}): {stderr}")
+        
+        remote_hash = self.remote_file_hash(remote_path)
+        if remote_hash is not None:
+            if remote_hash[1] != local_file_hash(local_path, remote_hash[0]):
+                raise IOError(f"Kontrolní součet {remote_hash[0]} souboru na zařízení nesouhlasí")
+        else:
+            remote_size = (sftp or self.sftp).stat(remote_path).st_size
+            if remote_size != os.path.getsize(local_path):
+                raise IOError(f"Velikost nesouhlasí: na zařízení {remote_size}")
+        return sent
+    
+    def sync_file(
+        self,
+        local_path: str,
+        remote_path: str,
+        mode: Optional[int] = 0o755,
+        callback: Optional[ProgressCallback] = None,
+        transfer: Optional[str] = None,
+        sftp: Optional[paramiko.SFTPClient] = None,
+        atomic: bool = False,
+        deadline: Optional[float] = None
+    ) -> dict:
+        """
+        Nahraje soubor jen tehdy, pokud se liší od souboru na zařízení.
+        
+        Nejdřív se porovná velikost (SFTP stat), při shodě hash vzdáleného
+        souboru s cachovaným hashem lokálního souboru.
+        
+        Args:
+            local_path: Cesta k lokálnímu souboru
+            remote_path: Cesta na vzdáleném serveru
+            mode: Oprávnění nastavená po nahrání (None = neměnit)
+            callback: Volitelný callback průběhu (odesláno, celkem)
+            transfer: Způsob přenosu "sftp" nebo "gzip" (výchozí SSH_TRANSFER_MODE)
+            sftp: SFTP klient pro přenos (výchozí hlavní klient session)
+            atomic: Nahrát do `<cíl>.part` a na místo přejmenovat až po chmod
+            deadline: Čas podle time.monotonic(), po kterém se přenos přeruší
+        
+        Returns:
+            dict se statusem, velikostí, informací, zda se data posílala,
+            způsobem přenosu, kompresním poměrem, dobou přenosu a propustností
+        """
+        if not self.is_connected() or not self.sftp:
+            raise ValueError("SSH není připojeno")
+        transfer = transfer or SSH_TRANSFER_MODE
+        if transfer not in TRANSFER_MODES:
+            raise ValueError(f"Neznámý způsob přenosu: {transfer}")
+        sftp = sftp or self.sftp
+        
+        try:
+            file_size = os.path.getsize(local_path)
+            try:
+                remote = sftp.stat(remote_path)
+            except IOError:
+                remote = None
+            
+            if remote is not None and remote.st_size == file_size:
+                remote_hash = self.remote_file_hash(remote_path)
+                if remote_hash is not None and remote_hash[1] == local_file_hash(local_path, remote_hash[0]):
+                    if mode is not None and (remote.st_mode or 0) & 0o777 != mode:
+                        sftp.chmod(remote_path, mode)
+                    logger.info(f"Soubor na zařízení je shodný, přeskakuji: {local_path} -> {remote_path}")
+                    return {"status": "success", "size": file_size, "transferred": False, "bytes_sent": 0}
+            
+            if deadline is not None:
+                callback = _with_deadline(callback, deadline)
+            target = f"{remote_path}.part" if atomic else remote_path
+            started = time.monotonic()
+            try:
+                bytes_sent = None
+                if transfer == "gzip" and not self._gunzip_missing:
+                    bytes_sent = self.put_gzip(local_path, target, callback, sftp=sftp)
+                if bytes_sent is None:
+                    transfer = "sftp"
+                    bytes_sent = self.put_streamed(local_path, target, callback, sftp=sftp)
+                if mode is not None:
+                    sftp.chmod(target, mode)
+                if atomic:
+                    self._rename_into_place(sftp, target, remote_path)
+            except Exception as e:
+                # Nedokončený soubor se nenechá na zařízení (u atomic zůstane původní cíl)
+                if atomic or isinstance(e, OperationCancelled):
+                    _remove_quietly(sftp, target)
+                raise
+            elapsed = time.monotonic() - started
+            _record_upload(transfer, file_size, bytes_sent, elapsed)
+            logger.info(f"Soubor nahrán ({transfer}): {local_path} -> {remote_path} ({file_size} bytes, odesláno {bytes_sent}, {elapsed:.2f} s)")
+            return {
+                "status": "success",
+                "size": file_size,
+                "transferred": True,
+                "bytes_sent": bytes_sent,
+                "transfer": transfer,
+                "compression_ratio": round(file_size / bytes_sent, 2) if bytes_sent else None,
+                "elapsed_ms": round(elapsed * 1000, 1),
+                "throughput_bps": round(file_size / elapsed) if elapsed > 0 else None,
+            }
+        except OperationCancelled:
+            logger.info(f"Nahrávání zrušeno: {local_path} -> {remote_path}")
+            raise
+        except Exception as e:
+            logger.error(f"Chyba při nahrávání souboru: {e}")
+            raise ValueError(f"Chyba při nahrávání souboru: {str(e)}")
+    
+    def _close_spare_sftp(self):
+        """Zavře další SFTP kanály pro souběžné nahrávání."""
+        spare, self._spare_sftp = self._spare_sftp, []
+        for sftp in spare:
+            _close_quietly(sftp)
+    
+    def _reopen_sftp(self):
+        """Otevře nový hlavní SFTP kanál session (po přerušení přenosu zavřením kanálu)."""
+        try:
+            self.sftp = self.client.open_sftp()
+        except Exception as e:
+            logger.warning(f"SFTP kanál nelze znovu otevřít: {e}")
+            self.sftp = None
+    
+    def _rename_into_place(self, sftp: paramiko.SFTPClient, temp_path: str, remote_path: str):
+        """Atomicky přejmenuje nahraný soubor na cílovou cestu (přepíše existující)."""
+        try:
+            sftp.posix_rename(temp_path, remote_path)
+        except IOError:
+            # SFTP server bez rozšíření posix-rename (rename v SFTPv3 existující soubor nepřepíše)
+            stdout, stderr, exit_code = self.execute_command(
+                f"mv -f {shlex.quote(temp_path)} {shlex.quote(remote_path)}"
+            )
+            if exit_code != 0:
+                raise IOError(f"Přejmenování {temp_path} selhalo: {stderr.strip()}")
+    
+    def sync_files(
+        self,
+        files: list[tuple[str, str, Optional[int]]],
+        callback: Optional[Callable[[str, int, int], None]] = None,
+        transfer: Optional[str] = None,
+        timeout: float = SFTP_UPLOAD_DEADLINE
+    ) -> dict:
+        """
+        Nahraje několik souborů souběžně, každý po vlastním SFTP kanálu stejného transportu.
+        
+        Každý soubor se nahraje do `<cíl>.part`, nastaví se mu oprávnění
+        a teprve pak se přejmenuje na místo, chmod jednoho souboru tak běží
+        souběžně s přenosem ostatních. Přenosy, které nestihnou `timeout`,
+        se přeruší zavřením jejich kanálu.
+        
+        Args:
+            files: Seznam (lokální cesta, cesta na zařízení, oprávnění nebo None)
+            callback: Volitelný callback průběhu (název souboru, odesláno, celkem)
+            transfer: Způsob přenosu "sftp" nebo "gzip" (výchozí SSH_TRANSFER_MODE)
+            timeout: Celkový časový limit v sekundách
+        
+        Returns:
+            dict s výsledky jednotlivých souborů (podle názvu souboru),
+            celkovým počtem odeslaných bytů, dobou a propustností
+        
+        Raises:
+            ValueError: Pokud session není připojená, přenos selže nebo nestihne limit
+        """
+        if not self.is_connected() or not self.sftp:
+            raise ValueError("SSH není připojeno")
+        deadline = time.monotonic() + timeout
+        started = time.monotonic()
+        transport = self.client.get_transport()
+        # Největší soubor jde po hlavním SFTP kanálu session, ostatní po dalších kanálech
+        largest = max(range(len(files)), key=lambda i: os.path.getsize(files[i][0]), default=0)
+        clients: list[paramiko.SFTPClient] = [self.sftp]
+        
+        def upload(index: int, local_path: str, remote_path: str, mode: Optional[int], file_callback) -> dict:
+            if index == largest:
+                sftp = self.sftp
+            else:
+                try:
+                    sftp = self._spare_sftp.pop()
+                except IndexError:
+                    # Kanál se otevírá ve vlákně přenosu, otevírání se tak překrývá s ostatními přenosy
+                    try:
+                        sftp = paramiko.SFTPClient.from_transport(transport)
+                    except Exception as e:
+                        raise ValueError(f"SFTP kanál nelze otevřít: {str(e)}")
+                clients.append(sftp)
+            return self.sync_file(local_path, remote_path, mode, file_callback, transfer, sftp, True, deadline)
+        
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(files)), thread_name_prefix="sftp-upload")
+        futures: dict[concurrent.futures.Future, str] = {}
+        succeeded = False
+        try:
+            for index, (local_path, remote_path, mode) in enumerate(files):
+                name = os.path.basename(local_path)
+                # Vlákno přenosu dědí kontext volajícího (log záznamy patří k běžící úloze)
+                futures[pool.submit(
+                    contextvars.copy_context().run, upload, index, local_path, remote_path, mode,
+                    functools.partial(callback, name) if callback else None
+                )] = name
+            done, pending = concurrent.futures.wait(
+                futures, timeout=max(0.0, deadline - time.monotonic()),
+                return_when=concurrent.futures.FIRST_EXCEPTION
+            )
+            if pending:
+                # Chyba nebo vypršený limit - zavření kanálů přeruší zbývající přenosy
+                for sftp in clients:
+                    _close_quietly(sftp)
+                concurrent.futures.wait(pending, timeout=5)
+                self._reopen_sftp()
+            for future in done:
+                if future.exception() is not None:
+                    raise future.exception()
+            if pending:
+                names = ", ".join(futures[f] for f in pending)
+                raise ValueError(f"Nahrávání nestihlo časový limit {timeout:.0f} s: {names}")
+            succeeded = True
+        finally:
+            pool.shutdown(wait=False)
+            if succeeded:
+                # Další kanály zůstanou otevřené pro příští nahrávání
+                self._spare_sftp.extend(clients[1:])
+            else:
+                for sftp in clients[1:]:
+                    _close_quietly(sftp)
+                # Přenosy přerušené zavřením kanálu po sobě .part soubory neuklidí
+                if self.sftp is not None:
+                    for _, remote_path, _ in files:
+                        _remove_quietly(self.sftp, f"{remote_path}.part")
+        
+        elapsed = time.monotonic() - started
+        results = {futures[f]: f.result() for f in futures}
+        bytes_sent = sum(r["bytes_sent"] for r in results.values())
+        size = sum(r["size"] for r in results.values() if r["transferred"])
+        logger.info(f"Souběžně nahráno {len(results)} souborů: odesláno {bytes_sent} bytes za {elapsed:.2f} s")
+        return {
+            "files": results,
+            "bytes_sent": bytes_sent,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "throughput_bps": round(size / elapsed) if elapsed > 0 else None,
+        }
+    
     def update_tuya_start(self) -> dict:
         """Upraví tuya_start.sh pro spuštění serialgateway."""
         commands = [
@@ -154,10 +1092,7 @@ class SSHSession:
 EOF'''
         ]
         
-        for cmd in commands:
-            stdout, stderr, exit_code = self.execute_command(cmd)
-            if exit_code != 0:
-                raise ValueError(f"Chyba při úpravě tuya_start.sh: {stderr}")
+        self.run_steps(commands, "Chyba při úpravě tuya_start.sh")
         
         return {"status": "success", "message": "tuya_start.sh byl upraven"}
     
@@ -168,11 +1103,8 @@ EOF'''
             f'ifconfig eth1 {ip}'
         ]
         
-        for cmd in commands:
-            stdout, stderr, exit_code = self.execute_command(cmd)
-            # killall může vrátit exit code 1 pokud proces neběží, to je OK
-            if exit_code != 0 and 'killall' not in cmd:
-                raise ValueError(f"Chyba při nastavení statické IP: {stderr}")
+        # killall může vrátit exit code 1 pokud proces neběží, to je OK
+        self.run_steps(commands, "Chyba při nastavení statické IP")
         
         return {"status": "success", "message": f"Statická IP nastavena na {ip}"}
     
@@ -188,34 +1120,307 @@ EOF'''
             # I když příkaz selže, odpojíme session
             self.disconnect()
             return {"status": "rebooting", "message": "Zařízení se restartuje"}
+    
+    def boot_id(self) -> Optional[str]:
+        """Vrací identifikátor aktuálního bootu zařízení (mění se při každém startu)."""
+        stdout, stderr, exit_code = self.execute_command(
+            'cat /proc/sys/kernel/random/boot_id', timeout=5
+        )
+        value = stdout.strip()
+        return value if exit_code == 0 and value else None
+    
+    def device_state(self, refresh: bool = False) -> dict:
+        """
+        Vrací snapshot stavu zařízení (SSH monitor, tuya_start.sh, serialgateway, eth1).
+        
+        Stav se zjistí jedním příkazem a drží se v cache session, dokud ho
+        nezneplatní změna (invalidate_device_state) nebo neuplyne
+        DEVICE_STATE_MAX_AGE sekund.
+        
+        Args:
+            refresh: Zjistit stav znovu i při platné cache
+        """
+        if not refresh:
+            cached = self.cached_device_state()
+            if cached is not None:
+                return cached
+        started = time.perf_counter()
+        stdout, stderr, exit_code = self.execute_command(DEVICE_STATE_SCRIPT, timeout=15)
+        if exit_code != 0:
+            raise ValueError(f"Chyba při zjišťování stavu zařízení: {stderr.strip() or exit_code}")
+        state = _parse_device_state(stdout)
+        state["host"] = self.host
+        state["probed_at"] = time.time()
+        state["probe_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        self._device_state = state
+        self._device_state_at = time.monotonic()
+        return dict(state, cached=False, age_s=0.0)
+    
+    def cached_device_state(self) -> Optional[dict]:
+        """Snapshot stavu zařízení z cache session, None pokud chybí nebo je starý."""
+        state = self._device_state
+        age = time.monotonic() - self._device_state_at
+        if state is None or age > DEVICE_STATE_MAX_AGE:
+            return None
+        return dict(state, cached=True, age_s=round(age, 1))
+    
+    def invalidate_device_state(self):
+        """Zahodí snapshot stavu zařízení (po operaci, která zařízení mění)."""
+        self._device_state = None
+    
+    def reboot_and_reconnect(self, timeout: float = REBOOT_WAIT_TIMEOUT) -> dict:
+        """
+        Restartuje zařízení, počká na jeho návrat a znovu se připojí.
+        
+        Po příkazu reboot se port 22 zkouší s exponenciálním backoffem
+        (s náhodným rozptylem), po úspěšném spojení se session připojí
+        s uloženým heslem. Že restart opravdu proběhl, se ověří podle
+        boot_id (případně uptime).
+        
+        Returns:
+            dict se statusem, dobou restartu a počtem pokusů
+        
+        Raises:
+            ValueError: Pokud session není připojená nebo se zařízení nevrátí včas
+        """
+        if not self.is_connected() or not self._password:
+            raise ValueError("SSH není připojeno")
+        host, port, password = self.host, self.port, self._password
+        try:
+            old_boot_id = self.boot_id()
+        except Exception:
+            old_boot_id = None
+        
+        started = time.monotonic()
+        self.reboot()
+        self._set_state(STATE_REBOOTING)
+        logger.info(f"Čekám na návrat zařízení {host}:{port} po restartu")
+        
+        deadline = started + timeout
+        delay = REBOOT_PROBE_INITIAL
+        probes = 0
+        went_down = False
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._set_state(STATE_LOST)
+                raise ValueError(f"Zařízení {host}:{port} se po restartu nevrátilo do {timeout:.0f} s")
+            # Exponenciální backoff s rozptylem (zařízení ve flotile se nepřipojují naráz)
+            time.sleep(min(random.uniform(delay / 2, delay), remaining))
+            delay = min(delay * 2, REBOOT_PROBE_MAX)
+            probes += 1
+            if not probe_port(host, port, timeout=min(3.0, max(0.1, deadline - time.monotonic()))):
+                went_down = True
+                continue
+            if old_boot_id is None and not went_down and delay < REBOOT_PROBE_MAX:
+                # Bez boot_id nejde poznat, že restart proběhl - port ještě odpovídá,
+                # zařízení se nejspíš teprve vypíná (rychlý restart rozhodne boot_id níže)
+                continue
+            try:
+                self.connect(host, port, password, timeout=min(30, max(1, int(deadline - time.monotonic()))))
+            except ValueError:
+                # sshd ještě nestartoval úplně, zkusíme později
+                continue
+            try:
+                rebooted = old_boot_id is None or self.boot_id() != old_boot_id
+            except ValueError:
+                rebooted = False
+            if not rebooted:
+                logger.info("Zařízení se zatím nerestartovalo, čekám dál")
+                self.disconnect()
+                self._set_state(STATE_REBOOTING)
+                went_down = False
+                continue
+            break
+        
+        duration = time.monotonic() - started
+        self.last_reboot = {"duration_s": round(duration, 1), "probes": probes, "finished_at": time.time()}
+        logger.info(f"Zařízení {host}:{port} se restartovalo za {duration:.1f} s ({probes} pokusů), session znovu připojena")
+        return {
+            "status": "success",
+            "message": f"Zařízení se restartovalo a session je znovu připojena ({duration:.0f} s)",
+            "reboot_duration_s": round(duration, 1),
+            "probes": probes,
+        }
 
 
-def get_available_files() -> list[str]:
-    """Vrací seznam dostupných binárních souborů."""
-    if not os.path.exists(BINARIES_PATH):
-        return []
+class _Ping:
+    """
+    Kontrola spojení: global request s odpovědí ve vlastním vlákně.
     
+    global_request čeká bez časového limitu, dokud transport žije; vlákno
+    proto skončí odpovědí nebo zavřením transportu (nereagující spojení
+    zavře ping_finish po SSH_PING_MAX_MISSES kontrolách bez odpovědi).
+    """
+
+    def __init__(self, transport: paramiko.Transport):
+        self.sent_at = time.monotonic()
+        self.answered_at: Optional[float] = None
+        self.done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(transport,), daemon=True, name="ssh-ping")
+        self._thread.start()
+
+    def _run(self, transport: paramiko.Transport):
+        try:
+            # None vrací i odmítnutí požadavku - odpověď přišla, pokud transport žije
+            transport.global_request("keepalive@openssh.com", wait=True)
+            if transport.is_active():
+                self.answered_at = time.monotonic()
+        except Exception as e:
+            logger.debug(f"Kontrola spojení selhala: {e}")
+        finally:
+            self.done.set()
+
+    def wait(self, timeout: float) -> bool:
+        """Počká nejvýše `timeout` sekund, True pokud server odpověděl."""
+        self.done.wait(timeout)
+        return self.answered_at is not None
+
+
+def _record_upload(transfer: str, size: int, bytes_sent: int, elapsed: float):
+    """Zaznamená odeslané byty, dobu a propustnost nahrání do metrik."""
+    UPLOAD_BYTES.inc(transfer, amount=bytes_sent)
+    UPLOAD_SECONDS.observe(elapsed, transfer)
+    if elapsed > 0:
+        UPLOAD_THROUGHPUT.observe(size / elapsed, transfer)
+
+
+def _with_deadline(callback: Optional[ProgressCallback], deadline: float) -> ProgressCallback:
+    """Obalí callback průběhu kontrolou časového limitu (přeruší přenos výjimkou)."""
+    def wrapped(sent: int, total: int):
+        if time.monotonic() > deadline:
+            raise TimeoutError("Vypršel časový limit nahrávání")
+        if callback:
+            callback(sent, total)
+    return wrapped
+
+
+def _remove_quietly(sftp: paramiko.SFTPClient, remote_path: str):
+    """Smaže soubor na zařízení, chyby ignoruje (úklid po nepovedeném přenosu)."""
+    try:
+        sftp.remove(remote_path)
+    except Exception:
+        pass
+
+
+def _close_quietly(sftp: paramiko.SFTPClient):
+    try:
+        sftp.close()
+    except Exception:
+        pass
+
+
+def probe_port(host: str, port: int, timeout: float = 3.0) -> bool:
+    """Zjistí, zda na host:port lze navázat TCP spojení."""
     try:
-        files = []
-        for filename in os.listdir(BINARIES_PATH):
-            filepath = os.path.join(BINARIES_PATH, filename)
-            if os.path.isfile(filepath):
-                files.append(filename)
-        return sorted(files)
-    except Exception as e:
-        logger.error(f"Chyba při čtení souborů: {e}")
-        return []
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def _split_batch_output(
+    marker: str,
+    stdout_text: str,
+    stderr_text: str,
+    exit_code: int,
+    stops: list[bool]
+) -> list[tuple[str, str, int]]:
+    """
+    Rozdělí výstup dávky podle značek na výsledky jednotlivých kroků.
+    
+    Args:
+        stops: Pro každý krok, zda jeho selhání ukončí sekvenci
+    """
+    pattern = re.compile(rf"\n{marker} (\d+) (-?\d+)\n")
+    # split vrací [výstup, index, exit code, výstup, index, exit code, ..., zbytek]
+    out_parts = pattern.split(stdout_text)
+    err_parts = pattern.split(stderr_text)
+    results = []
+    for n in range(len(out_parts) // 3):
+        step_stderr = err_parts[n * 3] if n * 3 < len(err_parts) else ""
+        results.append((out_parts[n * 3], step_stderr, int(out_parts[n * 3 + 2])))
+    
+    done = len(results)
+    if done == len(stops) or (done and results[-1][2] != 0 and stops[done - 1]):
+        return results
+    # Shell skončil uprostřed kroku bez značky - zbytek výstupu patří tomuto kroku
+    rest_stderr = err_parts[-1] if len(err_parts) % 3 == 1 else ""
+    results.append((out_parts[-1], rest_stderr, exit_code if exit_code != 0 else -1))
+    return results
+
+
+def _parse_device_state(stdout: str) -> dict:
+    """Převede výstup DEVICE_STATE_SCRIPT na strukturovaný snapshot stavu zařízení."""
+    exists = set()
+    values = {}
+    for line in stdout.splitlines():
+        key, _, value = line.strip().partition(" ")
+        if key == "exists":
+            exists.add(value)
+        elif key:
+            values[key] = value.strip()
+
+    def count(key: str) -> int:
+        value = values.get(key, "")
+        return int(value) if value.isdigit() else 0
+
+    def pids(key: str) -> list[int]:
+        return [int(pid) for pid in values.get(key, "").split() if pid.isdigit()]
+
+    monitor_present = "/tuya/ssh_monitor.sh" in exists
+    serialgateway_pids = pids("serialgateway_pids")
+    installed = "/tuya/serialgateway" in exists
+    parked = "/tuya/serialgateway_norun" in exists
+    if serialgateway_pids:
+        serialgateway_state = "running"
+    elif installed:
+        serialgateway_state = "stopped"
+    elif parked:
+        serialgateway_state = "parked"
+    else:
+        serialgateway_state = "missing"
+    address = re.search(r"inet (?:addr:)?([0-9.]+)", values.get("eth1", ""))
+    netmask = re.search(r"(?:Mask:|netmask )([0-9.]+)", values.get("eth1", ""))
+    udhcpc_pids = pids("udhcpc_pids")
+    return {
+        "ssh_monitor": {
+            "present": monitor_present,
+            "disabled": not monitor_present or count("monitor_lines") == 0,
+            "backup": "/tuya/ssh_monitor.original.sh" in exists,
+        },
+        "tuya_start": {
+            "present": "/tuya/tuya_start.sh" in exists,
+            "serialgateway": count("autostart") > 0,
+            "backup": "/tuya/tuya_start.original.sh" in exists,
+        },
+        "serialgateway": {
+            "state": serialgateway_state,
+            "installed": installed,
+            "parked": parked,
+            "running": bool(serialgateway_pids),
+            "pids": serialgateway_pids,
+        },
+        "network": {
+            "interface": "eth1",
+            "ip": address.group(1) if address else None,
+            "netmask": netmask.group(1) if netmask else None,
+            "dhcp": bool(udhcpc_pids),
+            "udhcpc_pids": udhcpc_pids,
+        },
+        "boot_id": values.get("boot_id") or None,
+    }
+
+
+def get_available_files() -> list[str]:
+    """Vrací seznam dostupných binárních souborů."""
+    return catalog.names()
 
 
 def get_file_path(filename: str) -> str:
     """Vrací plnou cestu k souboru."""
-    filepath = os.path.join(BINARIES_PATH, filename)
-    # Bezpečnostní kontrola
-    if not os.path.abspath(filepath).startswith(os.path.abspath(BINARIES_PATH)):
-        raise ValueError("Neplatná cesta k souboru")
-    if not os.path.exists(filepath):
-        raise ValueError(f"Soubor {filename} neexistuje")
-    return filepath
+    # Katalog obsahuje jen soubory přímo v adresáři binaries (žádné cesty mimo něj)
+    return catalog.get(filename).path
 
 
 class FirmwareUpgrade:
@@ -231,53 +1436,128 @@ class FirmwareUpgrade:
             'killall serialgateway'
         ]
         
-        for cmd in commands:
-            stdout, stderr, exit_code = self.session.execute_command(cmd)
-            # killall může vrátit exit code 1 pokud proces neběží, to je OK
-            if exit_code != 0 and 'killall' not in cmd:
-                raise ValueError(f"Chyba při zastavování serialgateway: {stderr}")
+        # killall může vrátit exit code 1 pokud proces neběží, to je OK
+        self.session.run_steps(commands, "Chyba při zastavování serialgateway")
         
         logger.info("serialgateway byl zastaven")
         return {"status": "success", "message": "serialgateway byl zastaven"}
     
-    def upload_upgrade_files(self, firmware_filename: str) -> dict:
+    def upload_upgrade_files(
+        self,
+        firmware_filename: str,
+        callback: Optional[Callable[[str, int, int], None]] = None,
+        transfer: Optional[str] = None,
+        parallel: Optional[bool] = None
+    ) -> dict:
         """
         Nahraje soubory potřebné pro upgrade.
         
         Args:
             firmware_filename: Název firmware souboru (.gbl)
+            callback: Volitelný callback průběhu (název souboru, odesláno, celkem)
+            transfer: Způsob přenosu "sftp" nebo "gzip" (výchozí SSH_TRANSFER_MODE)
+            parallel: Nahrát oba soubory souběžně po samostatných SFTP kanálech
+                (výchozí SFTP_PARALLEL_UPLOADS)
+        
+        Raises:
+            ValueError: Firmware není platný GBL obraz (kontroluje se před přenosem)
         """
+        check_firmware(firmware_filename)
         if not self.session.is_connected() or not self.session.sftp:
             raise ValueError("SSH není připojeno")
+        if parallel is None:
+            parallel = SFTP_PARALLEL_UPLOADS
         
         try:
-            # Nahrání sx.bin
             sx_path = get_file_path("sx.bin")
-            self.session.sftp.put(sx_path, "/tmp/sx")
-            self.session.sftp.chmod("/tmp/sx", 0o755)
-            
-            # Nahrání firmware
             firmware_path = get_file_path(firmware_filename)
-            self.session.sftp.put(firmware_path, "/tmp/firmware.gbl")
+            started = time.monotonic()
+            if parallel:
+                # Soubory se přeskočí, pokud jsou na zařízení shodné
+                result = self.session.sync_files(
+                    [(sx_path, "/tmp/sx", 0o755), (firmware_path, "/tmp/firmware.gbl", None)],
+                    callback=callback, transfer=transfer
+                )
+                sx_result = result["files"]["sx.bin"]
+                firmware_result = result["files"][os.path.basename(firmware_path)]
+            else:
+                # Nahrání sx.bin (přeskočí se, pokud je na zařízení shodný)
+                sx_result = self.session.sync_file(
+                    sx_path, "/tmp/sx", mode=0o755,
+                    callback=functools.partial(callback, "sx.bin") if callback else None,
+                    transfer=transfer
+                )
+                
+                # Nahrání firmware
+                firmware_result = self.session.sync_file(
+                    firmware_path, "/tmp/firmware.gbl", mode=None,
+                    callback=functools.partial(callback, firmware_filename) if callback else None,
+                    transfer=transfer
+                )
+            elapsed = time.monotonic() - started
             
-            logger.info(f"Upgrade soubory nahrány: sx.bin a {firmware_filename}")
-            return {"status": "success", "message": f"Soubory sx.bin a {firmware_filename} byly nahrány"}
+            files = (("sx.bin", sx_result), (firmware_filename, firmware_result))
+            skipped = [name for name, result in files if not result["transferred"]]
+            size = sum(result["size"] for name, result in files if result["transferred"])
+            throughput = round(size / elapsed) if elapsed > 0 else None
+            message = f"Soubory sx.bin a {firmware_filename} byly nahrány"
+            if skipped:
+                message += f" (na zařízení již shodné: {', '.join(skipped)})"
+            logger.info(
+                f"Upgrade soubory nahrány{' souběžně' if parallel else ''}: sx.bin a {firmware_filename} "
+                f"za {elapsed:.2f} s ({throughput or 0} B/s)"
+            )
+            return {
+                "status": "success",
+                "message": message,
+                "bytes_sent": sx_result["bytes_sent"] + firmware_result["bytes_sent"],
+                "parallel": parallel,
+                "elapsed_ms": round(elapsed * 1000, 1),
+                "throughput_bps": throughput,
+                "files": dict(files)
+            }
         except FileNotFoundError as e:
             logger.error(f"Soubor nenalezen: {e}")
             raise ValueError(f"Soubor nenalezen: {str(e)}")
+        except OperationCancelled:
+            raise
         except Exception as e:
             logger.error(f"Chyba při nahrávání upgrade souborů: {e}")
             raise ValueError(f"Chyba při nahrávání souborů: {str(e)}")
     
-    def perform_upgrade(self, ezsp_version: str = "V7") -> dict:
+    def flash_firmware(
+        self,
+        ezsp_version: str = "V7",
+        output=None,
+        engine: Optional[str] = None,
+        firmware_filename: Optional[str] = None,
+        callback: Optional[Callable[[str, int, int], None]] = None
+    ) -> dict:
         """
-        Provede upgrade firmware Zigbee modulu.
+        Přepne Zigbee modul do bootloaderu a nahraje do něj firmware (bez rebootu).
         
         Args:
             ezsp_version: Verze EZSP (V7 nebo V8)
+            output: Volitelný příjemce průběžného výstupu sx (viz SSHSession.run_streamed)
+            engine: "device" (nahraný sx na gateway) nebo "host" (XMODEM z aplikace,
+                bez nahrání souborů do /tmp), výchozí FLASH_ENGINE
+            firmware_filename: Firmware soubor (.gbl) pro engine "host"; u "device" se jen
+                zkontroluje lokální obraz stejného jména
+            callback: Volitelný callback průběhu pro engine "host" (název souboru, odesláno, celkem)
         """
         if ezsp_version not in ["V7", "V8"]:
             raise ValueError("EZSP verze musí být V7 nebo V8")
+        engine = engine or FLASH_ENGINE
+        if engine not in FLASH_ENGINES:
+            raise ValueError(f"Neznámý způsob nahrání firmware: {engine}")
+        firmware_path = None
+        if engine == "host" and not firmware_filename:
+            raise ValueError("Pro nahrání firmware z aplikace je nutné zvolit firmware soubor")
+        if firmware_filename:
+            # Chybný obraz se odmítne dřív, než se modul přepne do bootloaderu
+            check_firmware(firmware_filename)
+            if engine == "host":
+                firmware_path = get_file_path(firmware_filename)
         
         # Konfigurační frame podle verze
         if ezsp_version == "V8":
@@ -297,22 +1577,70 @@ class FirmwareUpgrade:
             '/tmp/sx /tmp/firmware.gbl < /dev/ttyS1 > /dev/ttyS1'
         ]
         
+        if engine == "host":
+            # Volbu "1" v menu bootloaderu pošle až most, aby výzvu přijímače nic nezahodilo
+            self.session.run_steps(commands[:-2], "Chyba při upgrade", timeout=120)
+            stats = self._send_from_host(
+                firmware_path, functools.partial(callback, firmware_filename) if callback else None
+            )
+            return {
+                "status": "success",
+                "message": "Firmware byl nahrán do Zigbee modulu",
+                "engine": engine,
+                "xmodem": stats,
+            }
+        
+        # Přepnutí do bootloaderu v jednom kanálu, sx ve vlastním kanálu
+        # s průběžným výstupem (přenos trvá minuty); chybu sx ignorujeme
+        self.session.run_steps(commands[:-1], "Chyba při upgrade", timeout=120)
+        stdout, stderr, exit_code = self.session.run_streamed(commands[-1], output, timeout=120)
+        if exit_code != 0:
+            logger.info("Upgrade probíhá, může trvat několik minut...")
+        return {"status": "success", "message": "Firmware byl nahrán do Zigbee modulu", "engine": engine}
+    
+    def _send_from_host(self, firmware_path: str, callback: Optional[ProgressCallback] = None) -> dict:
+        """Pošle firmware do bootloaderu XMODEM přes most na /dev/ttyS1 a vrací statistiky přenosu."""
+        if not self.session.is_connected():
+            raise ValueError("SSH není připojeno")
+        with open(firmware_path, "rb") as f:
+            data = f.read()
+        with SerialBridge(self.session.client.get_transport(), "/dev/ttyS1") as port:
+            # Volba "upload gbl" v menu bootloaderu
+            port.write(b"1\n")
+            stats = XmodemSender(port).send(data, callback)
+        _record_upload("xmodem", len(data), stats["sent_blocks"] * (stats["block_size"] + 5), stats["duration_s"])
+        return stats
+    
+    def perform_upgrade(
+        self,
+        ezsp_version: str = "V7",
+        output=None,
+        engine: Optional[str] = None,
+        firmware_filename: Optional[str] = None,
+        callback: Optional[Callable[[str, int, int], None]] = None
+    ) -> dict:
+        """
+        Provede upgrade firmware Zigbee modulu.
+        
+        Args:
+            ezsp_version: Verze EZSP (V7 nebo V8)
+            output: Volitelný příjemce průběžného výstupu sx
+            engine, firmware_filename, callback: viz flash_firmware
+        """
+        if ezsp_version not in ["V7", "V8"]:
+            raise ValueError("EZSP verze musí být V7 nebo V8")
+        
         try:
-            for i, cmd in enumerate(commands):
-                stdout, stderr, exit_code = self.session.execute_command(cmd, timeout=120 if '/tmp/sx' in cmd else 60)
-                if exit_code != 0:
-                    # Poslední příkaz (sx) může trvat déle a může skončit s chybou, ignorujeme
-                    if '/tmp/sx' in cmd:
-                        logger.info("Upgrade probíhá, může trvat několik minut...")
-                        # Počkáme chvíli a pak reboot
-                        break
-                    else:
-                        raise ValueError(f"Chyba při upgrade: {stderr}")
+            result = self.flash_firmware(ezsp_version, output, engine, firmware_filename, callback)
             
             # Reboot po upgrade
             logger.info("Upgrade dokončen, spouštím reboot...")
             self.session.reboot()
-            return {"status": "success", "message": "Upgrade dokončen, zařízení se restartuje"}
+            return {
+                **result,
+                "status": "success",
+                "message": "Upgrade dokončen, zařízení se restartuje",
+            }
         except Exception as e:
             logger.error(f"Chyba při upgrade firmware: {e}")
             raise ValueError(f"Chyba při upgrade: {str(e)}")
@@ -0,0 +1,329 @@
+"""
+Profily SSH spojení: pořadí algoritmů handshaku a cache host klíčů gateway.
+
+Na slabém CPU gateway zabere většinu doby připojení výměna klíčů a podpis
+host klíčem. Profil určuje, které kex, šifry, MAC a typy host klíče klient
+nabízí přednostně (ostatní podporované algoritmy zůstávají za nimi, profil
+tedy jen mění pořadí a nikdy nezpůsobí nekompatibilitu). Host klíče
+gateway se ukládají do souboru ve formátu known_hosts; klient pak nabízí
+nejdřív typ klíče, který od gateway už zná, a ověří, že se klíč nezměnil.
+"""
+import os
+import socket
+import threading
+import time
+from typing import Optional, Sequence
+import logging
+
+import paramiko
+
+from app.catalog import APP_ROOT
+from app.metrics import histogram
+
+logger = logging.getLogger(__name__)
+
+
+def _env_list(name: str) -> tuple[str, ...]:
+    return tuple(item.strip() for item in os.environ.get(name, "").split(",") if item.strip())
+
+
+# Profil SSH spojení: "fast" (výchozí, levný handshake pro slabé CPU) nebo "paramiko" (pořadí knihovny)
+SSH_PROFILE = os.environ.get("SSH_PROFILE", "fast")
+# Vlastní preferované algoritmy (čárkou oddělené, mají přednost před profilem)
+SSH_KEX = _env_list("SSH_KEX")
+SSH_CIPHERS = _env_list("SSH_CIPHERS")
+SSH_MACS = _env_list("SSH_MACS")
+SSH_HOST_KEY_TYPES = _env_list("SSH_HOST_KEY_TYPES")
+
+# Soubor s host klíči gateway (prázdné = jen v paměti procesu)
+SSH_KNOWN_HOSTS = os.environ.get("SSH_KNOWN_HOSTS", os.path.join(APP_ROOT, "data", "known_hosts"))
+# Odmítnout spojení, když gateway předloží jiný host klíč, než je uložený (1 = odmítnout)
+SSH_STRICT_HOST_KEYS = os.environ.get("SSH_STRICT_HOST_KEYS", "0") == "1"
+
+# Fáze navázání spojení pro metriky a log
+HANDSHAKE_PHASES = ("tcp", "kex", "auth", "sftp")
+
+SSH_HANDSHAKE_SECONDS = histogram(
+    "ssh_handshake_phase_seconds", "Doba fáze navázání SSH spojení", ("phase", "profile")
+)
+
+# Algoritmy podpisu podle typu uloženého host klíče
+_KEY_ALGORITHMS = {
+    "ssh-rsa": ("rsa-sha2-256", "rsa-sha2-512", "ssh-rsa"),
+}
+
+
+def _prefer(preferred: Sequence[str], available: Sequence[str]) -> tuple[str, ...]:
+    """Podporované algoritmy z `preferred` napřed, zbytek v původním pořadí."""
+    first = [name for name in preferred if name in available]
+    return tuple(first + [name for name in available if name not in first])
+
+
+class ConnectionProfile:
+    """
+    Preferované algoritmy SSH handshaku.
+
+    Args:
+        name: Název profilu (label metrik, log)
+        kex: Výměna klíčů
+        ciphers: Šifry
+        macs: MAC algoritmy
+        host_key_types: Typy host klíče (algoritmy podpisu)
+    """
+
+    def __init__(self, name: str, kex: Sequence[str] = (), ciphers: Sequence[str] = (),
+                 macs: Sequence[str] = (), host_key_types: Sequence[str] = ()):
+        self.name = name
+        self.kex = tuple(kex)
+        self.ciphers = tuple(ciphers)
+        self.macs = tuple(macs)
+        self.host_key_types = tuple(host_key_types)
+
+    def apply(self, transport: paramiko.Transport, known_key_type: Optional[str] = None):
+        """Nastaví pořadí algoritmů transportu (před start_client)."""
+        options = transport.get_security_options()
+        options.kex = _prefer(self.kex, options.kex)
+        options.ciphers = _prefer(self.ciphers, options.ciphers)
+        options.digests = _prefer(self.macs, options.digests)
+        key_types = self.host_key_types
+        if known_key_type:
+            # Gateway podepíše klíčem, který už známe (jinak by ho nešlo ověřit proti cache)
+            key_types = _KEY_ALGORITHMS.get(known_key_type, (known_key_type,)) + key_types
+        options.key_types = _prefer(key_types, options.key_types)
+
+
+PROFILES = {
+    # Pořadí algoritmů paramiko beze změny
+    "paramiko": ConnectionProfile("paramiko"),
+    # Levný handshake pro slabé CPU: curve25519/ECDH místo 4096bitového DH
+    # (group16), při nutnosti DH jen 2048bitová group14; AES-128 a HMAC-SHA1
+    # (nejlevnější na CPU bez kryptografických instrukcí); host klíč
+    # ed25519/ECDSA, u RSA podpis s SHA-256
+    "fast": ConnectionProfile(
+        "fast",
+        kex=(
+            "curve25519-sha256@libssh.org", "ecdh-sha2-nistp256",
+            "diffie-hellman-group14-sha256", "diffie-hellman-group14-sha1",
+        ),
+        ciphers=("aes128-ctr",),
+        macs=("hmac-sha1", "hmac-sha2-256"),
+        host_key_types=("ssh-ed25519", "ecdsa-sha2-nistp256", "rsa-sha2-256"),
+    ),
+}
+
+
+def get_profile(name: Optional[str] = None) -> ConnectionProfile:
+    """
+    Vrací profil podle názvu (výchozí SSH_PROFILE) doplněný o SSH_KEX, SSH_CIPHERS, SSH_MACS a SSH_HOST_KEY_TYPES.
+
+    Raises:
+        ValueError: Neznámý profil
+    """
+    name = name or SSH_PROFILE
+    profile = PROFILES.get(name)
+    if profile is None:
+        raise ValueError(f"Neznámý SSH profil: {name} (dostupné: {', '.join(PROFILES)})")
+    if not (SSH_KEX or SSH_CIPHERS or SSH_MACS or SSH_HOST_KEY_TYPES):
+        return profile
+    return ConnectionProfile(
+        name,
+        kex=SSH_KEX or profile.kex,
+        ciphers=SSH_CIPHERS or profile.ciphers,
+        macs=SSH_MACS or profile.macs,
+        host_key_types=SSH_HOST_KEY_TYPES or profile.host_key_types,
+    )
+
+
+class HostKeyCache:
+    """
+    Host klíče gateway podle adresy a portu, trvale v souboru known_hosts.
+
+    Nový klíč se uloží (trust on first use). Jiný klíč, než je uložený
+    (např. gateway po obnovení továrního firmware), se při
+    SSH_STRICT_HOST_KEYS=1 odmítne, jinak se zaloguje a nahradí.
+
+    Args:
+        path: Soubor known_hosts (prázdné = jen v paměti)
+        strict: Odmítat změněné klíče
+    """
+
+    def __init__(self, path: str = SSH_KNOWN_HOSTS, strict: bool = SSH_STRICT_HOST_KEYS):
+        self.path = path
+        self.strict = strict
+        self._keys = paramiko.HostKeys()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                self._keys.load(path)
+            except (OSError, paramiko.SSHException) as e:
+                logger.warning(f"Nelze načíst host klíče z {path}: {e}")
+
+    @staticmethod
+    def _hostname(host: str, port: int) -> str:
+        return host if port == 22 else f"[{host}]:{port}"
+
+    def key_type(self, host: str, port: int) -> Optional[str]:
+        """Typ uloženého host klíče gateway (None = gateway zatím neznáme)."""
+        with self._lock:
+            keys = self._keys.lookup(self._hostname(host, port))
+            return next(iter(keys.keys()), None) if keys else None
+
+    def verify(self, host: str, port: int, key: paramiko.PKey) -> str:
+        """
+        Ověří host klíč gateway proti cache a nový nebo změněný uloží.
+
+        Returns:
+            "known", "new" nebo "changed"
+
+        Raises:
+            ValueError: Klíč se změnil a cache je striktní
+        """
+        hostname = self._hostname(host, port)
+        with self._lock:
+            stored = (self._keys.lookup(hostname) or {}).get(key.get_name())
+            if stored is not None and stored == key:
+                return "known"
+            if stored is not None or self._keys.lookup(hostname):
+                if self.strict:
+                    raise ValueError(
+                        f"Host klíč {hostname} se změnil ({key.get_name()} {key.get_fingerprint().hex()}), "
+                        f"spojení odmítnuto"
+                    )
+                logger.warning(f"Host klíč {hostname} se změnil, ukládám nový ({key.get_name()})")
+                result = "changed"
+                # Klíče jiných typů stejné gateway jsou po změně neplatné
+                self._keys.pop(hostname, None)
+            else:
+                logger.info(f"Nový host klíč {hostname} ({key.get_name()})")
+                result = "new"
+            self._keys.add(hostname, key.get_name(), key)
+            self._save()
+        return result
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            self._keys.save(tmp)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Nelze uložit host klíče do {self.path}: {e}")
+
+
+class _CachePolicy(paramiko.MissingHostKeyPolicy):
+    """Ověření host klíče proti HostKeyCache (klient nemá načtené žádné klíče, volá se vždy)."""
+
+    def __init__(self, cache: HostKeyCache, host: str, port: int):
+        self.cache = cache
+        self.host = host
+        self.port = port
+        self.result: Optional[str] = None
+
+    def missing_host_key(self, client, hostname, key):
+        self.result = self.cache.verify(self.host, self.port, key)
+
+
+class _TimedTransport(paramiko.Transport):
+    """Transport s pořadím algoritmů podle profilu a změřenou dobou handshaku."""
+
+    def __init__(self, sock, profile: ConnectionProfile, known_key_type: Optional[str], **kwargs):
+        super().__init__(sock, **kwargs)
+        profile.apply(self, known_key_type)
+        self.kex_seconds = 0.0
+        self.kex_name: Optional[str] = None
+
+    @property
+    def kex_engine(self):
+        return self.__dict__.get("kex_engine")
+
+    @kex_engine.setter
+    def kex_engine(self, engine):
+        # Vyjednaná výměna klíčů (paramiko engine po dokončení handshaku zahazuje);
+        # název má jen část tříd, jinak zůstane název třídy
+        self.__dict__["kex_engine"] = engine
+        if engine is not None:
+            self.kex_name = getattr(engine, "name", None) or type(engine).__name__
+
+    def start_client(self, event=None, timeout=None):
+        started = time.perf_counter()
+        try:
+            return super().start_client(event, timeout)
+        finally:
+            self.kex_seconds = time.perf_counter() - started
+
+
+# Host klíče gateway sdílené všemi session procesu
+host_key_cache = HostKeyCache()
+
+
+def open_client(host: str, port: int, password: str, timeout: float,
+                profile: Optional[ConnectionProfile] = None,
+                cache: Optional[HostKeyCache] = None) -> tuple[paramiko.SSHClient, dict]:
+    """
+    Naváže SSH spojení (uživatel root, heslo) podle profilu a ověří host klíč.
+
+    Returns:
+        (klient, handshake) - handshake obsahuje profil, dobu fází v ms
+        (tcp, kex, auth), vyjednané algoritmy a výsledek ověření host klíče
+
+    Raises:
+        ValueError: Host klíč se změnil a cache je striktní
+        paramiko.AuthenticationException, paramiko.SSHException, OSError: jako SSHClient.connect
+    """
+    profile = profile or get_profile()
+    cache = cache or host_key_cache
+    policy = _CachePolicy(cache, host, port)
+    known_key_type = cache.key_type(host, port)
+
+    started = time.perf_counter()
+    sock = socket.create_connection((host, port), timeout=timeout)
+    # Handshake a příkazy jsou malé pakety tam a zpět, Nagle by je zdržoval
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    tcp_done = time.perf_counter()
+
+    transports: list[_TimedTransport] = []
+
+    def transport_factory(sock, **kwargs):
+        transport = _TimedTransport(sock, profile, known_key_type, **kwargs)
+        transports.append(transport)
+        return transport
+
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(policy)
+    try:
+        client.connect(
+            hostname=host,
+            port=port,
+            username="root",
+            password=password,
+            timeout=timeout,
+            sock=sock,
+            look_for_keys=False,
+            allow_agent=False,
+            transport_factory=transport_factory,
+        )
+    except BaseException:
+        client.close()
+        sock.close()
+        raise
+    done = time.perf_counter()
+    transport = transports[0]
+    timings = {
+        "tcp": tcp_done - started,
+        "kex": transport.kex_seconds,
+        "auth": done - tcp_done - transport.kex_seconds,
+    }
+    for phase, seconds in timings.items():
+        SSH_HANDSHAKE_SECONDS.observe(seconds, phase, profile.name)
+    handshake = {
+        "profile": profile.name,
+        **{f"{phase}_ms": round(seconds * 1000, 2) for phase, seconds in timings.items()},
+        "kex": transport.kex_name,
+        "cipher": transport.local_cipher,
+        "mac": transport.local_mac,
+        "host_key_type": transport.host_key_type,
+        "host_key": policy.result,
+    }
+    return client, handshake
@@ -0,0 +1,272 @@
+"""
+Služba nad SSH session: registr session, executor, úlohy a události.
+
+HTTP handlery v app.main pracují se SSH jen přes tuto službu a session
+identifikují session ID z cookie. S jedním workerem běží služba přímo
+v aplikaci; s více workery ji provozuje SSH broker (app.broker) a workery
+k ní přistupují přes BrokerClient se stejným rozhraním. Metody proto
+přijímají i vracejí jen data převoditelná do JSON.
+"""
+import asyncio
+from functools import partial
+from typing import AsyncIterator, Callable, Optional
+import logging
+
+from app.events import CommandOutput, EventHub, TransferProgress
+from app.jobs import JOB_KINDS, JobManager
+from app.metrics import gauge
+from app.session_registry import SessionRegistry, SSH_HEALTH_INTERVAL, SSH_SESSION_REAP_INTERVAL
+from app.ssh_executor import SSHExecutor
+from app.ssh_operations import SSHSession, FirmwareUpgrade, get_file_path
+from app.ssh_transports import transport_pool
+
+logger = logging.getLogger(__name__)
+
+
+class _Publishers:
+    """Továrna callbacků publikujících průběh operace do kanálu session (jako JobContext)."""
+
+    def __init__(self, hub: EventHub, channel: Optional[str]):
+        self.hub = hub
+        self.channel = channel
+
+    def progress(self, target: str) -> TransferProgress:
+        return TransferProgress(self.hub, self.channel, target)
+
+    def output(self, target: str) -> CommandOutput:
+        return CommandOutput(self.hub, self.channel, target)
+
+
+def _sync_serialgateway(session: SSHSession, events: _Publishers,
+                        filename: str, transfer: Optional[str] = None) -> partial:
+    return partial(
+        session.sync_file, get_file_path(filename), "/tuya/serialgateway",
+        callback=events.progress("serialgateway").for_file(filename), transfer=transfer
+    )
+
+
+# Operace nad session: název -> funkce (session, továrna callbacků průběhu, parametry),
+# která vrací volání pro executor (metoda SSHSession/FirmwareUpgrade s argumenty)
+SSH_OPERATIONS: dict[str, Callable[..., partial]] = {
+    "connect": lambda session, events, host, port, password: partial(session.connect, host, port, password),
+    "disconnect": lambda session, events: partial(session.disconnect),
+    "disable_ssh_monitor": lambda session, events: partial(session.disable_ssh_monitor),
+    "sync_serialgateway": _sync_serialgateway,
+    "update_tuya_start": lambda session, events: partial(session.update_tuya_start),
+    "set_static_ip": lambda session, events, ip: partial(session.set_static_ip, ip),
+    "reboot": lambda session, events: partial(session.reboot),
+    "stop_serialgateway": lambda session, events: partial(FirmwareUpgrade(session).stop_serialgateway),
+    "upload_upgrade_files": lambda session, events, firmware_filename, transfer=None: partial(
+        FirmwareUpgrade(session).upload_upgrade_files, firmware_filename, events.progress("firmware"), transfer
+    ),
+    "perform_upgrade": lambda session, events, ezsp_version, engine=None, firmware_filename=None: partial(
+        FirmwareUpgrade(session).perform_upgrade, ezsp_version, events.output("flash"),
+        engine, firmware_filename, events.progress("flash")
+    ),
+    "restore_serialgateway": lambda session, events: partial(FirmwareUpgrade(session).restore_serialgateway),
+}
+
+# Operace, po kterých se session z registru odebere (spojení skončilo)
+FORGET_AFTER = ("disconnect", "reboot", "perform_upgrade")
+
+# Operace, které stav zařízení nemění (snapshot stavu zařízení zahazují samy)
+KEEPS_DEVICE_STATE = ("connect", "disconnect")
+
+
+class SSHService:
+    """
+    SSH session všech prohlížečů v jednom procesu.
+
+    Operace nad jednou session běží postupně v SSHExecutoru, změny stavu
+    spojení, průběh přenosů a stav úloh se publikují do EventHub kanálu
+    session.
+    """
+
+    def __init__(self):
+        self.executor = SSHExecutor()
+        self.hub = EventHub()
+        self.sessions = SessionRegistry(in_use=self.executor.is_busy, on_state_change=self._publish_status)
+        self.jobs = JobManager(self.executor, self.hub)
+        self._tasks: list[asyncio.Task] = []
+
+    def _publish_status(self, session_id: str, status: dict):
+        """Pošle změnu stavu SSH spojení do prohlížeče (SSE událost `ssh_status`)."""
+        self.hub.publish(session_id, "ssh_status", status)
+
+    async def start(self):
+        """Spustí reaper a kontrolu spojení SSH session na pozadí."""
+        self._tasks.append(asyncio.create_task(self._reap_sessions()))
+        if SSH_HEALTH_INTERVAL > 0:
+            self._tasks.append(asyncio.create_task(self._monitor_sessions()))
+
+    async def close(self):
+        """Zastaví úlohy na pozadí, odpojí session a ukončí thread pool."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.to_thread(self.sessions.close_all)
+        self.executor.shutdown()
+        self.jobs.close()
+
+    async def _reap_sessions(self):
+        """Periodicky odpojuje nečinné a vyřazené SSH session a zahazuje staré úlohy."""
+        while True:
+            await asyncio.sleep(SSH_SESSION_REAP_INTERVAL)
+            try:
+                await asyncio.to_thread(self.sessions.reap)
+                self.jobs.expire()
+            except Exception as e:
+                logger.error(f"Chyba při úklidu SSH session: {e}")
+
+    async def _monitor_sessions(self):
+        """Periodicky kontroluje spojení připojených SSH session (RTT, výpadky)."""
+        while True:
+            await asyncio.sleep(SSH_HEALTH_INTERVAL)
+            try:
+                await asyncio.to_thread(self.sessions.check_health)
+            except Exception as e:
+                logger.error(f"Chyba při kontrole SSH spojení: {e}")
+
+    def _connected(self, session_id: Optional[str]) -> SSHSession:
+        session = self.sessions.get(session_id)
+        if session is None or not session.is_connected():
+            raise ValueError("SSH není připojeno")
+        return session
+
+    async def status(self, session_id: Optional[str]) -> dict:
+        """Vrací aktuální stav SSH spojení session."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return {"connected": False, "state": "disconnected"}
+        # Zaniklý transport se tím promítne do stavu (lost)
+        session.is_connected()
+        return session.status()
+
+    async def run(self, session_id: Optional[str], operation: str, **params) -> Optional[dict]:
+        """
+        Provede operaci nad SSH session.
+
+        Raises:
+            ValueError: Neznámá operace, nepřipojená session nebo chyba operace
+        """
+        fn = SSH_OPERATIONS.get(operation)
+        if fn is None:
+            raise ValueError(f"Neznámá SSH operace: {operation}")
+        if operation == "connect":
+            if not session_id:
+                raise ValueError("Chybí session ID")
+            session = self.sessions.get_or_create(session_id)
+        elif operation == "disconnect":
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+        else:
+            session = self._connected(session_id)
+
+        mutating = operation not in KEEPS_DEVICE_STATE
+        if mutating:
+            session.invalidate_device_state()
+        try:
+            result = await self.executor.run(session, fn(session, _Publishers(self.hub, session_id), **params))
+        finally:
+            if mutating:
+                self._device_state_changed(session_id, session)
+        if operation in FORGET_AFTER:
+            self.sessions.remove(session_id)
+        return result
+
+    def _device_state_changed(self, session_id: Optional[str], session: SSHSession):
+        """Zahodí snapshot stavu zařízení a řekne prohlížeči, ať si ho načte znovu."""
+        session.invalidate_device_state()
+        self.hub.publish(session_id, "device_state", {"stale": True})
+
+    async def device_state(self, session_id: Optional[str], refresh: bool = False) -> dict:
+        """
+        Vrací snapshot stavu zařízení připojené session.
+
+        Platný snapshot z cache session se vrátí bez čekání na executor
+        (i během úlohy), jinak se stav zjistí jedním příkazem na gateway
+        a nový snapshot se pošle všem oknům session (SSE událost `device_state`).
+        """
+        session = self._connected(session_id)
+        if not refresh:
+            cached = session.cached_device_state()
+            if cached is not None:
+                return cached
+        state = await self.executor.run(session, partial(session.device_state, refresh))
+        if not state["cached"]:
+            self.hub.publish(session_id, "device_state", state)
+        return state
+
+    async def submit_job(self, session_id: Optional[str], kind: str, params: dict) -> dict:
+        """Založí úlohu na pozadí nad připojenou session a vrací její snapshot."""
+        steps_factory = JOB_KINDS.get(kind)
+        if steps_factory is None:
+            raise ValueError(f"Neznámý typ úlohy: {kind}")
+        session = self._connected(session_id)
+
+        def on_finish(job):
+            self._device_state_changed(session_id, session)
+            # Session, která po úloze zůstala odpojená (např. zařízení se po
+            # restartu nevrátilo), z registru odebereme
+            if not session.is_connected():
+                self.sessions.remove(session_id)
+
+        # Úlohy zařízení mění (nahrání souborů, upgrade, restart)
+        session.invalidate_device_state()
+        job = self.jobs.submit(session_id, kind, session, steps_factory(session, params), params=params,
+                               on_finish=on_finish)
+        return job.to_dict()
+
+    async def list_jobs(self, session_id: Optional[str], kind: Optional[str] = None,
+                        with_log: bool = False) -> list[dict]:
+        """Vrací úlohy session od nejnovější."""
+        return [job.to_dict(with_log=with_log) for job in self.jobs.list_jobs(session_id, kind)]
+
+    async def get_job(self, session_id: Optional[str], job_id: str) -> Optional[dict]:
+        job = self.jobs.get(session_id, job_id)
+        return job.to_dict() if job is not None else None
+
+    async def cancel_job(self, session_id: Optional[str], job_id: str) -> Optional[dict]:
+        job = self.jobs.cancel(session_id, job_id)
+        return job.to_dict() if job is not None else None
+
+    def subscribe(self, session_id: str) -> AsyncIterator[Optional[tuple[str, dict]]]:
+        """Události kanálu session (None = keepalive)."""
+        return self.hub.subscribe(session_id)
+
+    async def stats(self) -> dict:
+        """Čítače registru session, sdílených transportů, executoru, událostí a úloh."""
+        # Statistiky session se sbírají pod zámkem registru, proto mimo event loop
+        sessions = await asyncio.to_thread(self.sessions.stats)
+        return {
+            "sessions": sessions,
+            "transports": transport_pool.stats(),
+            "executor": self.executor.stats(),
+            "events": self.hub.stats(),
+            "jobs": self.jobs.stats(),
+        }
+
+    async def metrics(self) -> str:
+        """Metriky procesu služby navíc k metrikám workeru - služba běží v procesu aplikace, nic."""
+        return ""
+
+
+def register_gauges(service: SSHService):
+    """Zaregistruje okamžité hodnoty služby pro /metrics (v procesu, který službu provozuje)."""
+    gauge(
+        "ssh_sessions", "Počet SSH session podle stavu", ("state",),
+        fn=lambda: {(key,): value for key, value in service.sessions.stats().items()
+                    if key in ("live", "connected", "degraded", "lost")},
+    )
+    gauge(
+        "ssh_transports", "Počet SSH transportů ke gateway a session, které je používají", ("kind",),
+        fn=lambda: {(key,): value for key, value in transport_pool.stats().items() if key in ("open", "users")},
+    )
+    gauge(
+        "ssh_executor_operations", "Počet SSH operací v executoru", ("state",),
+        fn=lambda: {(key,): value for key, value in service.executor.stats().items()
+                    if key in ("queued", "running")},
+    )
+    gauge("sse_subscribers", "Počet připojených SSE odběratelů", fn=lambda: service.hub.stats()["subscribers"])
+    gauge("jobs", "Počet evidovaných úloh na pozadí podle stavu", ("state",),
+          fn=lambda: {(state,): count for state, count in service.jobs.stats()["states"].items()})
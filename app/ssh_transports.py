@@ -0,0 +1,192 @@
+"""
+Sdílení SSH transportů mezi session připojenými ke stejné gateway.
+
+Dva operátoři (nebo dvě záložky po ztrátě cookie) pracující se stejnou
+gateway mají každý vlastní SSHSession, ale gateway vidí jedno TCP spojení:
+transporty se sdílí podle (host, port, otisk hesla), každá session si nad
+sdíleným transportem otevírá vlastní kanály (exec, SFTP, shell) a transport
+se zavře, až ho uvolní poslední session. Slabý sshd gateway tak nedělá
+handshake pro každé okno prohlížeče a ssh_monitor.sh nevidí víc spojení.
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from typing import Optional
+import logging
+
+import paramiko
+
+from app.ssh_profiles import ConnectionProfile, open_client
+
+logger = logging.getLogger(__name__)
+
+# Sdílet SSH transport mezi session připojenými ke stejné gateway se stejným heslem (1 = zapnuto)
+SSH_SHARE_TRANSPORTS = os.environ.get("SSH_SHARE_TRANSPORTS", "1") == "1"
+
+
+class SharedTransport:
+    """
+    Jedno SSH spojení ke gateway a počet session, které ho používají.
+
+    Args:
+        key: Klíč sdílení (host, port, otisk hesla)
+        client: Připojený SSHClient
+        handshake: Údaje o navázání spojení (viz open_client)
+    """
+
+    def __init__(self, key: tuple, client: paramiko.SSHClient, handshake: dict):
+        self.key = key
+        self.client = client
+        self.handshake = handshake
+        self.refs = 0
+        self.opened_at = time.time()
+        # Rozběhnutá kontrola spojení - session sdílející transport čekají na
+        # stejnou odpověď (global_request s čekáním smí na transportu běžet jen jeden)
+        self.ping = None
+        self.ping_lock = threading.Lock()
+
+    def is_active(self) -> bool:
+        try:
+            transport = self.client.get_transport()
+            return bool(transport and transport.is_active())
+        except Exception:
+            return False
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class _KeyLock:
+    """Zámek handshaku jednoho klíče s počtem vláken, která ho drží nebo na něj čekají."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+class TransportPool:
+    """
+    SSH transporty podle gateway a hesla s počítáním uživatelů.
+
+    Souběžná připojení ke stejné gateway čekají na jeden handshake. Transport
+    se sdílí jen se session, která se připojuje se stejným heslem; heslo se
+    neukládá, klíčem je jeho HMAC s náhodným klíčem procesu.
+
+    Args:
+        share: Sdílet transporty (False = každá session vlastní spojení)
+    """
+
+    def __init__(self, share: bool = SSH_SHARE_TRANSPORTS):
+        self.share = share
+        self._entries: dict[tuple, SharedTransport] = {}
+        # Zámek pro každý klíč (handshake ke stejné gateway probíhá jen jednou),
+        # drží se jen po dobu acquire, než ho uvolní poslední čekající vlákno
+        self._key_locks: dict[tuple, _KeyLock] = {}
+        self._lock = threading.Lock()
+        self._secret = os.urandom(32)
+        self._opened = 0
+        self._reused = 0
+        self._closed = 0
+
+    def _key(self, host: str, port: int, password: str) -> tuple:
+        digest = hmac.new(self._secret, password.encode("utf-8"), hashlib.sha256).hexdigest()
+        return (host, port, digest)
+
+    def acquire(self, host: str, port: int, password: str, timeout: float,
+                profile: Optional[ConnectionProfile] = None) -> tuple[SharedTransport, bool]:
+        """
+        Vrací transport ke gateway (existující živý, jinak nově připojený) se započteným uživatelem.
+
+        Returns:
+            (transport, reused) - reused je True, pokud spojení už existovalo
+
+        Raises:
+            stejné výjimky jako open_client
+        """
+        key = self._key(host, port, password)
+        with self._lock:
+            key_lock = self._key_locks.get(key)
+            if key_lock is None:
+                key_lock = self._key_locks[key] = _KeyLock()
+            key_lock.users += 1
+        try:
+            with key_lock.lock:
+                return self._acquire(key, host, port, password, timeout, profile)
+        finally:
+            with self._lock:
+                key_lock.users -= 1
+                if not key_lock.users:
+                    del self._key_locks[key]
+
+    def _acquire(self, key: tuple, host: str, port: int, password: str, timeout: float,
+                 profile: Optional[ConnectionProfile]) -> tuple[SharedTransport, bool]:
+        """Tělo acquire pod zámkem klíče."""
+        if self.share:
+            with self._lock:
+                shared = self._entries.get(key)
+                if shared is not None and shared.is_active():
+                    shared.refs += 1
+                    self._reused += 1
+                    return shared, True
+                if shared is not None:
+                    # Zaniklé spojení (restart gateway, výpadek sítě)
+                    del self._entries[key]
+            if shared is not None:
+                shared.close()
+        client, handshake = open_client(host, port, password, timeout, profile=profile)
+        shared = SharedTransport(key, client, handshake)
+        shared.refs = 1
+        with self._lock:
+            self._opened += 1
+            if self.share:
+                self._entries[key] = shared
+        return shared, False
+
+    def release(self, shared: SharedTransport, close: bool = False) -> bool:
+        """
+        Uvolní transport session; poslední uživatel (nebo `close`) ho zavře.
+
+        Returns:
+            True, pokud se transport zavřel
+        """
+        with self._lock:
+            shared.refs = max(0, shared.refs - 1)
+            closing = close or shared.refs == 0
+            if closing and self._entries.get(shared.key) is shared:
+                del self._entries[shared.key]
+        if not closing:
+            return False
+        if shared.is_active():
+            with self._lock:
+                self._closed += 1
+            if shared.refs:
+                logger.info(f"Sdílené SSH spojení {shared.key[0]}:{shared.key[1]} zavřeno ({shared.refs} dalších session)")
+        shared.close()
+        return True
+
+    def users(self, shared: SharedTransport) -> int:
+        """Počet session, které transport používají."""
+        with self._lock:
+            return shared.refs
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = list(self._entries.values())
+            return {
+                "share": self.share,
+                "open": len(entries),
+                "users": sum(shared.refs for shared in entries),
+                "shared": sum(1 for shared in entries if shared.refs > 1),
+                "opened": self._opened,
+                "reused": self._reused,
+                "closed": self._closed,
+            }
+
+
+# Transporty sdílené všemi session procesu
+transport_pool = TransportPool()
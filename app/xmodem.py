@@ -0,0 +1,345 @@
+"""
+XMODEM odesílač (XMODEM-1K/CRC) běžící v aplikaci.
+
+Místo nahrání sx a firmware do tmpfs gateway a spuštění sx na jejím pomalém
+CPU posílá bloky aplikace: exec kanál na gateway jen propojuje stdin a stdout
+příkazu s UART Zigbee modulu (most z `cat`). Firmware se tak nikam nekopíruje
+a CRC bloků se počítá na straně aplikace.
+"""
+import binascii
+import os
+import select
+import shlex
+import time
+from typing import Callable, Optional
+import logging
+
+import paramiko
+
+from app.metrics import XMODEM_BLOCKS
+
+logger = logging.getLogger(__name__)
+
+# Řídicí znaky XMODEM
+SOH = 0x01
+STX = 0x02
+EOT = 0x04
+ACK = 0x06
+NAK = 0x15
+CAN = 0x18
+CRC_START = 0x43  # 'C' - přijímač žádá CRC režim
+PAD = 0x1A
+
+# Velikost bloku (1024 = XMODEM-1K, 128 = klasický XMODEM)
+XMODEM_BLOCK_SIZE = int(os.environ.get("XMODEM_BLOCK_SIZE", "1024"))
+# Počet bloků odeslaných bez čekání na potvrzení (1 = stop-and-wait, snese každý přijímač)
+XMODEM_WINDOW = int(os.environ.get("XMODEM_WINDOW", "1"))
+# Nejvíc opakování jednoho bloku, pak se přenos zruší
+XMODEM_RETRIES = int(os.environ.get("XMODEM_RETRIES", "10"))
+# Čekání na potvrzení bloku v sekundách
+XMODEM_ACK_TIMEOUT = float(os.environ.get("XMODEM_ACK_TIMEOUT", "10"))
+# Čekání na výzvu přijímače k zahájení přenosu v sekundách
+XMODEM_START_TIMEOUT = float(os.environ.get("XMODEM_START_TIMEOUT", "60"))
+
+# Callback průběhu: (potvrzeno bytů, celkem bytů)
+ProgressCallback = Callable[[int, int], None]
+
+
+class XmodemError(ValueError):
+    """Přenos XMODEM selhal (přijímač neodpovídá, zrušil přenos, došly pokusy)."""
+
+
+def build_block(seq: int, payload: bytes, size: int, crc: bool = True) -> bytes:
+    """Sestaví blok XMODEM (hlavička, data doplněná na `size`, CRC-16 nebo součet)."""
+    data = bytes(payload).ljust(size, bytes([PAD]))
+    seq &= 0xFF
+    header = bytes([STX if size == 1024 else SOH, seq, 0xFF - seq])
+    if crc:
+        trailer = binascii.crc_hqx(data, 0).to_bytes(2, "big")
+    else:
+        trailer = bytes([sum(data) & 0xFF])
+    return header + data + trailer
+
+
+def bridge_command(tty: str = "/dev/ttyS1") -> str:
+    """
+    Příkaz na gateway, který propojí stdin a stdout exec kanálu s `tty`.
+
+    Linka se přepne do raw režimu bez echa (jinak by se odpovědi přijímače
+    vracely zpět do modulu); čtecí `cat` běží na pozadí a skončí po konci stdin.
+    """
+    tty = shlex.quote(tty)
+    return f"stty -F {tty} raw -echo && {{ cat {tty} & reader=$!; cat > {tty}; kill $reader; }}"
+
+
+class SerialBridge:
+    """
+    Sériová linka gateway přes SSH exec kanál (viz bridge_command).
+
+    Args:
+        transport: SSH transport ke gateway
+        tty: Zařízení UART na gateway
+        timeout: Časový limit otevření kanálu
+    """
+
+    def __init__(self, transport: paramiko.Transport, tty: str = "/dev/ttyS1", timeout: float = 30):
+        self.tty = tty
+        self.channel = transport.open_session(timeout=timeout)
+        self.channel.exec_command(bridge_command(tty))
+
+    def write(self, data: bytes):
+        self.channel.sendall(data)
+
+    def read(self, timeout: float) -> bytes:
+        """Vrací byty přijaté z linky (prázdné po vypršení `timeout`)."""
+        if not self.channel.recv_ready():
+            if self.channel.exit_status_ready() or self.channel.closed:
+                stderr = b""
+                while self.channel.recv_stderr_ready():
+                    stderr += self.channel.recv_stderr(4096)
+                message = stderr.decode("utf-8", errors="ignore").strip() or "kanál byl ukončen"
+                raise XmodemError(f"Spojení s {self.tty} skončilo: {message}")
+            select.select([self.channel], [], [], timeout)
+        if self.channel.recv_ready():
+            return self.channel.recv(4096)
+        return b""
+
+    def close(self, timeout: float = 5):
+        """Ukončí most (konec stdin ukončí zápis i čtecí `cat` na gateway)."""
+        try:
+            self.channel.shutdown_write()
+            deadline = time.monotonic() + timeout
+            while not self.channel.exit_status_ready() and time.monotonic() < deadline:
+                # Zbytek výstupu linky (výpis bootloaderu) se zahodí
+                if self.channel.recv_ready():
+                    self.channel.recv(4096)
+                else:
+                    time.sleep(0.05)
+        except Exception:
+            pass
+        finally:
+            self.channel.close()
+
+    def __enter__(self) -> "SerialBridge":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class XmodemStats:
+    """Statistiky jednoho přenosu (bloky, opakování, propustnost)."""
+
+    def __init__(self, block_size: int, window: int):
+        self.block_size = block_size
+        self.window = window
+        self.min_window = window
+        self.crc = True
+        self.blocks = 0
+        self.bytes = 0
+        self.sent_blocks = 0
+        self.retransmits = 0
+        self.naks = 0
+        self.timeouts = 0
+        self.started = time.monotonic()
+        self.first_block: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        duration = (self.finished or time.monotonic()) - self.started
+        transfer = (self.finished or time.monotonic()) - (self.first_block or self.started)
+        return {
+            "block_size": self.block_size,
+            "crc": self.crc,
+            "window": self.window,
+            "min_window": self.min_window,
+            "blocks": self.blocks,
+            "bytes": self.bytes,
+            "sent_blocks": self.sent_blocks,
+            "retransmits": self.retransmits,
+            "naks": self.naks,
+            "timeouts": self.timeouts,
+            "duration_s": round(duration, 3),
+            "throughput_bps": round(self.bytes / transfer) if transfer > 0 else None,
+        }
+
+
+class XmodemSender:
+    """
+    Odesílač XMODEM-1K/CRC nad linkou s metodami write(data) a read(timeout).
+
+    Odesílá až `window` bloků bez čekání na potvrzení. Potvrzení chodí
+    v pořadí bloků; po NAK nebo vypršení čekání se zahodí odpovědi na
+    bloky za chybným (přijímač je odmítne jako mimo pořadí), okno se
+    zmenší na polovinu a odesílání pokračuje od nepotvrzeného bloku;
+    po sérii potvrzení se okno zase postupně zvětšuje.
+    S oknem 1 jde o klasický stop-and-wait podle specifikace.
+
+    Args:
+        port: Linka k přijímači (SerialBridge, v testech pty)
+        block_size: Velikost bloku (1024 nebo 128); poslední krátký blok se posílá jako 128
+        window: Počet bloků v letu
+        retries: Nejvíc opakování jednoho bloku
+        ack_timeout: Čekání na potvrzení bloku v sekundách
+        start_timeout: Čekání na výzvu přijímače v sekundách
+    """
+
+    def __init__(self, port, block_size: int = XMODEM_BLOCK_SIZE, window: int = XMODEM_WINDOW,
+                 retries: int = XMODEM_RETRIES, ack_timeout: float = XMODEM_ACK_TIMEOUT,
+                 start_timeout: float = XMODEM_START_TIMEOUT):
+        if block_size not in (128, 1024):
+            raise ValueError("Velikost bloku XMODEM musí být 128 nebo 1024")
+        self.port = port
+        self.block_size = block_size
+        self.window = max(1, window)
+        self.retries = retries
+        self.ack_timeout = ack_timeout
+        self.start_timeout = start_timeout
+        self._rx = bytearray()
+
+    def _next_byte(self, timeout: float) -> Optional[int]:
+        """Další přijatý byte, None po vypršení `timeout`."""
+        deadline = time.monotonic() + timeout
+        while not self._rx:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self._rx += self.port.read(remaining)
+        value = self._rx[0]
+        del self._rx[0]
+        return value
+
+    def _drain(self, expected: int, timeout: float):
+        """Zahodí odpovědi na `expected` bloků odeslaných za odmítnutým (nejvýše `timeout` s)."""
+        deadline = time.monotonic() + timeout
+        cancels = 0
+        while expected > 0:
+            value = self._next_byte(max(0.0, deadline - time.monotonic()))
+            if value is None:
+                return
+            if value == CAN:
+                cancels += 1
+                if cancels >= 2:
+                    raise XmodemError("Přijímač přenos zrušil")
+            elif value in (ACK, NAK):
+                expected -= 1
+                cancels = 0
+
+    def _cancel(self):
+        try:
+            self.port.write(bytes([CAN] * 3))
+        except Exception:
+            pass
+
+    def _check_cancel(self):
+        # Přijímač ruší přenos dvěma CAN po sobě
+        if self._next_byte(1.0) == CAN:
+            raise XmodemError("Přijímač přenos zrušil")
+
+    def _wait_start(self) -> bool:
+        """Počká na výzvu přijímače; vrací True pro CRC režim, False pro kontrolní součet."""
+        deadline = time.monotonic() + self.start_timeout
+        while True:
+            value = self._next_byte(max(0.0, deadline - time.monotonic()))
+            if value is None:
+                raise XmodemError("Přijímač nezahájil přenos (nepřišla výzva 'C')")
+            if value == CRC_START:
+                return True
+            if value == NAK:
+                return False
+            if value == CAN:
+                self._check_cancel()
+            # Ostatní byty jsou výpis bootloaderu (menu, "begin upload")
+
+    def send(self, data: bytes, callback: Optional[ProgressCallback] = None) -> dict:
+        """
+        Odešle data a vrací statistiky přenosu (viz XmodemStats).
+
+        Raises:
+            XmodemError: přenos se nepodařilo dokončit
+        """
+        stats = XmodemStats(self.block_size, self.window)
+        crc = self._wait_start()
+        stats.crc = crc
+        stats.first_block = time.monotonic()
+        # Bez CRC (odpověď NAK) jen klasické 128B bloky
+        block_size = self.block_size if crc else 128
+        bounds = []
+        offset = 0
+        while offset < len(data):
+            size = block_size if len(data) - offset > 128 else 128
+            bounds.append((offset, size))
+            offset += size
+        total = len(data)
+        view = memoryview(data)
+        window = self.window
+        base = 0
+        next_index = 0
+        attempts = 0
+        clean = 0
+        try:
+            while base < len(bounds):
+                while next_index < len(bounds) and next_index - base < window:
+                    start, size = bounds[next_index]
+                    self.port.write(build_block(next_index + 1, view[start:start + size], size, crc))
+                    stats.sent_blocks += 1
+                    next_index += 1
+                response = self._next_byte(self.ack_timeout)
+                if response == ACK:
+                    XMODEM_BLOCKS.inc("ack")
+                    start, size = bounds[base]
+                    base += 1
+                    attempts = 0
+                    clean += 1
+                    if window < self.window and clean >= window:
+                        window += 1
+                        clean = 0
+                    stats.blocks = base
+                    stats.bytes = min(start + size, total)
+                    if callback:
+                        callback(stats.bytes, total)
+                    continue
+                if response == CAN:
+                    self._check_cancel()
+                    continue
+                if response is not None and response != NAK:
+                    continue
+                if response is None:
+                    stats.timeouts += 1
+                    XMODEM_BLOCKS.inc("timeout")
+                else:
+                    stats.naks += 1
+                    XMODEM_BLOCKS.inc("nak")
+                attempts += 1
+                clean = 0
+                if attempts > self.retries:
+                    raise XmodemError(f"Blok {base + 1} se nepodařilo odeslat ani po {self.retries} opakováních")
+                if next_index - base > 1:
+                    self._drain(next_index - base - 1, self.ack_timeout)
+                    window = max(1, window // 2)
+                    stats.min_window = min(stats.min_window, window)
+                stats.retransmits += next_index - base
+                next_index = base
+            self._send_eot(stats)
+        except XmodemError:
+            self._cancel()
+            raise
+        stats.finished = time.monotonic()
+        logger.info(
+            f"XMODEM: odesláno {stats.bytes} B v {stats.blocks} blocích, "
+            f"opakováno {stats.retransmits} bloků, {stats.to_dict()['throughput_bps']} B/s"
+        )
+        return stats.to_dict()
+
+    def _send_eot(self, stats: XmodemStats):
+        # Některé přijímače první EOT odmítnou (NAK) a potvrdí až opakovaný
+        for _ in range(self.retries + 1):
+            self.port.write(bytes([EOT]))
+            response = self._next_byte(self.ack_timeout)
+            while response is not None and response not in (ACK, NAK):
+                response = self._next_byte(self.ack_timeout)
+            if response == ACK:
+                return
+            if response is None:
+                stats.timeouts += 1
+        raise XmodemError("Přijímač nepotvrdil konec přenosu")
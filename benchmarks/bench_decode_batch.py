@@ -0,0 +1,84 @@
+"""
+Benchmark dávkového dekódování AUSKEY (řádky za sekundu).
+
+Vygeneruje náhodné platné řádky (KEK + zašifrovaný AUSKEY), změří
+decode_auskey po jednom řádku a dávkové dekódování a ověří, že oba
+výstupy jsou shodné.
+
+Spuštění:
+    python -m benchmarks.bench_decode_batch --rows 10000
+"""
+import argparse
+import json
+import os
+import random
+import string
+import time
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from app.decode import decode_auskey, _decode_kek, _decode_kek_fast
+from app.decode_batch import decode_batch
+
+
+def generate_rows(count: int, seed: int = 1) -> list[dict]:
+    """Vygeneruje platné řádky ve formátu výpisu z bootloaderu."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        kek_raw = bytes(rng.randrange(256) for _ in range(16))
+        auskey = "".join(rng.choice(string.ascii_letters + string.digits) for _ in range(32))
+        encryptor = Cipher(algorithms.AES(_decode_kek(kek_raw)), modes.ECB()).encryptor()
+        encoded = encryptor.update(auskey.encode("ascii")) + encryptor.finalize()
+        rows.append({
+            "id": f"gw-{i}",
+            "kek": f"80000000: {kek_raw.hex(' ', 4)}",
+            "auskey_line1": f"80000000: {encoded[:16].hex(' ', 4)}",
+            "auskey_line2": f"80000010: {encoded[16:].hex(' ', 4)}",
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dávkového dekódování AUSKEY")
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    rows = generate_rows(args.rows)
+
+    started = time.perf_counter()
+    single = [decode_auskey(r["kek"], r["auskey_line1"], r["auskey_line2"]) for r in rows]
+    single_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = decode_batch(rows)
+    batch_s = time.perf_counter() - started
+
+    identical = all(
+        s == {"auskey": r["auskey"], "root_password": r["root_password"]}
+        for s, r in zip(single, batch["results"])
+    )
+
+    kek_inputs = [os.urandom(16) for _ in range(args.rows)]
+    started = time.perf_counter()
+    for k in kek_inputs:
+        _decode_kek(k)
+    kek_s = time.perf_counter() - started
+    started = time.perf_counter()
+    for k in kek_inputs:
+        _decode_kek_fast(k)
+    kek_fast_s = time.perf_counter() - started
+
+    print(json.dumps({
+        "rows": args.rows,
+        "decode_auskey_rows_per_s": round(args.rows / single_s),
+        "decode_batch_rows_per_s": round(args.rows / batch_s),
+        "decode_kek_per_s": round(args.rows / kek_s),
+        "decode_kek_fast_per_s": round(args.rows / kek_fast_s),
+        "identical_output": identical,
+        "failed_rows": batch["failed"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark fleet režimu proti flotile virtuálních gateway.
+
+Pro každou úroveň souběžnosti spustí novou flotilu simulátoru (zařízení
+ve výchozím stavu), provede vybrané operace přes FleetRun a změří
+zařízení za minutu a rozložení doby obsluhy jednoho zařízení.
+
+Spuštění:
+    python -m benchmarks.bench_fleet --devices 200 --concurrency 8,16,32 --cpu-delay-ms 5
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from app.catalog import BINARIES_PATH
+from app.fleet import FleetRun
+from app.models import FleetDevice
+from benchmarks.simulator import GatewayFleet
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def run_level(args, concurrency: int, operations: list[str], params: dict) -> dict:
+    """Jeden běh nad čerstvou flotilou."""
+    fleet = GatewayFleet(
+        args.devices,
+        password="bench",
+        link_kbps=args.link_kbps,
+        latency_ms=args.latency_ms,
+        cpu_delay=args.cpu_delay_ms / 1000,
+        cpu_rate=args.cpu_rate_kbps * 1024,
+        handshake_delay=args.handshake_ms / 1000,
+        boot_time=args.boot_time,
+    )
+    devices = [FleetDevice(**row) for row in fleet.start()]
+    try:
+        run = FleetRun(devices, operations, concurrency=concurrency, params=params)
+        durations = []
+        summary = {}
+        for event in run.run():
+            if event["event"] == "device_done":
+                durations.append(event["duration_ms"])
+            elif event["event"] == "summary":
+                summary = event
+        stats = fleet.stats()
+    finally:
+        fleet.stop()
+    return {
+        "concurrency": summary["concurrency"],
+        "succeeded": summary["succeeded"],
+        "failed": summary["failed"],
+        "failures_by_operation": summary["failures_by_operation"],
+        "elapsed_s": summary["elapsed_s"],
+        "devices_per_minute": summary["devices_per_minute"],
+        "device_p50_ms": round(_percentile(durations, 0.5), 1),
+        "device_p99_ms": round(_percentile(durations, 0.99), 1),
+        "commands": stats.get("commands", 0),
+        "sftp_bytes": stats.get("sftp_bytes", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fleet režimu proti simulátoru gateway")
+    parser.add_argument("--devices", type=int, default=50, help="Počet virtuálních zařízení")
+    parser.add_argument("--concurrency", default="4,16,32", help="Úrovně souběžnosti oddělené čárkou")
+    parser.add_argument("--operations", default="disable_monitor,upload_serialgateway,update_tuya_start,set_static_ip",
+                        help="Operace fleet režimu oddělené čárkou")
+    parser.add_argument("--file-size", type=int, default=512 * 1024, help="Velikost nahrávaného serialgateway")
+    parser.add_argument("--cpu-delay-ms", type=float, default=5, help="Prodleva za spuštěný proces v ms")
+    parser.add_argument("--cpu-rate-kbps", type=float, default=4096, help="Rychlost hashování/dekomprese v KiB/s")
+    parser.add_argument("--handshake-ms", type=float, default=0, help="Prodleva SSH handshaku v ms")
+    parser.add_argument("--boot-time", type=float, default=2, help="Doba restartu v sekundách")
+    parser.add_argument("--link-kbps", type=float, default=0, help="Propustnost linky v KiB/s (0 = bez omezení)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Jednosměrná latence linky v ms")
+    args = parser.parse_args()
+
+    operations = [op.strip() for op in args.operations.split(",") if op.strip()]
+    params = {}
+    if "upload_serialgateway" in operations:
+        # Nahrávaný soubor musí být v katalogu binárek (adresář podle APP_ROOT)
+        if not os.path.isdir(BINARIES_PATH):
+            raise SystemExit(f"Adresář {BINARIES_PATH} neexistuje, nastavte APP_ROOT")
+        fd, path = tempfile.mkstemp(prefix="bench-fleet-", suffix=".bin", dir=BINARIES_PATH)
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"\x7fELF" + os.urandom(args.file_size - 4))
+        params["filename"] = os.path.basename(path)
+    try:
+        results = [
+            run_level(args, int(level), operations, params)
+            for level in args.concurrency.split(",")
+        ]
+    finally:
+        if params.get("filename"):
+            os.remove(os.path.join(BINARIES_PATH, params["filename"]))
+    print(json.dumps({
+        "devices": args.devices,
+        "operations": operations,
+        "cpu_delay_ms": args.cpu_delay_ms,
+        "link_kbps": args.link_kbps,
+        "latency_ms": args.latency_ms,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
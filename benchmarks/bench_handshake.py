@@ -0,0 +1,108 @@
+"""
+Benchmark navázání SSH spojení podle profilu algoritmů.
+
+Proti lokálnímu náhradnímu SSH serveru (výchozí algoritmy paramiko
+a starší sshd jen s klasickým Diffie-Hellman) změří pro každý profil
+dobu připojení po fázích (TCP, výměna klíčů, autentizace, SFTP)
+a vyjednané algoritmy. Host klíč se ukládá do dočasné cache, první
+připojení každé kombinace ho teprve ukládá a do výsledků se nepočítá.
+
+Spuštění:
+    python -m benchmarks.bench_handshake --repeat 20 --latency-ms 5
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+
+from app import ssh_profiles
+from app.ssh_operations import SSHSession
+from app.ssh_profiles import HANDSHAKE_PHASES, PROFILES, HostKeyCache
+from benchmarks.bench_transfer import ThrottledProxy
+from benchmarks.standin_server import LEGACY_SSHD, StandInServer
+
+# Varianty serveru: název -> podporované algoritmy sshd
+SERVERS = {
+    "modern": None,
+    "legacy": LEGACY_SSHD,
+}
+
+
+def connect_once(port: int, password: str, profile_name: str) -> dict:
+    session = SSHSession(profile=PROFILES[profile_name])
+    session.connect("127.0.0.1", port, password)
+    handshake = session.handshake
+    session.disconnect()
+    return handshake
+
+
+def measure(port: int, password: str, profile_name: str, repeat: int) -> dict:
+    """Připojí se `repeat`krát a vrací mediány fází v ms a vyjednané algoritmy."""
+    # Zahřátí: uložení host klíče do cache
+    first_host_key = connect_once(port, password, profile_name)["host_key"]
+    samples = [connect_once(port, password, profile_name) for _ in range(repeat)]
+    result = {
+        "profile": profile_name,
+        "kex": samples[-1]["kex"],
+        "cipher": samples[-1]["cipher"],
+        "mac": samples[-1]["mac"],
+        "host_key_type": samples[-1]["host_key_type"],
+        "first_host_key": first_host_key,
+    }
+    total = [sum(sample[f"{phase}_ms"] for phase in HANDSHAKE_PHASES) for sample in samples]
+    for phase in HANDSHAKE_PHASES:
+        result[f"{phase}_ms"] = round(statistics.median(sample[f"{phase}_ms"] for sample in samples), 2)
+    result["total_ms"] = round(statistics.median(total), 2)
+    result["total_p90_ms"] = round(sorted(total)[int(len(total) * 0.9) - 1], 2) if len(total) >= 10 else None
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SSH handshaku podle profilu")
+    parser.add_argument("--repeat", type=int, default=10, help="Počet připojení pro každou kombinaci")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Jednosměrná latence linky v ms")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Porovnávané profily (čárkou oddělené)")
+    args = parser.parse_args()
+
+    profiles = [name.strip() for name in args.profiles.split(",") if name.strip()]
+    for name in profiles:
+        if name not in PROFILES:
+            parser.error(f"Neznámý profil: {name}")
+    # Host klíče do dočasného souboru, ne do cache aplikace
+    ssh_profiles.host_key_cache = HostKeyCache(
+        os.path.join(tempfile.mkdtemp(prefix="bench-handshake-"), "known_hosts")
+    )
+
+    results = {}
+    for server_name, algorithms in SERVERS.items():
+        server = StandInServer(sshd_algorithms=algorithms)
+        port = server.start()
+        proxy = None
+        if args.latency_ms:
+            proxy = ThrottledProxy(port, 0, args.latency_ms / 1000)
+            port = proxy.start()
+        try:
+            results[server_name] = [
+                measure(port, server.password, name, args.repeat) for name in profiles
+            ]
+        finally:
+            if proxy:
+                proxy.stop()
+            server.stop()
+
+    speedup = {}
+    for server_name, rows in results.items():
+        by_profile = {row["profile"]: row["total_ms"] for row in rows}
+        if "paramiko" in by_profile and "fast" in by_profile and by_profile["fast"]:
+            speedup[server_name] = round(by_profile["paramiko"] / by_profile["fast"], 2)
+    print(json.dumps({
+        "repeat": args.repeat,
+        "latency_ms": args.latency_ms,
+        "results": results,
+        "speedup_fast_vs_paramiko": speedup,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark latence příkazu: exec kanál pro každý příkaz vs. trvalý shell kanál.
+
+Spustí lokální náhradní SSH server a pro oba režimy SSHSession změří
+latenci jednoho příkazu (p50/p99/průměr).
+
+Spuštění:
+    python -m benchmarks.bench_shell_mode --commands 200 --spawn-delay 0.02
+"""
+import argparse
+import json
+import statistics
+import time
+
+from app.ssh_operations import SSHSession
+from benchmarks.standin_server import StandInServer
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Vrací percentil ze seznamu hodnot (nejbližší hodnota)."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(port: int, password: str, shell_mode: bool, commands: int, command: str) -> dict:
+    """Změří latenci `commands` příkazů v daném režimu."""
+    session = SSHSession(shell_mode=shell_mode)
+    session.connect("127.0.0.1", port, password)
+    try:
+        # Zahřátí (otevření shell kanálu se do měření nepočítá)
+        session.execute_command(command)
+        latencies = []
+        for _ in range(commands):
+            started = time.perf_counter()
+            session.execute_command(command)
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        session.disconnect()
+    return {
+        "mode": "shell" if shell_mode else "exec",
+        "commands": commands,
+        "mean_ms": round(statistics.mean(latencies), 3),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark exec vs. shell režimu SSHSession")
+    parser.add_argument("--commands", type=int, default=100, help="Počet měřených příkazů")
+    parser.add_argument("--command", default="echo ok", help="Měřený příkaz")
+    parser.add_argument("--spawn-delay", type=float, default=0.0,
+                        help="Prodleva serveru při otevření kanálu (simulace pomalého sshd)")
+    args = parser.parse_args()
+
+    server = StandInServer(spawn_delay=args.spawn_delay)
+    port = server.start()
+    try:
+        results = [
+            measure(port, server.password, False, args.commands, args.command),
+            measure(port, server.password, True, args.commands, args.command),
+        ]
+    finally:
+        server.stop()
+
+    exec_p50 = results[0]["p50_ms"]
+    shell_p50 = results[1]["p50_ms"]
+    print(json.dumps({
+        "spawn_delay_s": args.spawn_delay,
+        "results": results,
+        "speedup_p50": round(exec_p50 / shell_p50, 2) if shell_p50 else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Regresní sada benchmarků: dekódování a HTTP endpointy.
+
+Mikrobenchmarky měří `decode_auskey`, `_decode_kek`, `_get_bytes`
+a vykreslení šablony index.html (ns na volání). HTTP část volá FastAPI
+aplikaci přímo v procesu přes ASGI (bez sítě a bez dalších závislostí)
+a pro každý endpoint hlásí p50/p99 latenci a requesty za sekundu.
+
+Výsledky lze uložit jako JSON baseline a při dalším běhu s ní porovnat;
+zhoršení nad toleranci se vypíše a skript skončí s kódem 1.
+
+Pokud není nastavené APP_ROOT, aplikace běží nad dočasným adresářem
+s odkazy na templates/ a static/ z repozitáře a vygenerovanými binárkami.
+
+Spuštění:
+    python -m benchmarks.bench_suite --save benchmarks/baseline.json
+    python -m benchmarks.bench_suite --compare benchmarks/baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable
+from urllib.parse import urlencode
+
+from benchmarks.bench_decode_batch import generate_rows
+from benchmarks.gbl_image import build_gbl
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Metriky, u kterých je lepší nižší hodnota (ostatní: vyšší je lepší)
+LOWER_IS_BETTER = ("ns_per_call", "p50_ms", "p99_ms", "mean_ms")
+
+
+def prepare_app_root() -> str:
+    """Vytvoří dočasný APP_ROOT s templates/static z repozitáře a ukázkovými binárkami."""
+    root = tempfile.mkdtemp(prefix="bench-suite-")
+    for name in ("templates", "static"):
+        os.symlink(os.path.join(REPO_ROOT, name), os.path.join(root, name))
+    binaries = os.path.join(root, "binaries")
+    os.makedirs(binaries)
+    files = {
+        "serialgateway.bin": b"\x7fELF" + bytes(64 * 1024),
+        "sx.bin": b"\x7fELF" + bytes(16 * 1024),
+        "NCP_UHW_MG1B232_678_PA0-PA1-PB11_PA5-PA4.gbl": build_gbl(bytes(200 * 1024), version=0x06070800),
+        "ncp-uart-sw_7.4.gbl": build_gbl(bytes(200 * 1024), version=0x07040000, metadata={"ezsp_version": 13}),
+    }
+    for name, data in files.items():
+        with open(os.path.join(binaries, name), "wb") as f:
+            f.write(data)
+    return root
+
+
+def microbench(fn: Callable[[], object], min_time: float = 0.2, repeat: int = 5) -> dict:
+    """
+    Změří dobu jednoho volání `fn` (nejlepší z `repeat` běhů).
+
+    Počet volání v jednom běhu se kalibruje tak, aby běh trval aspoň `min_time` sekund.
+    """
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / 10:
+            break
+        loops *= 10
+    loops = max(1, int(loops * min_time / max(elapsed, 1e-9)))
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, (time.perf_counter() - started) / loops)
+    return {"loops": loops, "ns_per_call": round(best * 1e9, 1), "ops_per_s": round(1 / best)}
+
+
+async def asgi_request(app, method: str, path: str, body: bytes = b"", headers: tuple = ()) -> tuple[int, bytes]:
+    """Provede jeden HTTP request přímo proti ASGI aplikaci, vrací status a tělo."""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [(b"host", b"bench")] + [(k.encode(), v.encode()) for k, v in headers],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    sent = False
+    status = 0
+    chunks = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Endpoint nečeká na odpojení klienta, ale pro jistotu se neblokuje navždy
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def http_bench(app, method: str, path: str, requests: int, concurrency: int,
+                     body: bytes = b"", headers: tuple = ()) -> dict:
+    """Pošle `requests` requestů (`concurrency` souběžně) a vrací latence a propustnost."""
+    status, _ = await asgi_request(app, method, path, body, headers)
+    if status >= 400:
+        raise RuntimeError(f"{method} {path} vrátil {status}")
+    latencies: list[float] = []
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            await asgi_request(app, method, path, body, headers)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+def run_micro(min_time: float) -> dict:
+    from app.decode import decode_auskey, _decode_kek, _get_bytes
+    from app.main import templates
+
+    row = generate_rows(1)[0]
+    kek_raw = _get_bytes(row["kek"])
+    template = templates.get_template("index.html")
+    return {
+        "decode_auskey": microbench(lambda: decode_auskey(row["kek"], row["auskey_line1"], row["auskey_line2"]), min_time),
+        "_decode_kek": microbench(lambda: _decode_kek(kek_raw), min_time),
+        "_get_bytes": microbench(lambda: _get_bytes(row["auskey_line1"]), min_time),
+        "render_index_html": microbench(lambda: template.render({"request": None}), min_time),
+    }
+
+
+def run_http(requests: int, concurrency: int) -> dict:
+    from app.main import app
+
+    row = generate_rows(1)[0]
+    form = urlencode({"kek": row["kek"], "auskey_line1": row["auskey_line1"], "auskey_line2": row["auskey_line2"]})
+    form_headers = (("content-type", "application/x-www-form-urlencoded"),)
+    cases = {
+        "POST /api/decode": ("POST", "/api/decode", form.encode(), form_headers),
+        "GET /api/ssh/status": ("GET", "/api/ssh/status", b"", ()),
+        "GET /api/files/list": ("GET", "/api/files/list", b"", ()),
+        "GET /": ("GET", "/", b"", ()),
+        "GET /static/js/app.js": ("GET", "/static/js/app.js", b"", (("accept-encoding", "br, gzip"),)),
+    }
+
+    async def run_all() -> dict:
+        return {
+            name: await http_bench(app, method, path, requests, concurrency, body, headers)
+            for name, (method, path, body, headers) in cases.items()
+        }
+
+    return asyncio.run(run_all())
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Vrací popisy metrik, které se oproti baseline zhoršily o víc než `tolerance`."""
+    regressions = []
+    for section in ("micro", "http"):
+        for name, metrics in current.get(section, {}).items():
+            base = baseline.get(section, {}).get(name)
+            if not base:
+                continue
+            for key, value in metrics.items():
+                old = base.get(key)
+                if key == "loops" or key == "requests" or not old:
+                    continue
+                change = (value - old) / old
+                worse = change > tolerance if key in LOWER_IS_BETTER else change < -tolerance
+                if worse:
+                    regressions.append(f"{section}/{name} {key}: {old} -> {value} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regresní benchmarky dekódování a HTTP endpointů")
+    parser.add_argument("--requests", type=int, default=2000, help="Počet requestů na endpoint")
+    parser.add_argument("--concurrency", type=int, default=1, help="Počet souběžných requestů")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimální doba jednoho běhu mikrobenchmarku (s)")
+    parser.add_argument("--save", help="Uloží výsledky jako JSON baseline")
+    parser.add_argument("--compare", help="Porovná výsledky s JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Povolené zhoršení oproti baseline (0.15 = 15 %%)")
+    args = parser.parse_args()
+
+    if "APP_ROOT" not in os.environ:
+        os.environ["APP_ROOT"] = prepare_app_root()
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "micro": run_micro(args.min_time),
+        "http": run_http(args.requests, args.concurrency),
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESE {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"Bez regresí oproti {args.compare} (tolerance {args.tolerance:.0%})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Benchmark nahrávání souboru: SFTP vs. gzip přes exec kanál.
+
+Spustí lokální náhradní SSH server, volitelně za proxy s omezenou
+propustností a latencí (simulace pomalé linky ke gateway), a pro oba
+způsoby přenosu změří dobu nahrání, počet odeslaných bytů a kompresní poměr.
+
+Spuštění:
+    python -m benchmarks.bench_transfer --file /app/binaries/serialgateway.bin --link-kbps 1024
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from app.catalog import compressed_artifact
+from app.ssh_operations import SSHSession
+from benchmarks.standin_server import StandInServer
+
+
+class ThrottledProxy:
+    """
+    TCP proxy s omezenou propustností (v každém směru) a latencí.
+
+    Každý směr se chová jako linka: data se serializují rychlostí `kbps`
+    a doručí se `latency` sekund po odeslání, čtení ze zdroje se přitom
+    neblokuje (v letu může být víc bloků najednou).
+
+    Args:
+        upstream_port: Port cílového serveru na 127.0.0.1
+        kbps: Propustnost v kilobytech za sekundu (0 = neomezeno)
+        latency: Jednosměrná latence v sekundách
+    """
+
+    def __init__(self, upstream_port: int, kbps: float = 0, latency: float = 0.0):
+        self.upstream_port = upstream_port
+        self.rate = kbps * 1024
+        self.latency = latency
+        self._sock: Optional[socket.socket] = None
+
+    def start(self) -> int:
+        """Spustí proxy na pozadí a vrací její port."""
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(16)
+        threading.Thread(target=self._accept_loop, daemon=True, name="proxy-accept").start()
+        return self._sock.getsockname()[1]
+
+    def stop(self):
+        if self._sock:
+            self._sock.close()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                break
+            try:
+                upstream = socket.create_connection(("127.0.0.1", self.upstream_port))
+            except OSError:
+                # Cíl nenaslouchá (např. restart simulované gateway) - stejně jako bez proxy
+                client.close()
+                continue
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            for src, dst in ((client, upstream), (upstream, client)):
+                line: "queue.Queue[Optional[tuple[float, bytes]]]" = queue.Queue()
+                threading.Thread(target=self._pump, args=(src, line), daemon=True).start()
+                threading.Thread(target=self._deliver, args=(line, dst), daemon=True).start()
+
+    def _pump(self, src: socket.socket, line: "queue.Queue"):
+        """Čte ze zdroje a řadí bloky na linku s časem doručení."""
+        link_free = 0.0
+        try:
+            while data := src.recv(16384):
+                now = time.monotonic()
+                link_free = max(now, link_free) + (len(data) / self.rate if self.rate else 0)
+                line.put((link_free + self.latency, data))
+        except OSError:
+            pass
+        finally:
+            line.put(None)
+
+    def _deliver(self, line: "queue.Queue", dst: socket.socket):
+        """Doručuje bloky z linky v čase doručení."""
+        try:
+            while (item := line.get()) is not None:
+                due, data = item
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            try:
+                dst.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def measure(port: int, password: str, local_path: str, transfer: str, repeat: int) -> dict:
+    """Nahraje soubor `repeat`krát daným způsobem a vrací nejlepší a průměrný čas."""
+    session = SSHSession()
+    session.connect("127.0.0.1", port, password)
+    times = []
+    try:
+        for i in range(repeat):
+            remote_path = f"/upload-{transfer}-{i}.bin"
+            result = session.sync_file(local_path, remote_path, mode=None, transfer=transfer)
+            times.append(result["elapsed_ms"])
+    finally:
+        session.disconnect()
+    return {
+        "transfer": result["transfer"],
+        "size": result["size"],
+        "bytes_sent": result["bytes_sent"],
+        "compression_ratio": result["compression_ratio"],
+        "best_ms": min(times),
+        "mean_ms": round(sum(times) / len(times), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SFTP vs. gzip nahrávání")
+    parser.add_argument("--file", help="Nahrávaný soubor (výchozí: vygenerovaná data podobná binárce)")
+    parser.add_argument("--size", type=int, default=2 * 1024 * 1024, help="Velikost vygenerovaného souboru")
+    parser.add_argument("--link-kbps", type=float, default=0, help="Propustnost linky v KiB/s (0 = bez omezení)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Jednosměrná latence linky v ms")
+    parser.add_argument("--repeat", type=int, default=3, help="Počet opakování pro každý způsob")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench-transfer-")
+    local_path = args.file
+    if not local_path:
+        # Polovina náhodná, polovina opakující se data - zhruba jako spustitelný soubor
+        local_path = os.path.join(root, "payload.bin")
+        with open(local_path, "wb") as f:
+            f.write(os.urandom(args.size // 2))
+            f.write((b"\x00\x00\x00\x00serialgateway\x01\x02" * (args.size // 32 + 1))[:args.size - args.size // 2])
+
+    # Komprimovaná kopie se cachuje, do měření se nepočítá
+    started = time.perf_counter()
+    compressed_artifact(local_path)
+    compress_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    server = StandInServer(root=root)
+    port = server.start()
+    proxy = None
+    if args.link_kbps or args.latency_ms:
+        proxy = ThrottledProxy(port, args.link_kbps, args.latency_ms / 1000)
+        port = proxy.start()
+    try:
+        results = [
+            measure(port, server.password, local_path, "sftp", args.repeat),
+            measure(port, server.password, local_path, "gzip", args.repeat),
+        ]
+    finally:
+        if proxy:
+            proxy.stop()
+        server.stop()
+
+    sftp_ms = results[0]["best_ms"]
+    gzip_ms = results[1]["best_ms"]
+    print(json.dumps({
+        "file": os.path.basename(local_path),
+        "link_kbps": args.link_kbps,
+        "latency_ms": args.latency_ms,
+        "compress_ms": compress_ms,
+        "results": results,
+        "speedup": round(sftp_ms / gzip_ms, 2) if gzip_ms else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark nahrání upgrade souborů: postupně vs. souběžně po více SFTP kanálech.
+
+Spustí lokální náhradní SSH server za proxy s omezenou propustností
+a latencí a opakovaně nahraje sx.bin a firmware (.gbl) oběma způsoby.
+První souběžné nahrání otevírá další SFTP kanál, další ho už používají znovu.
+
+Spuštění:
+    python -m benchmarks.bench_upgrade_upload --firmware fw.gbl --link-kbps 1024 --latency-ms 20
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from app.ssh_operations import FirmwareUpgrade, SSHSession
+from benchmarks.bench_transfer import ThrottledProxy
+from benchmarks.standin_server import StandInServer
+
+
+def measure(port: int, password: str, root: str, firmware: str, parallel: bool, repeat: int) -> dict:
+    """Nahraje upgrade soubory `repeat`krát (pokaždé znovu) a vrací časy a propustnost."""
+    session = SSHSession()
+    session.connect("127.0.0.1", port, password)
+    upgrade = FirmwareUpgrade(session)
+    times = []
+    throughputs = []
+    try:
+        for _ in range(repeat):
+            for name in os.listdir(os.path.join(root, "tmp")):
+                os.remove(os.path.join(root, "tmp", name))
+            result = upgrade.upload_upgrade_files(firmware, transfer="sftp", parallel=parallel)
+            times.append(result["elapsed_ms"])
+            throughputs.append(result["throughput_bps"])
+    finally:
+        session.disconnect()
+    return {
+        "parallel": parallel,
+        "first_ms": times[0],
+        "best_ms": min(times),
+        "mean_ms": round(sum(times) / len(times), 1),
+        "best_throughput_bps": max(throughputs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark postupného a souběžného nahrání upgrade souborů")
+    parser.add_argument("--firmware", default="fw.gbl", help="Firmware soubor z adresáře binaries")
+    parser.add_argument("--link-kbps", type=float, default=1024, help="Propustnost linky v KiB/s (0 = bez omezení)")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Jednosměrná latence linky v ms")
+    parser.add_argument("--repeat", type=int, default=5, help="Počet opakování pro každý způsob")
+    args = parser.parse_args()
+
+    # SFTP náhradního serveru je zakořeněné v dočasném adresáři (soubory jdou do <root>/tmp)
+    root = tempfile.mkdtemp(prefix="bench-upgrade-")
+    os.makedirs(os.path.join(root, "tmp"))
+    server = StandInServer(root=root)
+    port = server.start()
+    proxy = ThrottledProxy(port, args.link_kbps, args.latency_ms / 1000)
+    port = proxy.start()
+    try:
+        results = [
+            measure(port, server.password, root, args.firmware, False, args.repeat),
+            measure(port, server.password, root, args.firmware, True, args.repeat),
+        ]
+    finally:
+        proxy.stop()
+        server.stop()
+
+    print(json.dumps({
+        "firmware": args.firmware,
+        "link_kbps": args.link_kbps,
+        "latency_ms": args.latency_ms,
+        "results": results,
+        "speedup": round(results[0]["best_ms"] / results[1]["best_ms"], 2) if results[1]["best_ms"] else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
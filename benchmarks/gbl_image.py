@@ -0,0 +1,70 @@
+"""
+Sestavení platných GBL obrazů pro benchmarky a simulátor.
+
+Obraz má stejnou strukturu jako výstup commanderu Silicon Labs (hlavička,
+application, volitelná metadata, data programu, koncový tag s CRC32), takže
+projde kontrolou v app.gbl. Obsah programu jsou náhodná nebo zadaná data.
+
+Spuštění (zapíše ukázkový obraz):
+    python -m benchmarks.gbl_image out.gbl --size 200000 --ezsp-version 8
+"""
+import argparse
+import json
+import os
+import struct
+import zlib
+from typing import Optional
+
+from app.gbl import (GBL_TAG_APPLICATION, GBL_TAG_END, GBL_TAG_HEADER, GBL_TAG_METADATA,
+                     GBL_TAG_PROG)
+
+# Verze hlavičky 3.0, nešifrovaný a nepodepsaný obraz
+HEADER_VERSION = 0x03000000
+
+# Délka jednoho tagu s daty programu (commander dělí program po blocích)
+PROG_CHUNK = 64 * 1024
+
+
+def _tag(tag: int, body: bytes) -> bytes:
+    return struct.pack("<II", tag, len(body)) + body
+
+
+def build_gbl(program: bytes, version: int = 0x06070800, app_type: int = 1,
+              metadata: Optional[dict] = None, address: int = 0) -> bytes:
+    """
+    Vrací bytes platného GBL obrazu s daným programem.
+
+    Args:
+        program: Data programu
+        version: Verze aplikace (po bytech, major v nejvyšším bytu)
+        app_type: Typ aplikace (bitová maska, 1 = zigbee)
+        metadata: Metadata uložená jako JSON (např. {"ezsp_version": 8})
+        address: Adresa programu ve flash
+    """
+    parts = [
+        _tag(GBL_TAG_HEADER, struct.pack("<II", HEADER_VERSION, 0)),
+        _tag(GBL_TAG_APPLICATION, struct.pack("<III", app_type, version, 0) + bytes(16) + bytes([1])),
+    ]
+    if metadata is not None:
+        parts.append(_tag(GBL_TAG_METADATA, json.dumps(metadata).encode("utf-8")))
+    for offset in range(0, len(program), PROG_CHUNK):
+        chunk = program[offset:offset + PROG_CHUNK]
+        parts.append(_tag(GBL_TAG_PROG, struct.pack("<I", address + offset) + chunk))
+    image = b"".join(parts) + struct.pack("<II", GBL_TAG_END, 4)
+    return image + struct.pack("<I", zlib.crc32(image))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zapíše ukázkový GBL obraz")
+    parser.add_argument("output", help="Cílový soubor")
+    parser.add_argument("--size", type=int, default=200_000, help="Velikost programu v bytech")
+    parser.add_argument("--ezsp-version", type=int, help="Verze EZSP uložená v metadatech")
+    args = parser.parse_args()
+
+    metadata = {"ezsp_version": args.ezsp_version} if args.ezsp_version else None
+    with open(args.output, "wb") as f:
+        f.write(build_gbl(os.urandom(args.size), metadata=metadata))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+"""
+Simulátor Lidl gateway pro zátěžové testy SSH cest bez hardwaru.
+
+Virtuální gateway emuluje souborový systém (/tuya/ssh_monitor.sh,
+/tuya/tuya_start.sh, /tuya/serialgateway), busybox příkazy, UART
+/dev/ttyS1 se Zigbee modulem, reboot a volitelně pomalé CPU a linku.
+Na jednom stroji lze spustit stovky zařízení.
+
+Spuštění:
+    python -m benchmarks.simulator --devices 200 --base-port 30000 --inventory fleet.csv
+"""
+from benchmarks.simulator.device import VirtualGateway
+from benchmarks.simulator.fleet import GatewayFleet
+
+__all__ = ["VirtualGateway", "GatewayFleet"]
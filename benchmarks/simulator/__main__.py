@@ -0,0 +1,73 @@
+"""
+Spuštění flotily virtuálních gateway z příkazové řádky.
+
+    python -m benchmarks.simulator --devices 200 --base-port 30000 --inventory fleet.csv
+"""
+import argparse
+import json
+import time
+import logging
+
+from benchmarks.simulator.fleet import GatewayFleet
+from benchmarks.standin_server import LEGACY_SSHD
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flotila virtuálních Lidl gateway")
+    parser.add_argument("--devices", type=int, default=10, help="Počet zařízení")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=30000, help="Port prvního zařízení (0 = náhodné porty)")
+    parser.add_argument("--password", default="simulator", help="Heslo uživatele root")
+    parser.add_argument("--profile", choices=["stock", "hacked"], default="stock",
+                        help="Výchozí stav zařízení (původní firmware / po úpravách)")
+    parser.add_argument("--cpu-delay-ms", type=float, default=5, help="Prodleva za spuštěný proces v ms")
+    parser.add_argument("--cpu-rate-kbps", type=float, default=4096, help="Rychlost hashování/dekomprese v KiB/s")
+    parser.add_argument("--handshake-ms", type=float, default=0, help="Prodleva SSH handshaku v ms")
+    parser.add_argument("--legacy-sshd", action="store_true",
+                        help="sshd bez curve25519/ECDH (jen klasický DH), pro porovnání SSH profilů")
+    parser.add_argument("--boot-time", type=float, default=5, help="Doba restartu v sekundách")
+    parser.add_argument("--flash-time-scale", type=float, default=0.1,
+                        help="Násobek reálné doby flashování Zigbee modulu (1 = jako přes UART 115200)")
+    parser.add_argument("--monitor-lockout", type=float, default=0,
+                        help="Za kolik sekund zapnutý ssh_monitor.sh ukončí spojení (0 = nikdy)")
+    parser.add_argument("--link-kbps", type=float, default=0, help="Propustnost linky v KiB/s (0 = bez omezení)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Jednosměrná latence linky v ms")
+    parser.add_argument("--inventory", help="Zapíše inventář (CSV) pro fleet režim")
+    parser.add_argument("--stats-interval", type=float, default=30, help="Interval výpisu statistik v sekundách")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    fleet = GatewayFleet(
+        args.devices,
+        host=args.host,
+        base_port=args.base_port,
+        password=args.password,
+        link_kbps=args.link_kbps,
+        latency_ms=args.latency_ms,
+        profile=args.profile,
+        cpu_delay=args.cpu_delay_ms / 1000,
+        cpu_rate=args.cpu_rate_kbps * 1024,
+        handshake_delay=args.handshake_ms / 1000,
+        sshd_algorithms=LEGACY_SSHD if args.legacy_sshd else None,
+        boot_time=args.boot_time,
+        flash_time_scale=args.flash_time_scale,
+        monitor_lockout=args.monitor_lockout,
+    )
+    inventory = fleet.start()
+    if args.inventory:
+        with open(args.inventory, "w") as f:
+            f.write(fleet.inventory_csv())
+        logger.info(f"Inventář zapsán do {args.inventory}")
+    logger.info(f"Zařízení naslouchají na {inventory[0]['host']}:{inventory[0]['port']}-{inventory[-1]['port']}")
+    try:
+        while True:
+            time.sleep(args.stats_interval)
+            logger.info(json.dumps(fleet.stats()))
+    except KeyboardInterrupt:
+        fleet.stop()
+
+
+if __name__ == "__main__":
+    main()
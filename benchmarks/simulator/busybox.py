@@ -0,0 +1,717 @@
+"""
+Applety busybox virtuální gateway.
+
+Každý příkaz je funkce `(shell, args, streams) -> exit code`. Chybové
+hlášky napodobují busybox, aby je aplikace viděla stejně jako na zařízení.
+Výjimky OSError převede na hlášku `<applet>: <důvod>` volající (VirtualGateway).
+"""
+import hashlib
+import posixpath
+import re
+import stat
+import time
+import zlib
+
+from benchmarks.simulator.shell import ShellExit, Streams
+
+# Příkazy vestavěné v ash - neforkují se, neplatí se za ně CPU prodleva
+SHELL_BUILTINS = {":", "true", "false", "echo", "printf", "test", "[", "exit", "cd", "export", "unset", "set", "pwd", "kill"}
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "\\": "\\", "a": "\a", "b": "\b", "f": "\f", "v": "\v", "e": "\x1b"}
+
+
+def _unescape(text: str) -> tuple[bytes, bool]:
+    """Zpracuje escape sekvence echo -e / printf; vrací (bytes, zastavit výstup po \\c)."""
+    out = bytearray()
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c != "\\" or i + 1 >= len(text):
+            out += c.encode("utf-8")
+            i += 1
+            continue
+        n = text[i + 1]
+        if n in _ESCAPES:
+            out += _ESCAPES[n].encode()
+            i += 2
+        elif n == "c":
+            return bytes(out), True
+        elif n == "x":
+            m = re.compile(r"[0-9a-fA-F]{1,2}").match(text, i + 2)
+            if m:
+                out.append(int(m.group(0), 16))
+                i = m.end()
+            else:
+                out += b"\\x"
+                i += 2
+        elif n in "01234567":
+            m = re.compile(r"0?[0-7]{1,3}").match(text, i + 1)
+            out.append(int(m.group(0), 8) & 0xFF)
+            i = m.end()
+        else:
+            out += b"\\" + n.encode("utf-8")
+            i += 2
+    return bytes(out), False
+
+
+def _read_all(stream) -> bytes:
+    chunks = []
+    while chunk := stream.read(65536):
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _inputs(shell, args: list[str], streams: Streams, applet: str):
+    """Vstupy příkazu: soubory z argumentů nebo stdin (`-`); chyby vypisuje na stderr."""
+    if not args:
+        yield "-", _read_all(streams.stdin)
+        return
+    for name in args:
+        if name == "-":
+            yield name, _read_all(streams.stdin)
+            continue
+        path = shell.path(name)
+        device = shell.fs.device(path)
+        try:
+            data = device.read(-1) if device is not None else shell.fs.read(path)
+        except OSError as e:
+            streams.err(f"{applet}: can't open '{name}': {e.strerror}")
+            yield name, None
+            continue
+        yield name, data
+
+
+# Shell
+
+def cmd_true(shell, args, streams):
+    return 0
+
+
+def cmd_false(shell, args, streams):
+    return 1
+
+
+def cmd_exit(shell, args, streams):
+    raise ShellExit(int(args[0]) if args and args[0].lstrip("-").isdigit() else shell.status)
+
+
+def cmd_cd(shell, args, streams):
+    path = shell.path(args[0] if args else "/root")
+    if not shell.fs.isdir(path):
+        streams.err(f"sh: cd: can't cd to {args[0] if args else path}: No such file or directory")
+        return 2
+    shell.cwd = path
+    return 0
+
+
+def cmd_pwd(shell, args, streams):
+    streams.stdout.write(shell.cwd.encode() + b"\n")
+    return 0
+
+
+def cmd_export(shell, args, streams):
+    for arg in args:
+        if "=" in arg:
+            name, value = arg.split("=", 1)
+            shell.vars[name] = value
+    return 0
+
+
+def cmd_unset(shell, args, streams):
+    for arg in args:
+        shell.vars.pop(arg, None)
+    return 0
+
+
+def cmd_set(shell, args, streams):
+    # Volby shellu (set -e apod.) simulace nepodporuje, jen je přijme
+    return 0
+
+
+def cmd_echo(shell, args, streams):
+    newline = True
+    escapes = False
+    while args and re.fullmatch(r"-[neE]+", args[0]):
+        newline = newline and "n" not in args[0]
+        escapes = ("e" in args[0]) or (escapes and "E" not in args[0])
+        args = args[1:]
+    text = " ".join(args)
+    if escapes:
+        data, stop = _unescape(text)
+        if stop:
+            newline = False
+    else:
+        data = text.encode("utf-8")
+    streams.stdout.write(data + (b"\n" if newline else b""))
+    return 0
+
+
+def cmd_printf(shell, args, streams):
+    if not args:
+        streams.err("printf: usage: printf FORMAT [ARGUMENT...]")
+        return 1
+    fmt, values = args[0], args[1:]
+    spec = re.compile(r"%([-+ #0]*\d*(?:\.\d+)?)([sdicuxXob%])")
+    status = 0
+    out = bytearray()
+    while True:
+        consumed = 0
+
+        def convert(m):
+            nonlocal consumed, status
+            flags, conv = m.group(1), m.group(2)
+            if conv == "%":
+                return "%"
+            value = values[consumed] if consumed < len(values) else ""
+            consumed += 1
+            if conv in "sb":
+                if conv == "b":
+                    value = _unescape(value)[0].decode("latin-1")
+                return ("%" + flags + "s") % value
+            if conv == "c":
+                return value[:1]
+            try:
+                number = int(value or "0", 0)
+            except ValueError:
+                streams.err(f"printf: invalid number '{value}'")
+                status = 1
+                number = 0
+            return ("%" + flags + ("d" if conv in "iu" else conv)) % number
+
+        text = spec.sub(convert, fmt)
+        data, stop = _unescape(text)
+        out += data
+        values = values[consumed:]
+        if stop or not values or not consumed:
+            break
+    streams.stdout.write(bytes(out))
+    return status
+
+
+def cmd_test(shell, args, streams):
+    if args and args[-1] == "]" and shell is not None:
+        args = args[:-1]
+    try:
+        return 0 if _test(shell, args) else 1
+    except ValueError as e:
+        streams.err(f"sh: {e}")
+        return 2
+
+
+def _test(shell, args: list[str]) -> bool:
+    if not args:
+        return False
+    if "-o" in args:
+        i = args.index("-o")
+        return _test(shell, args[:i]) or _test(shell, args[i + 1:])
+    if "-a" in args[1:]:
+        i = args.index("-a", 1)
+        return _test(shell, args[:i]) and _test(shell, args[i + 1:])
+    if args[0] == "!":
+        return not _test(shell, args[1:])
+    if len(args) == 1:
+        return args[0] != ""
+    if len(args) == 2:
+        op, value = args
+        if op == "-n":
+            return value != ""
+        if op == "-z":
+            return value == ""
+        path = shell.path(value)
+        fs = shell.fs
+        if op == "-e":
+            return fs.exists(path)
+        if op == "-f":
+            return fs.isfile(path)
+        if op == "-d":
+            return fs.isdir(path)
+        if op == "-c":
+            return fs.is_device(path)
+        if op == "-x":
+            return fs.is_executable(path) or fs.isdir(path)
+        if op in ("-s",):
+            return fs.isfile(path) and fs.stat(path).st_size > 0
+        if op in ("-r", "-w"):
+            return fs.exists(path)
+        raise ValueError(f"{op}: unknown operand")
+    if len(args) == 3:
+        left, op, right = args
+        if op == "=" or op == "==":
+            return left == right
+        if op == "!=":
+            return left != right
+        numeric = {"-eq": int.__eq__, "-ne": int.__ne__, "-lt": int.__lt__,
+                   "-le": int.__le__, "-gt": int.__gt__, "-ge": int.__ge__}
+        if op in numeric:
+            try:
+                return numeric[op](int(left), int(right))
+            except ValueError:
+                raise ValueError(f"{left if not left.lstrip('-').isdigit() else right}: bad number")
+    raise ValueError("syntax error: too many arguments")
+
+
+def cmd_kill(shell, args, streams):
+    pids = [a for a in args if not a.startswith("-")]
+    status = 0
+    for pid in pids:
+        if not shell.system.kill(int(pid) if pid.isdigit() else -1):
+            streams.err(f"sh: can't kill pid {pid}: No such process")
+            status = 1
+    return status
+
+
+# Soubory
+
+def cmd_cat(shell, args, streams):
+    status = 0
+    for name, data in _inputs(shell, [a for a in args if a != "-u"], streams, "cat"):
+        if data is None:
+            status = 1
+        else:
+            streams.stdout.write(data)
+    return status
+
+
+def _target(shell, source: str, destination: str) -> str:
+    path = shell.path(destination)
+    if shell.fs.isdir(path):
+        path = posixpath.join(path, posixpath.basename(source))
+    return path
+
+
+def cmd_cp(shell, args, streams):
+    paths = [a for a in args if not a.startswith("-")]
+    if len(paths) < 2:
+        streams.err("cp: missing destination")
+        return 1
+    status = 0
+    for source in paths[:-1]:
+        src = shell.path(source)
+        if not shell.fs.isfile(src):
+            streams.err(f"cp: can't stat '{source}': No such file or directory")
+            status = 1
+            continue
+        shell.fs.copy(src, _target(shell, source, paths[-1]))
+    return status
+
+
+def cmd_mv(shell, args, streams):
+    paths = [a for a in args if not a.startswith("-")]
+    if len(paths) < 2:
+        streams.err("mv: missing destination")
+        return 1
+    status = 0
+    for source in paths[:-1]:
+        src = shell.path(source)
+        if not shell.fs.exists(src):
+            streams.err(f"mv: can't rename '{source}': No such file or directory")
+            status = 1
+            continue
+        shell.fs.rename(src, _target(shell, source, paths[-1]))
+    return status
+
+
+def cmd_rm(shell, args, streams):
+    force = any(a.startswith("-") and "f" in a for a in args)
+    recursive = any(a.startswith("-") and "r" in a.lower() for a in args)
+    status = 0
+    for name in (a for a in args if not a.startswith("-")):
+        path = shell.path(name)
+        if shell.fs.isdir(path):
+            if not recursive:
+                streams.err(f"rm: '{name}' is a directory")
+                status = 1
+                continue
+            for child in shell.fs.listdir(path):
+                cmd_rm(shell, ["-rf", posixpath.join(path, child)], streams)
+            shell.fs.rmdir(path)
+        elif shell.fs.isfile(path):
+            shell.fs.remove(path)
+        elif not force:
+            streams.err(f"rm: can't remove '{name}': No such file or directory")
+            status = 1
+    return status
+
+
+def cmd_mkdir(shell, args, streams):
+    parents = "-p" in args
+    status = 0
+    for name in (a for a in args if not a.startswith("-")):
+        try:
+            shell.fs.mkdir(shell.path(name), parents=parents)
+        except OSError as e:
+            streams.err(f"mkdir: can't create directory '{name}': {e.strerror}")
+            status = 1
+    return status
+
+
+def cmd_chmod(shell, args, streams):
+    if len(args) < 2:
+        streams.err("chmod: missing operand")
+        return 1
+    mode_arg, names = args[0], args[1:]
+    status = 0
+    for name in names:
+        path = shell.path(name)
+        try:
+            current = shell.fs.stat(path).st_mode & 0o7777
+        except OSError:
+            streams.err(f"chmod: {name}: No such file or directory")
+            status = 1
+            continue
+        if re.fullmatch(r"[0-7]{1,4}", mode_arg):
+            mode = int(mode_arg, 8)
+        else:
+            m = re.fullmatch(r"([ugoa]*)([+-])([rwx]+)", mode_arg)
+            if not m:
+                streams.err(f"chmod: invalid mode '{mode_arg}'")
+                return 1
+            bits = sum({"r": 4, "w": 2, "x": 1}[c] for c in m.group(3))
+            who = m.group(1) or "a"
+            mask = sum(bits << shift for c, shift in (("u", 6), ("g", 3), ("o", 0)) if c in who or who == "a")
+            mode = current | mask if m.group(2) == "+" else current & ~mask
+        shell.fs.chmod(path, mode)
+    return status
+
+
+def cmd_ls(shell, args, streams):
+    long = any(a.startswith("-") and "l" in a for a in args)
+    names = [a for a in args if not a.startswith("-")] or ["."]
+    status = 0
+    lines = []
+    for name in names:
+        path = shell.path(name)
+        try:
+            entries = shell.fs.listdir(path) if shell.fs.isdir(path) else [None]
+        except OSError:
+            entries = []
+        if not shell.fs.exists(path):
+            streams.err(f"ls: {name}: No such file or directory")
+            status = 1
+            continue
+        for entry in entries:
+            full = path if entry is None else posixpath.join(path, entry)
+            label = name if entry is None else entry
+            if not long:
+                lines.append(label)
+                continue
+            st = shell.fs.stat(full)
+            lines.append(
+                f"{stat.filemode(st.st_mode)}    1 root     root     {st.st_size:>8} "
+                f"{time.strftime('%b %d %H:%M', time.localtime(st.st_mtime))} {label}"
+            )
+    if lines:
+        streams.stdout.write(("\n".join(lines) + "\n").encode("utf-8"))
+    return status
+
+
+def cmd_head(shell, args, streams):
+    count, size, files = 10, None, []
+    i = 0
+    while i < len(args):
+        if args[i] in ("-n", "-c") and i + 1 < len(args):
+            if args[i] == "-n":
+                count = int(args[i + 1])
+            else:
+                size = int(args[i + 1])
+            i += 2
+            continue
+        files.append(args[i])
+        i += 1
+    status = 0
+    for name, data in _inputs(shell, files, streams, "head"):
+        if data is None:
+            status = 1
+            continue
+        if size is not None:
+            streams.stdout.write(data[:size])
+        else:
+            streams.stdout.write(b"".join(data.splitlines(keepends=True)[:count]))
+    return status
+
+
+def cmd_wc(shell, args, streams):
+    flags = "".join(a[1:] for a in args if a.startswith("-")) or "lwc"
+    files = [a for a in args if not a.startswith("-")]
+    status = 0
+    for name, data in _inputs(shell, files, streams, "wc"):
+        if data is None:
+            status = 1
+            continue
+        counts = []
+        if "l" in flags:
+            counts.append(data.count(b"\n"))
+        if "w" in flags:
+            counts.append(len(data.split()))
+        if "c" in flags:
+            counts.append(len(data))
+        line = " ".join(f"{c:>7}" if len(counts) > 1 else str(c) for c in counts)
+        streams.stdout.write((line + ("" if name == "-" else f" {name}") + "\n").encode())
+    return status
+
+
+def cmd_grep(shell, args, streams):
+    flags = set()
+    positional = []
+    for arg in args:
+        if arg.startswith("-") and len(arg) > 1 and not positional:
+            flags.update(arg[1:])
+        else:
+            positional.append(arg)
+    if not positional:
+        streams.err("grep: usage: grep [-qvcF] PATTERN [FILE]...")
+        return 2
+    pattern, files = positional[0], positional[1:]
+    regex = re.compile(re.escape(pattern) if "F" in flags else pattern, re.IGNORECASE if "i" in flags else 0)
+    found = False
+    for name, data in _inputs(shell, files, streams, "grep"):
+        if data is None:
+            continue
+        matched = [
+            line for line in data.decode("utf-8", errors="replace").splitlines()
+            if bool(regex.search(line)) != ("v" in flags)
+        ]
+        found = found or bool(matched)
+        if "q" in flags:
+            continue
+        if "c" in flags:
+            streams.stdout.write(f"{len(matched)}\n".encode())
+        elif matched:
+            prefix = f"{name}:" if len(files) > 1 else ""
+            streams.stdout.write("".join(f"{prefix}{line}\n" for line in matched).encode("utf-8"))
+    return 0 if found else 1
+
+
+def _hash_command(algorithm: str):
+    def command(shell, args, streams):
+        status = 0
+        for name, data in _inputs(shell, args, streams, f"{algorithm}sum"):
+            if data is None:
+                status = 1
+                continue
+            shell.system.cpu_work(len(data))
+            digest = hashlib.new(algorithm, data).hexdigest()
+            streams.stdout.write(f"{digest}  {name}\n".encode())
+        return status
+    return command
+
+
+def cmd_gunzip(shell, args, streams):
+    to_stdout = any(a.startswith("-") and "c" in a for a in args)
+    files = [a for a in args if not a.startswith("-")]
+    if not to_stdout and not files:
+        to_stdout = True
+    status = 0
+    for name, data in _inputs(shell, files, streams, "gunzip"):
+        if data is None:
+            status = 1
+            continue
+        try:
+            output = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        except zlib.error:
+            streams.err("gunzip: invalid magic")
+            status = 1
+            continue
+        shell.system.cpu_work(len(output))
+        if to_stdout:
+            streams.stdout.write(output)
+        else:
+            path = shell.path(name)
+            target = path[:-3] if path.endswith(".gz") else path + ".out"
+            shell.fs.write(target, output)
+            shell.fs.remove(path)
+    return status
+
+
+def cmd_sync(shell, args, streams):
+    return 0
+
+
+def cmd_sleep(shell, args, streams):
+    try:
+        seconds = float(args[0]) if args else 0.0
+    except ValueError:
+        streams.err(f"sleep: invalid number '{args[0]}'")
+        return 1
+    shell.system.sleep(seconds)
+    return 0
+
+
+def cmd_df(shell, args, streams):
+    lines = ["Filesystem           1K-blocks      Used Available Use% Mounted on"]
+    for mount, size in shell.system.mounts():
+        used = shell.fs.usage(mount) // 1024
+        total = size // 1024
+        free = max(0, total - used)
+        percent = round(used * 100 / total) if total else 0
+        lines.append(f"{'tmpfs' if mount == '/tmp' else 'ubi0:rootfs':<20} {total:>9} {used:>9} {free:>9} {percent:>3}% {mount}")
+    streams.stdout.write(("\n".join(lines) + "\n").encode())
+    return 0
+
+
+# Systém
+
+def cmd_uname(shell, args, streams):
+    info = shell.system.uname()
+    flags = "".join(a[1:] for a in args if a.startswith("-")) or "s"
+    if "a" in flags:
+        flags = "snrvm"
+    keys = {"s": "sysname", "n": "nodename", "r": "release", "v": "version", "m": "machine"}
+    streams.stdout.write((" ".join(info[keys[f]] for f in "snrvm" if f in flags) + "\n").encode())
+    return 0
+
+
+def cmd_uptime(shell, args, streams):
+    uptime = shell.system.uptime()
+    streams.stdout.write(
+        f" {time.strftime('%H:%M:%S')} up {int(uptime // 60)} min,  load average: 0.42, 0.31, 0.25\n".encode()
+    )
+    return 0
+
+
+def cmd_date(shell, args, streams):
+    if args and args[0].startswith("+"):
+        streams.stdout.write((time.strftime(args[0][1:]) + "\n").encode())
+    else:
+        streams.stdout.write((time.strftime("%a %b %e %H:%M:%S UTC %Y") + "\n").encode())
+    return 0
+
+
+def cmd_ps(shell, args, streams):
+    lines = ["  PID USER       VSZ STAT COMMAND"]
+    for pid, command in shell.system.processes():
+        lines.append(f"{pid:>5} root      1024 S    {command}")
+    streams.stdout.write(("\n".join(lines) + "\n").encode())
+    return 0
+
+
+def cmd_pidof(shell, args, streams):
+    pids = [str(pid) for name in args for pid in shell.system.find_processes(name)]
+    if not pids:
+        return 1
+    streams.stdout.write((" ".join(pids) + "\n").encode())
+    return 0
+
+
+def cmd_killall(shell, args, streams):
+    names = [a for a in args if not a.startswith("-")]
+    status = 0
+    for name in names:
+        if not shell.system.kill_by_name(name):
+            streams.err(f"killall: {name}: no process killed")
+            status = 1
+    return status
+
+
+def cmd_ifconfig(shell, args, streams):
+    system = shell.system
+    names = [a for a in args if not a.startswith("-")]
+    if len(names) >= 2:
+        iface, address = names[0], names[1]
+        netmask = names[names.index("netmask") + 1] if "netmask" in names[:-1] else None
+        if address in ("up", "down"):
+            return 0 if system.interface(iface) else _no_device(streams, iface)
+        if not system.set_address(iface, address, netmask):
+            return _no_device(streams, iface)
+        return 0
+    interfaces = [names[0]] if names else system.interface_names()
+    out = []
+    for iface in interfaces:
+        info = system.interface(iface)
+        if info is None:
+            return _no_device(streams, iface)
+        out.append(
+            f"{iface:<10}Link encap:{info['encap']}  HWaddr {info['mac']}\n"
+            f"          inet addr:{info['address']}  Bcast:{info['broadcast']}  Mask:{info['netmask']}\n"
+            f"          UP BROADCAST RUNNING MULTICAST  MTU:{info['mtu']}  Metric:1\n"
+        )
+    streams.stdout.write("\n".join(out).encode())
+    return 0
+
+
+def _no_device(streams: Streams, iface: str) -> int:
+    streams.err(f"ifconfig: SIOCGIFFLAGS: No such device ({iface})")
+    return 1
+
+
+def cmd_udhcpc(shell, args, streams):
+    iface = args[args.index("-i") + 1] if "-i" in args[:-1] else "eth1"
+    shell.system.start_dhcp(iface)
+    return 0
+
+
+def cmd_stty(shell, args, streams):
+    device_path = "/dev/tty"
+    settings = list(args)
+    if "-F" in settings[:-1]:
+        i = settings.index("-F")
+        device_path = shell.path(settings[i + 1])
+        del settings[i:i + 2]
+    device = shell.fs.device(device_path)
+    if device is None or not hasattr(device, "configure"):
+        streams.err(f"stty: can't open '{device_path}': No such file or directory")
+        return 1
+    device.configure(settings)
+    if not settings:
+        streams.stdout.write(device.describe().encode() + b"\n")
+    return 0
+
+
+def cmd_reboot(shell, args, streams):
+    shell.system.schedule_reboot()
+    return 0
+
+
+def cmd_sh(shell, args, streams):
+    if args and args[0] == "-c":
+        sub = shell.subshell()
+        sub.args = args[2:]
+        return sub.run_script(args[1] if len(args) > 1 else "", streams)
+    if args:
+        return shell.system.run_script_file(shell, shell.path(args[0]), args[1:], streams)
+    return shell.run_script(_read_all(streams.stdin).decode("utf-8", errors="replace"), streams)
+
+
+COMMANDS = {
+    ":": cmd_true,
+    "true": cmd_true,
+    "false": cmd_false,
+    "exit": cmd_exit,
+    "cd": cmd_cd,
+    "pwd": cmd_pwd,
+    "export": cmd_export,
+    "unset": cmd_unset,
+    "set": cmd_set,
+    "echo": cmd_echo,
+    "printf": cmd_printf,
+    "test": cmd_test,
+    "[": cmd_test,
+    "kill": cmd_kill,
+    "cat": cmd_cat,
+    "cp": cmd_cp,
+    "mv": cmd_mv,
+    "rm": cmd_rm,
+    "mkdir": cmd_mkdir,
+    "chmod": cmd_chmod,
+    "ls": cmd_ls,
+    "head": cmd_head,
+    "wc": cmd_wc,
+    "grep": cmd_grep,
+    "sha256sum": _hash_command("sha256"),
+    "md5sum": _hash_command("md5"),
+    "gunzip": cmd_gunzip,
+    "sync": cmd_sync,
+    "sleep": cmd_sleep,
+    "df": cmd_df,
+    "uname": cmd_uname,
+    "uptime": cmd_uptime,
+    "date": cmd_date,
+    "ps": cmd_ps,
+    "pidof": cmd_pidof,
+    "killall": cmd_killall,
+    "ifconfig": cmd_ifconfig,
+    "udhcpc": cmd_udhcpc,
+    "stty": cmd_stty,
+    "reboot": cmd_reboot,
+    "sh": cmd_sh,
+}
@@ -0,0 +1,906 @@
+"""
+Virtuální Lidl gateway: souborový systém, procesy, síť, UART a SSH server.
+
+Zařízení přijímá SSH (heslo uživatele root), exec i shell kanály, jejichž
+příkazy vyhodnocuje interpret `shell.Shell`, a SFTP nad virtuálním
+souborovým systémem. `reboot` zavře spojení, po `boot_time` sekund
+zařízení znovu naběhne (nový boot_id, prázdné /tmp, procesy podle
+/tuya/tuya_start.sh).
+"""
+import hashlib
+import math
+import os
+import posixpath
+import selectors
+import socket
+import threading
+import time
+import uuid
+from typing import Optional
+import logging
+
+import paramiko
+
+from benchmarks.simulator import busybox
+from benchmarks.simulator.fs import FileIO, NullDevice, VirtualFS
+from benchmarks.simulator.shell import InteractiveShell, Shell, Streams
+from benchmarks.standin_server import get_host_key
+
+logger = logging.getLogger(__name__)
+
+# Serverové transporty hlásí každé odpojení klienta jako chybu - pro simulátor je to šum
+TRANSPORT_LOG_CHANNEL = "benchmarks.simulator.transport"
+logging.getLogger(TRANSPORT_LOG_CHANNEL).setLevel(logging.CRITICAL)
+
+ELF_MAGIC = b"\x7fELF"
+
+# Rámec EZSP launchStandaloneBootloader, který posílá flash_firmware
+LAUNCH_BOOTLOADER_FRAME = b"\x7D\x31\x43\x21\x27\x55\x6E\x90\x7E"
+
+# Výchozí kapacita tmpfs v /tmp (gateway má 32 MB RAM)
+DEFAULT_TMPFS_SIZE = 12 * 1024 * 1024
+
+# Jak dlouho po odeslání návratového kódu čekat, než kanál zavře server
+CLOSE_GRACE = 0.05
+
+# Jak dlouho čekat na SSH banner klienta po navázání TCP spojení
+BANNER_TIMEOUT = 15.0
+
+STOCK_TUYA_START = b"#!/bin/sh\n/tuya/tuyamain &\n"
+HACKED_TUYA_START = b"#!/bin/sh\n/tuya/serialgateway &\n"
+STOCK_SSH_MONITOR = (
+    b"#!/bin/sh\n"
+    b"# Hlidani SSH pristupu (simulace)\n"
+    b"while true; do\n"
+    b"    sleep 60\n"
+    b"done\n"
+)
+DISABLED_SSH_MONITOR = b"#!/bin/sh\n"
+
+# Obsah binárek ve výchozím obrazu (sdílený mezi zařízeními, kopíruje se až při zápisu)
+_FAKE_BINARY = ELF_MAGIC + bytes(60 * 1024)
+
+
+class FakeSerial:
+    """
+    /dev/ttyS1 - UART k Zigbee modulu.
+
+    Modul je v režimu `ncp` (EZSP), po rámci launchStandaloneBootloader
+    přejde do `bootloader` (menu Gecko bootloaderu), volba `1` zahájí
+    příjem XMODEM (`upload`). Přenos samotný emuluje program `sx`.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Nahraný firmware zůstává v modulu i po restartu gateway
+        self.firmware: Optional[dict] = None
+        self.reset()
+
+    def reset(self):
+        """Stav po zapnutí (volá se i při restartu gateway)."""
+        with self.lock:
+            self.mode = "ncp"
+            self.speed = 115200
+            self.settings: list[str] = []
+            self.written = 0
+            self._tail = b""
+            self._output = bytearray()
+
+    def configure(self, settings: list[str]):
+        with self.lock:
+            for setting in settings:
+                if setting.isdigit():
+                    self.speed = int(setting)
+            if settings:
+                self.settings = list(settings)
+
+    def describe(self) -> str:
+        return f"speed {self.speed} baud; {' '.join(self.settings)}".strip()
+
+    def write(self, data: bytes) -> int:
+        with self.lock:
+            self.written += len(data)
+            self._tail = (self._tail + data)[-64:]
+            if self.mode == "ncp" and LAUNCH_BOOTLOADER_FRAME in self._tail:
+                self.mode = "bootloader"
+                self._tail = b""
+                self._output += b"\r\nGecko Bootloader v1.9.2\r\n1. upload gbl\r\n2. run\r\n3. ebl info\r\nBL > "
+            elif self.mode == "bootloader" and data.strip() == b"1":
+                self.mode = "upload"
+                self._output += b"\r\nbegin upload\r\n\x43"
+            elif self.mode in ("bootloader", "upload") and data.strip() == b"2":
+                self.mode = "ncp"
+        return len(data)
+
+    def read(self, size: int = -1) -> bytes:
+        with self.lock:
+            size = len(self._output) if size is None or size < 0 else size
+            data = bytes(self._output[:size])
+            del self._output[:size]
+            return data
+
+    def flashed(self, name: str, data: bytes):
+        """Zaznamená nahraný firmware (modul zůstane v menu bootloaderu)."""
+        with self.lock:
+            self.mode = "bootloader"
+            self.firmware = {
+                "name": name,
+                "size": len(data),
+                "sha256": hashlib.sha256(data).hexdigest(),
+                "flashed_at": time.time(),
+            }
+            self._output += b"\r\nSerial upload complete\r\nBL > "
+
+    def close(self):
+        pass
+
+
+class _ChannelInput:
+    """stdin příkazu z SSH kanálu."""
+
+    def __init__(self, channel: paramiko.Channel):
+        self.channel = channel
+
+    def read(self, size: int = -1) -> bytes:
+        if size is not None and size >= 0:
+            try:
+                return self.channel.recv(size)
+            except (OSError, EOFError):
+                return b""
+        chunks = []
+        while chunk := self.read(65536):
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def close(self):
+        pass
+
+
+class _ChannelOutput:
+    """stdout/stderr příkazu do SSH kanálu (po zavření kanálu se výstup zahodí)."""
+
+    def __init__(self, send):
+        self.send = send
+
+    def write(self, data: bytes) -> int:
+        if data:
+            try:
+                self.send(data)
+            except (OSError, EOFError):
+                pass
+        return len(data)
+
+    def close(self):
+        pass
+
+
+class VirtualSFTPHandle(paramiko.SFTPHandle):
+    """SFTP handle nad souborem virtuálního FS."""
+
+    def __init__(self, flags: int, gateway: "VirtualGateway", path: str):
+        super().__init__(flags)
+        self.gateway = gateway
+        self.path = path
+
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(self.gateway.fs.stat(self.path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+    def write(self, offset, data):
+        result = super().write(offset, data)
+        if result == paramiko.SFTP_OK:
+            self.gateway.count("sftp_bytes", len(data))
+        return result
+
+
+class VirtualSFTPInterface(paramiko.SFTPServerInterface):
+    """SFTP server nad virtuálním souborovým systémem gateway."""
+
+    def __init__(self, server: "_GatewayServer", *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.gateway = server.gateway
+        self.fs = server.gateway.fs
+
+    def _path(self, path: str) -> str:
+        return self.fs.normalize(self.canonicalize(path))
+
+    def _call(self, fn, *args):
+        try:
+            fn(*args)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def list_folder(self, path):
+        real = self._path(path)
+        try:
+            result = []
+            for name in self.fs.listdir(real):
+                attr = paramiko.SFTPAttributes.from_stat(self.fs.stat(posixpath.join(real, name)))
+                attr.filename = name
+                result.append(attr)
+            return result
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(self.fs.stat(self._path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        real = self._path(path)
+        try:
+            if flags & (os.O_WRONLY | os.O_RDWR):
+                node = self.fs.node(real, create=bool(flags & os.O_CREAT), truncate=bool(flags & os.O_TRUNC))
+                handle_file = FileIO(self.fs, real, node, append=bool(flags & os.O_APPEND))
+            else:
+                handle_file = self.fs.open(real)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = VirtualSFTPHandle(flags, self.gateway, real)
+        handle.filename = real
+        handle.readfile = handle_file
+        handle.writefile = handle_file
+        return handle
+
+    def remove(self, path):
+        return self._call(self.fs.remove, self._path(path))
+
+    def rename(self, oldpath, newpath):
+        new = self._path(newpath)
+        if self.fs.exists(new):
+            return paramiko.SFTP_FAILURE
+        return self._call(self.fs.rename, self._path(oldpath), new)
+
+    def posix_rename(self, oldpath, newpath):
+        return self._call(self.fs.rename, self._path(oldpath), self._path(newpath))
+
+    def mkdir(self, path, attr):
+        return self._call(self.fs.mkdir, self._path(path))
+
+    def rmdir(self, path):
+        return self._call(self.fs.rmdir, self._path(path))
+
+    def chattr(self, path, attr):
+        if attr._flags & attr.FLAG_PERMISSIONS:
+            return self._call(self.fs.chmod, self._path(path), attr.st_mode)
+        return paramiko.SFTP_OK
+
+
+class _GatewayServer(paramiko.ServerInterface):
+    """Autentizace (root + heslo) a obsluha exec/shell kanálů virtuální gateway."""
+
+    def __init__(self, gateway: "VirtualGateway", transport: paramiko.Transport):
+        self.gateway = gateway
+        self.transport = transport
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if username == "root" and password == self.gateway.password:
+            self.gateway.on_login(self.transport)
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        text = command.decode("utf-8", errors="replace")
+        threading.Thread(target=self.gateway.run_exec, args=(channel, text), daemon=True).start()
+        return True
+
+    def check_channel_shell_request(self, channel):
+        threading.Thread(target=self.gateway.run_shell, args=(channel,), daemon=True).start()
+        return True
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_global_request(self, kind, msg):
+        # keepalive@openssh.com - dropbear odpovídá selháním, což klientovi stačí jako odezva
+        return False
+
+
+class VirtualGateway:
+    """
+    Jedna virtuální gateway naslouchající na vlastním portu.
+
+    Args:
+        name: Název zařízení (hostname, log)
+        host: Adresa, na které zařízení naslouchá
+        port: Port (0 = náhodný volný port, po restartu zůstává stejný)
+        password: Heslo uživatele root
+        profile: Výchozí obraz - `stock` (původní firmware) nebo `hacked`
+            (vypnutý monitor, upravený tuya_start.sh, nahraný serialgateway)
+        cpu_delay: Prodleva za každý spuštěný applet/proces v sekundách (fork na slabém CPU)
+        cpu_rate: Rychlost hashování a dekomprese v bytech za sekundu (0 = neomezeno)
+        handshake_delay: Prodleva před SSH handshakem (výměna klíčů na slabém CPU)
+        sshd_algorithms: Algoritmy, které sshd zařízení podporuje (klíče kex, ciphers,
+            digests, key_types jako u paramiko SecurityOptions, např. LEGACY_SSHD)
+        boot_time: Doba restartu v sekundách (od zavření spojení po nové naslouchání)
+        flash_time_scale: Násobek reálné doby XMODEM přenosu do Zigbee modulu (0 = okamžitě)
+        monitor_lockout: Po kolika sekundách zapnutý ssh_monitor.sh ukončí SSH spojení (0 = nikdy)
+        tmpfs_size: Kapacita /tmp v bytech
+        address: Adresa eth1 přidělená přes DHCP
+        acceptor: Sdílený acceptor (fleet); bez něj si zařízení spustí vlastní
+    """
+
+    def __init__(
+        self,
+        name: str = "gateway",
+        host: str = "127.0.0.1",
+        port: int = 0,
+        password: str = "simulator",
+        profile: str = "stock",
+        cpu_delay: float = 0.0,
+        cpu_rate: float = 0.0,
+        handshake_delay: float = 0.0,
+        sshd_algorithms: Optional[dict] = None,
+        boot_time: float = 2.0,
+        flash_time_scale: float = 0.0,
+        monitor_lockout: float = 0.0,
+        tmpfs_size: int = DEFAULT_TMPFS_SIZE,
+        address: str = "192.168.1.100",
+        acceptor: Optional["Acceptor"] = None,
+    ):
+        if profile not in ("stock", "hacked"):
+            raise ValueError(f"Neznámý profil zařízení: {profile}")
+        self.name = name
+        self.host = host
+        self.port = port
+        self.password = password
+        self.cpu_delay = cpu_delay
+        self.cpu_rate = cpu_rate
+        self.handshake_delay = handshake_delay
+        self.sshd_algorithms = sshd_algorithms or {}
+        self.boot_time = boot_time
+        self.flash_time_scale = flash_time_scale
+        self.monitor_lockout = monitor_lockout
+        self.dhcp_address = address
+        self.acceptor = acceptor
+        self._own_acceptor = acceptor is None
+
+        self.fs = VirtualFS(tmpfs_size=tmpfs_size)
+        self.serial = FakeSerial()
+        self.state = "off"
+        self.boot_id = ""
+        self.booted_at = 0.0
+        self.shell_pid = 0
+        self._lock = threading.RLock()
+        self._halt = threading.Event()
+        self._processes: dict[int, tuple[str, str]] = {}
+        self._next_pid = 100
+        self._interfaces: dict[str, dict] = {}
+        self._transports: list[paramiko.Transport] = []
+        self._sock: Optional[socket.socket] = None
+        self._stats = {"connections": 0, "logins": 0, "commands": 0, "sftp_bytes": 0, "reboots": 0}
+        self._install_image(profile)
+
+    # Obraz a boot
+
+    def _install_image(self, profile: str):
+        fs = self.fs
+        for directory in ("/bin", "/sbin", "/usr/bin", "/etc", "/root", "/tmp", "/tuya", "/var/run"):
+            fs.mkdir(directory, parents=True)
+        fs.add_device("/dev/null", NullDevice())
+        fs.add_device("/dev/ttyS1", self.serial)
+        fs.add_proc("/proc/sys/kernel/random/boot_id", lambda: f"{self.boot_id}\n".encode())
+        fs.add_proc("/proc/uptime", lambda: f"{self.uptime():.2f} {self.uptime() * 0.8:.2f}\n".encode())
+        fs.add_proc("/proc/cpuinfo", lambda: (
+            b"system type\t\t: RTL8196E\nprocessor\t\t: 0\ncpu model\t\t: 52481\nBogoMIPS\t\t: 398.13\n"
+        ))
+        fs.add_proc("/proc/meminfo", lambda: b"MemTotal:          29028 kB\nMemFree:            6120 kB\n")
+        fs.write("/etc/hostname", f"{self.name}\n".encode())
+        fs.write("/tuya/tuyamain", _FAKE_BINARY, mode=0o755)
+        if profile == "hacked":
+            fs.write("/tuya/ssh_monitor.sh", DISABLED_SSH_MONITOR, mode=0o755)
+            fs.write("/tuya/ssh_monitor.original.sh", STOCK_SSH_MONITOR, mode=0o755)
+            fs.write("/tuya/tuya_start.sh", HACKED_TUYA_START, mode=0o755)
+            fs.write("/tuya/tuya_start.original.sh", STOCK_TUYA_START, mode=0o755)
+            fs.write("/tuya/serialgateway", _FAKE_BINARY, mode=0o755)
+        else:
+            fs.write("/tuya/ssh_monitor.sh", STOCK_SSH_MONITOR, mode=0o755)
+            fs.write("/tuya/tuya_start.sh", STOCK_TUYA_START, mode=0o755)
+
+    def _boot(self):
+        """Start systému: nový boot_id, základní procesy, DHCP a tuya_start.sh."""
+        with self._lock:
+            self.boot_id = str(uuid.uuid4())
+            self.booted_at = time.monotonic()
+            self._processes = {}
+            self._next_pid = 100
+            self._interfaces = {
+                "lo": {"encap": "Local Loopback", "mac": "00:00:00:00:00:00", "address": "127.0.0.1",
+                       "broadcast": "0.0.0.0", "netmask": "255.0.0.0", "mtu": 65536},
+                "eth1": {"encap": "Ethernet", "mac": self._mac(), "address": self.dhcp_address,
+                         "broadcast": self.dhcp_address.rsplit(".", 1)[0] + ".255",
+                         "netmask": "255.255.255.0", "mtu": 1500},
+            }
+        for command in ("init", "syslogd -n", "dropbear -R", "udhcpc -i eth1 -S"):
+            self.start_process(command)
+        if self.monitor_active():
+            self.start_process("/bin/sh /tuya/ssh_monitor.sh", name="ssh_monitor.sh")
+        null = NullDevice()
+        streams = Streams(null, null, null)
+        shell = Shell(self)
+        if self.fs.is_executable("/tuya/tuya_start.sh"):
+            self.run_script_file(shell, "/tuya/tuya_start.sh", [], streams)
+
+    def _mac(self) -> str:
+        digest = uuid.uuid5(uuid.NAMESPACE_DNS, self.name).bytes
+        return ":".join(f"{b:02X}" for b in (b"\x68\x57\x2d" + digest[:3]))
+
+    def monitor_active(self) -> bool:
+        """ssh_monitor.sh dělá něco víc než jen `#!/bin/sh` (není vypnutý)."""
+        try:
+            content = self.fs.read("/tuya/ssh_monitor.sh").decode("utf-8", errors="replace")
+        except OSError:
+            return False
+        return any(line.strip() and not line.strip().startswith("#") for line in content.splitlines())
+
+    # Spuštění a zastavení
+
+    def start(self) -> int:
+        """Nabootuje zařízení a začne naslouchat; vrací port."""
+        if self.acceptor is None:
+            self.acceptor = Acceptor()
+            self.acceptor.start()
+        self._halt.clear()
+        self._boot()
+        self._listen()
+        self.state = "up"
+        return self.port
+
+    def stop(self):
+        """Vypne zařízení (zavře naslouchání i všechna spojení)."""
+        self.state = "off"
+        self._halt.set()
+        self._shutdown_network()
+        if self._own_acceptor and self.acceptor is not None:
+            self.acceptor.stop()
+            self.acceptor = None
+
+    def _listen(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(64)
+        sock.setblocking(False)
+        self.port = sock.getsockname()[1]
+        self._sock = sock
+        self.acceptor.add(sock, self.accept)
+
+    def _shutdown_network(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            self.acceptor.remove(sock)
+            sock.close()
+        with self._lock:
+            transports, self._transports = self._transports, []
+        for transport in transports:
+            transport.close()
+
+    def schedule_reboot(self, delay: float = 0.2):
+        """Restart na pozadí (příkaz `reboot` se stihne ukončit a odpovědět)."""
+        timer = threading.Timer(delay, self.reboot)
+        timer.daemon = True
+        timer.start()
+
+    def reboot(self):
+        with self._lock:
+            if self.state != "up":
+                return
+            self.state = "rebooting"
+            self._stats["reboots"] += 1
+        logger.debug(f"{self.name}: restart")
+        self._halt.set()
+        self._shutdown_network()
+        self.fs.clear("/tmp")
+        self.serial.reset()
+        time.sleep(self.boot_time)
+        if self.state != "rebooting":
+            return
+        self._halt.clear()
+        self._boot()
+        self._listen()
+        self.state = "up"
+
+    # SSH
+
+    def accept(self, client: socket.socket):
+        """Převezme nové TCP spojení (volá acceptor)."""
+        client.setblocking(True)
+        self.count("connections")
+        threading.Thread(target=self._handshake, args=(client,), daemon=True, name=f"sim-{self.name}").start()
+
+    def _handshake(self, client: socket.socket):
+        if self.handshake_delay:
+            self.sleep(self.handshake_delay)
+        if self.state != "up":
+            client.close()
+            return
+        # Sonda portu (probe_port) se jen připojí a odpojí - bez banneru klienta
+        # nemá smysl startovat transport, který by selhání zalogoval
+        client.settimeout(BANNER_TIMEOUT)
+        try:
+            if not client.recv(1, socket.MSG_PEEK):
+                client.close()
+                return
+        except OSError:
+            client.close()
+            return
+        client.settimeout(None)
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport = paramiko.Transport(client)
+        transport.set_log_channel(TRANSPORT_LOG_CHANNEL)
+        transport.add_server_key(get_host_key())
+        options = transport.get_security_options()
+        for field, algorithms in self.sshd_algorithms.items():
+            setattr(options, field, tuple(algorithms))
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, VirtualSFTPInterface)
+        with self._lock:
+            self._transports = [t for t in self._transports if t.is_active()]
+            self._transports.append(transport)
+        try:
+            transport.start_server(server=_GatewayServer(self, transport))
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            logger.debug(f"{self.name}: handshake selhal: {e}")
+
+    def on_login(self, transport: paramiko.Transport):
+        """Přihlášení: zapnutý ssh_monitor.sh po `monitor_lockout` sekundách spojení ukončí."""
+        self.count("logins")
+        if self.monitor_lockout and self.monitor_active():
+            timer = threading.Timer(self.monitor_lockout, self._lockout, args=(transport,))
+            timer.daemon = True
+            timer.start()
+
+    def _lockout(self, transport: paramiko.Transport):
+        if self.monitor_active():
+            logger.debug(f"{self.name}: ssh_monitor.sh ukončil SSH spojení")
+            transport.close()
+
+    def _streams(self, channel: paramiko.Channel, stdin=None) -> Streams:
+        return Streams(
+            stdin if stdin is not None else _ChannelInput(channel),
+            _ChannelOutput(channel.sendall),
+            _ChannelOutput(channel.sendall_stderr),
+        )
+
+    def run_exec(self, channel: paramiko.Channel, command: str):
+        """Exec kanál: `sh -c <příkaz>`."""
+        self.sleep(self.cpu_delay)
+        status = Shell(self).run_script(command, self._streams(channel))
+        self._close_channel(channel, status)
+
+    def run_shell(self, channel: paramiko.Channel):
+        """Shell kanál: příkazy se čtou ze vstupu kanálu po řádcích."""
+        self.sleep(self.cpu_delay)
+        interactive = InteractiveShell(Shell(self), self._streams(channel, stdin=NullDevice()))
+        status = 0
+        while True:
+            try:
+                data = channel.recv(32768)
+            except (OSError, EOFError):
+                break
+            if not data:
+                break
+            result = interactive.feed(data)
+            if result is not None:
+                status = result
+                break
+        self._close_channel(channel, status)
+
+    @staticmethod
+    def _close_channel(channel: paramiko.Channel, status: int):
+        try:
+            channel.send_exit_status(status)
+            channel.shutdown_write()
+            # paramiko posílá potvrzení exec požadavku až po návratu z check_channel_exec_request;
+            # rychlý příkaz by kanál zavřel dřív a klient by hlásil "Channel closed".
+            # Krátce počkáme, zda kanál nezavře klient sám.
+            deadline = time.monotonic() + CLOSE_GRACE
+            while not channel.closed and time.monotonic() < deadline:
+                time.sleep(0.005)
+            channel.close()
+        except (OSError, EOFError):
+            pass
+
+    # Rozhraní pro shell a applety
+
+    def environment(self) -> dict:
+        return {"PATH": "/bin:/sbin:/usr/bin:/usr/sbin", "HOME": "/root", "USER": "root",
+                "SHELL": "/bin/sh", "HOSTNAME": self.name}
+
+    def count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def sleep(self, seconds: float):
+        """Čekání přerušitelné restartem nebo vypnutím zařízení."""
+        if seconds > 0:
+            self._halt.wait(seconds)
+
+    def cpu_work(self, size: int):
+        """Prodleva za zpracování `size` bytů (hash, dekomprese) na slabém CPU."""
+        if self.cpu_rate:
+            self.sleep(size / self.cpu_rate)
+
+    def null_device(self):
+        return NullDevice()
+
+    def open_file(self, path: str, op: str):
+        """Otevře soubor pro přesměrování (`<`, `>`, `>>`, `<>`)."""
+        device = self.fs.device(path)
+        if device is not None:
+            return device
+        return self.fs.open(path, op)
+
+    def run_command(self, shell: Shell, fields: list[str], streams: Streams) -> int:
+        """Spustí applet nebo program podle cesty."""
+        name, args = fields[0], fields[1:]
+        self.count("commands")
+        try:
+            if "/" in name:
+                self.sleep(self.cpu_delay)
+                return self._run_program(shell, shell.path(name), args, streams)
+            command = busybox.COMMANDS.get(name)
+            if command is None:
+                streams.err(f"sh: {name}: not found")
+                return 127
+            if name not in busybox.SHELL_BUILTINS:
+                self.sleep(self.cpu_delay)
+            return command(shell, args, streams)
+        except OSError as e:
+            streams.err(f"{posixpath.basename(name)}: {e.strerror}")
+            return 1
+
+    def _run_program(self, shell: Shell, path: str, args: list[str], streams: Streams) -> int:
+        if not self.fs.exists(path):
+            streams.err(f"sh: {path}: not found")
+            return 127
+        if not self.fs.is_executable(path):
+            streams.err(f"sh: {path}: Permission denied")
+            return 126
+        head = self.fs.read(path)[:4]
+        if head.startswith(b"#!"):
+            return self.run_script_file(shell, path, args, streams)
+        program = PROGRAMS.get(posixpath.basename(path))
+        if program is not None:
+            return program(self, shell, path, args, streams)
+        if head == ELF_MAGIC:
+            return 0
+        streams.err(f"sh: {path}: Exec format error")
+        return 126
+
+    def run_script_file(self, shell: Shell, path: str, args: list[str], streams: Streams) -> int:
+        try:
+            text = self.fs.read(path).decode("utf-8", errors="replace")
+        except OSError as e:
+            streams.err(f"sh: can't open '{path}': {e.strerror}")
+            return 127
+        return Shell(self, shell.vars, shell.cwd, tuple(args)).run_script(text, streams)
+
+    def spawn_background(self, shell: Shell, node, streams: Streams):
+        """Příkaz s `&` běží ve vlastním vlákně."""
+        threading.Thread(target=shell.run_tree, args=(node, streams), daemon=True).start()
+
+    # Procesy
+
+    def start_process(self, command: str, name: Optional[str] = None) -> int:
+        with self._lock:
+            pid = self._next_pid
+            self._next_pid += 1
+            self._processes[pid] = (name or posixpath.basename(command.split()[0]), command)
+            return pid
+
+    def processes(self) -> list[tuple[int, str]]:
+        with self._lock:
+            return [(pid, command) for pid, (_, command) in sorted(self._processes.items())]
+
+    def find_processes(self, name: str) -> list[int]:
+        with self._lock:
+            return [pid for pid, (process, _) in sorted(self._processes.items()) if process == name]
+
+    def kill(self, pid: int) -> bool:
+        with self._lock:
+            return self._processes.pop(pid, None) is not None
+
+    def kill_by_name(self, name: str) -> bool:
+        with self._lock:
+            pids = self.find_processes(name)
+            for pid in pids:
+                del self._processes[pid]
+            return bool(pids)
+
+    # Síť a systém
+
+    def interface_names(self) -> list[str]:
+        with self._lock:
+            return sorted(self._interfaces, key=lambda n: (n == "lo", n))
+
+    def interface(self, name: str) -> Optional[dict]:
+        with self._lock:
+            info = self._interfaces.get(name)
+            return dict(info) if info else None
+
+    def set_address(self, name: str, address: str, netmask: Optional[str] = None) -> bool:
+        with self._lock:
+            info = self._interfaces.get(name)
+            if info is None:
+                return False
+            info["address"] = address
+            info["broadcast"] = address.rsplit(".", 1)[0] + ".255"
+            if netmask:
+                info["netmask"] = netmask
+            return True
+
+    def start_dhcp(self, name: str):
+        if not self.find_processes("udhcpc"):
+            self.start_process(f"udhcpc -i {name} -S")
+        self.set_address(name, self.dhcp_address)
+
+    def uptime(self) -> float:
+        return time.monotonic() - self.booted_at if self.booted_at else 0.0
+
+    def uname(self) -> dict:
+        return {"sysname": "Linux", "nodename": self.name, "release": "3.10.90",
+                "version": "#1 PREEMPT", "machine": "mips"}
+
+    def mounts(self) -> list[tuple[str, int]]:
+        return [("/", 16 * 1024 * 1024), ("/tmp", self.fs.tmpfs_size)]
+
+    # Přehled
+
+    def snapshot(self) -> dict:
+        """Stav zařízení pro kontrolu výsledku operací (testy, benchmarky)."""
+        fs = self.fs
+        eth1 = self.interface("eth1") or {}
+        return {
+            "name": self.name,
+            "state": self.state,
+            "port": self.port,
+            "boot_id": self.boot_id,
+            "monitor_active": self.monitor_active(),
+            "monitor_backup": fs.exists("/tuya/ssh_monitor.original.sh"),
+            "tuya_start_backup": fs.exists("/tuya/tuya_start.original.sh"),
+            "tuya_start_serialgateway": fs.exists("/tuya/tuya_start.sh")
+            and b"serialgateway" in fs.read("/tuya/tuya_start.sh"),
+            "serialgateway": fs.exists("/tuya/serialgateway"),
+            "serialgateway_norun": fs.exists("/tuya/serialgateway_norun"),
+            "serialgateway_running": bool(self.find_processes("serialgateway")),
+            "dhcp_running": bool(self.find_processes("udhcpc")),
+            "eth1": eth1.get("address"),
+            "serial_mode": self.serial.mode,
+            "firmware": self.serial.firmware,
+            "tmp_used": fs.usage("/tmp"),
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+# Programy spouštěné podle cesty (název souboru -> funkce)
+
+def _daemon(gateway: VirtualGateway, shell: Shell, path: str, args: list[str], streams: Streams) -> int:
+    name = posixpath.basename(path)
+    if name == "serialgateway" and gateway.find_processes(name):
+        streams.err("serialgateway: bind: Address already in use")
+        return 1
+    gateway.start_process(" ".join([path] + args), name=name)
+    return 0
+
+
+def _sx(gateway: VirtualGateway, shell: Shell, path: str, args: list[str], streams: Streams) -> int:
+    """
+    XMODEM odesílač (lrzsz sx) do Zigbee modulu přes /dev/ttyS1.
+
+    Doba přenosu odpovídá rychlosti UART (128B bloky, 10 bitů na byte)
+    vynásobené `flash_time_scale`, průběh se vypisuje na stderr jako u sx.
+    """
+    files = [a for a in args if not a.startswith("-")]
+    if not files:
+        streams.err("sx: need at least one file to send")
+        return 1
+    try:
+        data = gateway.fs.read(shell.path(files[0]))
+    except OSError as e:
+        streams.err(f"sx: {files[0]}: {e.strerror}")
+        return 1
+    serial = gateway.serial
+    block = 1024 if "-k" in args else 128
+    blocks = math.ceil(len(data) / block)
+    streams.stderr.write(
+        f"Sending {files[0]}, {blocks} blocks: Give your local XMODEM receive command now.\r\n".encode()
+    )
+    if serial.mode != "upload":
+        # Modul nečeká na XMODEM - sx po opakovaných timeoutech skončí
+        for retry in range(3):
+            gateway.sleep(1.0 * gateway.flash_time_scale)
+            streams.stderr.write(f"Retry {retry}: Timeout on sector ACK\r\n".encode())
+        streams.stderr.write(b"Transfer incomplete\r\n")
+        return 128
+    per_block = (block + 5) * 10 / serial.speed * gateway.flash_time_scale
+    report_every = max(1, blocks // 20)
+    for index in range(1, blocks + 1):
+        gateway.sleep(per_block)
+        if gateway.state != "up":
+            return 1
+        if index % report_every == 0 or index == blocks:
+            streams.stderr.write(f"\rXmodem sectors/kbytes sent: {index:3d}/{index * block // 1024:2d}k".encode())
+    streams.stderr.write(b"\r\nTransfer complete\r\n")
+    serial.flashed(posixpath.basename(files[0]), data)
+    return 0
+
+
+PROGRAMS = {
+    "serialgateway": _daemon,
+    "tuyamain": _daemon,
+    "sx": _sx,
+}
+
+
+class Acceptor:
+    """
+    Jedno vlákno přijímající spojení pro mnoho naslouchajících socketů.
+
+    Stovky zařízení tak nepotřebují stovky vláken čekajících v accept().
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="sim-acceptor")
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def add(self, sock: socket.socket, callback):
+        with self._lock:
+            self._selector.register(sock, 1, callback)
+
+    def remove(self, sock: socket.socket):
+        with self._lock:
+            try:
+                self._selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            with self._lock:
+                idle = not self._selector.get_map()
+            if idle:
+                self._stopping.wait(0.05)
+                continue
+            try:
+                events = self._selector.select(timeout=0.2)
+            except OSError:
+                continue
+            for key, _ in events:
+                try:
+                    client, _ = key.fileobj.accept()
+                except (BlockingIOError, OSError):
+                    continue
+                key.data(client)
@@ -0,0 +1,112 @@
+"""
+Flotila virtuálních gateway na jednom stroji.
+
+Všechna zařízení sdílí jedno vlákno pro accept(), každé naslouchá na
+vlastním portu. Volitelně je před každým zařízením proxy s omezenou
+propustností a latencí (ThrottledProxy z benchmarks.bench_transfer).
+"""
+import csv
+import io
+from typing import Optional
+import logging
+
+from benchmarks.bench_transfer import ThrottledProxy
+from benchmarks.simulator.device import Acceptor, VirtualGateway
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayFleet:
+    """
+    Skupina virtuálních gateway.
+
+    Args:
+        count: Počet zařízení
+        host: Adresa, na které zařízení naslouchají
+        base_port: První port (zařízení i dostane base_port + i; 0 = náhodné porty)
+        password: Heslo uživatele root (stejné pro všechna zařízení)
+        link_kbps: Propustnost linky ke každému zařízení v KiB/s (0 = neomezeno)
+        latency_ms: Jednosměrná latence linky v ms
+        **device_options: Parametry VirtualGateway (cpu_delay, boot_time, profile, ...)
+    """
+
+    def __init__(
+        self,
+        count: int,
+        host: str = "127.0.0.1",
+        base_port: int = 0,
+        password: str = "simulator",
+        link_kbps: float = 0,
+        latency_ms: float = 0,
+        **device_options
+    ):
+        self.host = host
+        self.link_kbps = link_kbps
+        self.latency_ms = latency_ms
+        self.acceptor = Acceptor()
+        self.devices = [
+            VirtualGateway(
+                name=f"gw-{i:04d}",
+                host=host,
+                port=base_port + i if base_port else 0,
+                password=password,
+                address=f"192.168.{10 + i // 250}.{i % 250 + 2}",
+                acceptor=self.acceptor,
+                **device_options,
+            )
+            for i in range(count)
+        ]
+        self._proxies: list[Optional[ThrottledProxy]] = []
+        self.ports: list[int] = []
+
+    def start(self) -> list[dict]:
+        """Spustí všechna zařízení, vrací inventář."""
+        self.acceptor.start()
+        for device in self.devices:
+            port = device.start()
+            proxy = None
+            if self.link_kbps or self.latency_ms:
+                proxy = ThrottledProxy(port, self.link_kbps, self.latency_ms / 1000)
+                port = proxy.start()
+            self._proxies.append(proxy)
+            self.ports.append(port)
+        logger.info(f"Spuštěno {len(self.devices)} virtuálních gateway")
+        return self.inventory()
+
+    def stop(self):
+        for proxy in self._proxies:
+            if proxy is not None:
+                proxy.stop()
+        for device in self.devices:
+            device.stop()
+        self.acceptor.stop()
+
+    def inventory(self) -> list[dict]:
+        """Inventář ve formátu fleet režimu (host, port, password, static_ip)."""
+        return [
+            {
+                "host": self.host,
+                "port": port,
+                "password": device.password,
+                "static_ip": device.dhcp_address.rsplit(".", 1)[0] + f".{200 + i % 50}",
+            }
+            for i, (device, port) in enumerate(zip(self.devices, self.ports))
+        ]
+
+    def inventory_csv(self) -> str:
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(["host", "port", "password", "static_ip"])
+        for row in self.inventory():
+            writer.writerow([row["host"], row["port"], row["password"], row["static_ip"]])
+        return out.getvalue()
+
+    def stats(self) -> dict:
+        """Souhrnné čítače všech zařízení a počty podle stavu."""
+        totals: dict[str, int] = {}
+        states: dict[str, int] = {}
+        for device in self.devices:
+            for key, value in device.stats().items():
+                totals[key] = totals.get(key, 0) + value
+            states[device.state] = states.get(device.state, 0) + 1
+        return {"devices": len(self.devices), "states": states, **totals}
@@ -0,0 +1,335 @@
+"""
+Souborový systém virtuální gateway v paměti.
+
+Soubory jsou uložené jako bytes (sdílené mezi zařízeními, dokud se do nich
+nezapisuje) nebo bytearray. Zařízení (`/dev/null`, `/dev/ttyS1`) a soubory
+v `/proc` jsou objekty s metodami read/write, resp. funkce vracející obsah.
+Adresář `/tmp` je tmpfs s omezenou kapacitou a po restartu se vymaže.
+"""
+import errno
+import io
+import os
+import posixpath
+import stat
+import threading
+import time
+from typing import Callable, Optional, Union
+
+
+class FileNode:
+    """Obyčejný soubor (obsah, práva, čas změny)."""
+
+    __slots__ = ("data", "mode", "mtime")
+
+    def __init__(self, data: Union[bytes, bytearray] = b"", mode: int = 0o644):
+        self.data = data
+        self.mode = mode
+        self.mtime = time.time()
+
+    def writable(self) -> bytearray:
+        """Vrací obsah jako bytearray (sdílený obsah se zkopíruje až při prvním zápisu)."""
+        if not isinstance(self.data, bytearray):
+            self.data = bytearray(self.data)
+        return self.data
+
+
+def _error(code: int, path: str) -> OSError:
+    return OSError(code, os.strerror(code), path)
+
+
+class VirtualFS:
+    """
+    Souborový systém v paměti (bezpečný pro více vláken).
+
+    Args:
+        tmpfs_size: Kapacita `/tmp` v bytech (0 = neomezeno)
+    """
+
+    def __init__(self, tmpfs_size: int = 0):
+        self.tmpfs_size = tmpfs_size
+        self._files: dict[str, FileNode] = {}
+        self._dirs: set[str] = {"/"}
+        self._devices: dict[str, object] = {}
+        self._proc: dict[str, Callable[[], bytes]] = {}
+        self._lock = threading.RLock()
+
+    # Cesty a typy
+
+    @staticmethod
+    def normalize(path: str, cwd: str = "/") -> str:
+        return posixpath.normpath(posixpath.join(cwd, path)).replace("//", "/")
+
+    def exists(self, path: str) -> bool:
+        with self._lock:
+            return path in self._files or path in self._dirs or path in self._devices or path in self._proc
+
+    def isfile(self, path: str) -> bool:
+        with self._lock:
+            return path in self._files or path in self._proc
+
+    def isdir(self, path: str) -> bool:
+        with self._lock:
+            return path in self._dirs
+
+    def is_device(self, path: str) -> bool:
+        return path in self._devices
+
+    def device(self, path: str):
+        return self._devices.get(path)
+
+    def is_executable(self, path: str) -> bool:
+        with self._lock:
+            node = self._files.get(path)
+            return node is not None and bool(node.mode & 0o111)
+
+    # Zakládání
+
+    def mkdir(self, path: str, parents: bool = False):
+        with self._lock:
+            if path in self._dirs:
+                if parents:
+                    return
+                raise _error(errno.EEXIST, path)
+            if path in self._files or path in self._devices:
+                raise _error(errno.EEXIST, path)
+            parent = posixpath.dirname(path)
+            if parent not in self._dirs:
+                if not parents:
+                    raise _error(errno.ENOENT, path)
+                self.mkdir(parent, parents=True)
+            self._dirs.add(path)
+
+    def add_device(self, path: str, device: object):
+        """Zaregistruje zařízení (objekt s read(n) a write(data))."""
+        with self._lock:
+            self.mkdir(posixpath.dirname(path), parents=True)
+            self._devices[path] = device
+
+    def add_proc(self, path: str, content: Callable[[], bytes]):
+        """Zaregistruje soubor, jehož obsah se generuje při čtení."""
+        with self._lock:
+            self.mkdir(posixpath.dirname(path), parents=True)
+            self._proc[path] = content
+
+    # Čtení a zápis
+
+    def read(self, path: str) -> bytes:
+        with self._lock:
+            node = self._files.get(path)
+            if node is not None:
+                return bytes(node.data)
+            if path in self._proc:
+                return self._proc[path]()
+            if path in self._dirs:
+                raise _error(errno.EISDIR, path)
+            raise _error(errno.ENOENT, path)
+
+    def node(self, path: str, create: bool = False, truncate: bool = False, mode: int = 0o644) -> FileNode:
+        """Vrací uzel souboru pro zápis (volitelně ho založí nebo zkrátí)."""
+        with self._lock:
+            node = self._files.get(path)
+            if node is None:
+                if path in self._dirs:
+                    raise _error(errno.EISDIR, path)
+                if not create:
+                    raise _error(errno.ENOENT, path)
+                if posixpath.dirname(path) not in self._dirs:
+                    raise _error(errno.ENOENT, path)
+                if path in self._proc:
+                    raise _error(errno.EACCES, path)
+                node = self._files[path] = FileNode(b"", mode)
+            elif truncate:
+                node.data = b""
+                node.mtime = time.time()
+            return node
+
+    def open(self, path: str, op: str = "<", mode: int = 0o644):
+        """Otevře soubor: `<` čtení, `>` zápis (zkrátí), `>>` připojení, `<>` čtení i zápis."""
+        if op == "<":
+            with self._lock:
+                node = self._files.get(path)
+            if node is None:
+                return io.BytesIO(self.read(path))
+            return FileIO(self, path, node)
+        node = self.node(path, create=True, truncate=op == ">", mode=mode)
+        return FileIO(self, path, node, append=op == ">>")
+
+    def write_at(self, path: str, node: FileNode, offset: int, data: bytes):
+        """Zapíše data na pozici v souboru (hlídá kapacitu tmpfs)."""
+        with self._lock:
+            grow = max(0, offset + len(data) - len(node.data))
+            if grow and self.tmpfs_size and path.startswith("/tmp/"):
+                if self._tmpfs_used() + grow > self.tmpfs_size:
+                    raise _error(errno.ENOSPC, path)
+            buffer = node.writable()
+            if offset > len(buffer):
+                buffer.extend(bytes(offset - len(buffer)))
+            buffer[offset:offset + len(data)] = data
+            node.mtime = time.time()
+
+    def write(self, path: str, data: bytes, append: bool = False, mode: int = 0o644):
+        with self._lock:
+            node = self.node(path, create=True, truncate=not append, mode=mode)
+            self.write_at(path, node, len(node.data), data)
+
+    def truncate(self, path: str, node: FileNode, size: int):
+        with self._lock:
+            buffer = node.writable()
+            del buffer[size:]
+            node.mtime = time.time()
+
+    def _tmpfs_used(self) -> int:
+        return sum(len(n.data) for p, n in self._files.items() if p.startswith("/tmp/"))
+
+    # Správa souborů
+
+    def remove(self, path: str):
+        with self._lock:
+            if path in self._dirs:
+                raise _error(errno.EISDIR, path)
+            if self._files.pop(path, None) is None:
+                raise _error(errno.ENOENT, path)
+
+    def rmdir(self, path: str):
+        with self._lock:
+            if path not in self._dirs:
+                raise _error(errno.ENOENT, path)
+            if self.listdir(path):
+                raise _error(errno.ENOTEMPTY, path)
+            self._dirs.discard(path)
+
+    def rename(self, old: str, new: str):
+        with self._lock:
+            node = self._files.get(old)
+            if node is None:
+                raise _error(errno.EISDIR if old in self._dirs else errno.ENOENT, old)
+            if new in self._dirs:
+                new = posixpath.join(new, posixpath.basename(old))
+            if posixpath.dirname(new) not in self._dirs:
+                raise _error(errno.ENOENT, new)
+            del self._files[old]
+            self._files[new] = node
+
+    def copy(self, src: str, dst: str):
+        with self._lock:
+            data = self.read(src)
+            if dst in self._dirs:
+                dst = posixpath.join(dst, posixpath.basename(src))
+            mode = self._files[src].mode if src in self._files else 0o644
+            self.write(dst, data, mode=mode)
+
+    def chmod(self, path: str, mode: int):
+        with self._lock:
+            node = self._files.get(path)
+            if node is None:
+                if path in self._dirs:
+                    return
+                raise _error(errno.ENOENT, path)
+            node.mode = mode & 0o7777
+
+    def listdir(self, path: str) -> list[str]:
+        with self._lock:
+            if path not in self._dirs:
+                raise _error(errno.ENOTDIR if self.exists(path) else errno.ENOENT, path)
+            prefix = path.rstrip("/") + "/"
+            names = set()
+            for collection in (self._files, self._dirs, self._devices, self._proc):
+                for p in collection:
+                    if p != path and p.startswith(prefix) and "/" not in p[len(prefix):]:
+                        names.add(p[len(prefix):])
+            return sorted(names)
+
+    def stat(self, path: str) -> os.stat_result:
+        """Vrací stat_result (velikost, práva, typ, čas změny)."""
+        with self._lock:
+            node = self._files.get(path)
+            if node is not None:
+                return os.stat_result((stat.S_IFREG | node.mode, 0, 0, 1, 0, 0, len(node.data),
+                                       int(node.mtime), int(node.mtime), int(node.mtime)))
+            if path in self._dirs:
+                mode, size = stat.S_IFDIR | 0o755, 0
+            elif path in self._devices:
+                mode, size = stat.S_IFCHR | 0o660, 0
+            elif path in self._proc:
+                mode, size = stat.S_IFREG | 0o444, 0
+            else:
+                raise _error(errno.ENOENT, path)
+            now = int(time.time())
+            return os.stat_result((mode, 0, 0, 1, 0, 0, size, now, now, now))
+
+    def clear(self, prefix: str):
+        """Smaže vše pod adresářem (tmpfs po restartu), adresář samotný zůstane."""
+        with self._lock:
+            base = prefix.rstrip("/") + "/"
+            for p in [p for p in self._files if p.startswith(base)]:
+                del self._files[p]
+            self._dirs = {d for d in self._dirs if not d.startswith(base)}
+
+    def usage(self, prefix: str) -> int:
+        """Součet velikostí souborů pod adresářem."""
+        with self._lock:
+            base = prefix.rstrip("/") + "/"
+            return sum(len(n.data) for p, n in self._files.items() if p.startswith(base))
+
+
+class FileIO:
+    """Souborový objekt nad uzlem VirtualFS (pro shell přesměrování a SFTP)."""
+
+    def __init__(self, fs: VirtualFS, path: str, node: FileNode, append: bool = False):
+        self.fs = fs
+        self.path = path
+        self.node = node
+        self.append = append
+        self.pos = len(node.data) if append else 0
+        self.closed = False
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 0:
+            self.pos = offset
+        elif whence == 1:
+            self.pos += offset
+        else:
+            self.pos = len(self.node.data) + offset
+        return self.pos
+
+    def tell(self) -> int:
+        return self.pos
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.node.data
+        end = len(data) if size is None or size < 0 else min(len(data), self.pos + size)
+        chunk = bytes(data[self.pos:end])
+        self.pos = max(self.pos, end)
+        return chunk
+
+    def write(self, data: bytes) -> int:
+        if self.append:
+            self.pos = len(self.node.data)
+        self.fs.write_at(self.path, self.node, self.pos, data)
+        self.pos += len(data)
+        return len(data)
+
+    def truncate(self, size: Optional[int] = None):
+        self.fs.truncate(self.path, self.node, self.pos if size is None else size)
+
+    def flush(self):
+        pass
+
+    def fileno(self) -> int:
+        raise OSError(errno.EBADF, "Virtuální soubor nemá deskriptor")
+
+    def close(self):
+        self.closed = True
+
+
+class NullDevice:
+    """/dev/null"""
+
+    def read(self, size: int = -1) -> bytes:
+        return b""
+
+    def write(self, data: bytes) -> int:
+        return len(data)
+
+    def close(self):
+        pass
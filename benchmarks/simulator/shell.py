@@ -0,0 +1,964 @@
+"""
+Interpret podmnožiny POSIX sh (busybox ash) pro virtuální gateway.
+
+Pokrývá to, co aplikace na gateway posílá: sekvence a `&&`/`||`,
+skupiny `{ }` a subshelly `( )`, if/while/for, přesměrování včetně
+heredoc a `>&2`, proměnné a `${x%%vzor}`, `$(...)` a `$((...))`.
+Příkazy (applety) jsou funkce v `busybox.COMMANDS`, programy se
+spouštějí podle cesty (`/tuya/serialgateway`, `/tmp/sx`, skripty).
+
+Roury se vyhodnocují postupně přes buffer (bez souběhu), to pro
+simulaci stačí.
+"""
+import ast
+import fnmatch
+import io
+import operator
+import re
+import threading
+from typing import Optional
+
+_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_ASSIGNMENT = re.compile(r"([A-Za-z_][A-Za-z0-9_]*)=")
+# Znaky, které ukončují slovo (mimo uvozovky)
+_WORD_END = set(" \t\n;&|()<>")
+_RESERVED = {"{", "}", "!", "if", "then", "elif", "else", "fi", "while", "until", "for", "do", "done", "in"}
+
+
+class Incomplete(Exception):
+    """Vstup skončil uprostřed příkazu (interaktivní shell čeká na další řádky)."""
+
+
+class ShellSyntaxError(Exception):
+    pass
+
+
+class ShellExit(Exception):
+    """Příkaz `exit` - ukončí skript (případně subshell)."""
+
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
+
+
+# Uzly syntaktického stromu
+
+
+class Word:
+    """
+    Slovo jako seznam částí: ("lit", text, quoted), ("var", name, op, arg, quoted),
+    ("cmd", strom, quoted), ("arith", výraz, quoted).
+    """
+
+    __slots__ = ("parts",)
+
+    def __init__(self, parts: list):
+        self.parts = parts
+
+    def literal(self) -> Optional[str]:
+        """Vrací text slova, pokud je celé tvořené nekvotovaným literálem."""
+        if len(self.parts) == 1 and self.parts[0][0] == "lit" and not self.parts[0][2]:
+            return self.parts[0][1]
+        return None
+
+    def text(self) -> str:
+        """Text literálových částí (pro oddělovač heredoc)."""
+        return "".join(p[1] for p in self.parts if p[0] == "lit")
+
+    def quoted(self) -> bool:
+        return any(p[-1] for p in self.parts)
+
+
+class Redirect:
+    __slots__ = ("fd", "op", "target", "heredoc")
+
+    def __init__(self, fd: int, op: str, target: Optional[Word]):
+        self.fd = fd
+        self.op = op
+        self.target = target
+        self.heredoc: Optional[Word] = None
+
+
+class Simple:
+    __slots__ = ("assigns", "words", "redirects")
+
+    def __init__(self, assigns, words, redirects):
+        self.assigns = assigns
+        self.words = words
+        self.redirects = redirects
+
+
+class Pipeline:
+    __slots__ = ("commands", "negate")
+
+    def __init__(self, commands, negate):
+        self.commands = commands
+        self.negate = negate
+
+
+class AndOr:
+    __slots__ = ("first", "rest")
+
+    def __init__(self, first, rest):
+        self.first = first
+        self.rest = rest
+
+
+class CommandList:
+    __slots__ = ("items",)
+
+    def __init__(self, items):
+        self.items = items
+
+
+class Group:
+    __slots__ = ("body", "subshell", "redirects")
+
+    def __init__(self, body, subshell, redirects=()):
+        self.body = body
+        self.subshell = subshell
+        self.redirects = redirects
+
+
+class If:
+    __slots__ = ("clauses", "else_body", "redirects")
+
+    def __init__(self, clauses, else_body, redirects=()):
+        self.clauses = clauses
+        self.else_body = else_body
+        self.redirects = redirects
+
+
+class Loop:
+    __slots__ = ("until", "condition", "body", "redirects")
+
+    def __init__(self, until, condition, body, redirects=()):
+        self.until = until
+        self.condition = condition
+        self.body = body
+        self.redirects = redirects
+
+
+class For:
+    __slots__ = ("name", "words", "body", "redirects")
+
+    def __init__(self, name, words, body, redirects=()):
+        self.name = name
+        self.words = words
+        self.body = body
+        self.redirects = redirects
+
+
+# Parser
+
+
+class Parser:
+    """Rekurzivní parser skriptu přímo nad textem."""
+
+    def __init__(self, text: str):
+        self.s = text
+        self.i = 0
+        self._heredocs: list[tuple[Redirect, str, bool, bool]] = []
+
+    def parse(self) -> CommandList:
+        node = self.parse_list(())
+        self.skip_space(newlines=True)
+        if self.i < len(self.s):
+            raise ShellSyntaxError(f"syntax error: unexpected \"{self.s[self.i]}\"")
+        if self._heredocs:
+            raise Incomplete()
+        return node
+
+    # Pomocné funkce
+
+    def peek(self, n: int = 1) -> str:
+        return self.s[self.i:self.i + n]
+
+    def at_end(self) -> bool:
+        return self.i >= len(self.s)
+
+    def skip_space(self, newlines: bool = False):
+        s = self.s
+        while self.i < len(s):
+            c = s[self.i]
+            if c in " \t":
+                self.i += 1
+            elif c == "\\" and s.startswith("\\\n", self.i):
+                self.i += 2
+            elif c == "#":
+                end = s.find("\n", self.i)
+                self.i = len(s) if end < 0 else end
+            elif c == "\n" and newlines:
+                self.newline()
+            else:
+                break
+
+    def newline(self):
+        """Přeskočí konec řádku a načte těla čekajících heredoc."""
+        self.i += 1
+        pending, self._heredocs = self._heredocs, []
+        for redirect, delimiter, expand, strip_tabs in pending:
+            lines = []
+            while True:
+                if self.at_end():
+                    raise Incomplete()
+                end = self.s.find("\n", self.i)
+                if end < 0:
+                    line = self.s[self.i:]
+                    if (line.lstrip("\t") if strip_tabs else line) != delimiter:
+                        raise Incomplete()
+                    self.i = len(self.s)
+                    break
+                line = self.s[self.i:end]
+                self.i = end + 1
+                if strip_tabs:
+                    line = line.lstrip("\t")
+                if line == delimiter:
+                    break
+                lines.append(line + "\n")
+            body = "".join(lines)
+            if expand:
+                redirect.heredoc = Parser(body).parse_double_quoted(heredoc=True)
+            else:
+                redirect.heredoc = Word([("lit", body, True)])
+
+    def peek_reserved(self) -> Optional[str]:
+        """Vrací rezervované slovo na aktuální pozici (bez posunu)."""
+        m = re.compile(r"[A-Za-z{}!]+").match(self.s, self.i)
+        if not m or m.group(0) not in _RESERVED:
+            return None
+        end = m.end()
+        if end < len(self.s) and self.s[end] not in _WORD_END:
+            return None
+        return m.group(0)
+
+    def expect(self, word: str):
+        self.skip_space(newlines=True)
+        if self.at_end():
+            raise Incomplete()
+        if self.peek_reserved() != word:
+            raise ShellSyntaxError(f"syntax error: expected \"{word}\"")
+        self.i += len(word)
+
+    # Gramatika
+
+    def parse_list(self, terminators) -> CommandList:
+        items = []
+        while True:
+            self.skip_space(newlines=True)
+            if self.at_end():
+                if terminators:
+                    raise Incomplete()
+                break
+            if ")" in terminators and self.peek() == ")":
+                break
+            if self.peek_reserved() in terminators:
+                break
+            node = self.parse_and_or()
+            self.skip_space()
+            background = False
+            c = self.peek()
+            if c == "&" and self.peek(2) != "&&":
+                self.i += 1
+                background = True
+            elif c == ";" and self.peek(2) != ";;":
+                self.i += 1
+            elif c == "\n":
+                self.newline()
+            elif c not in ("", ")") and self.peek_reserved() not in terminators:
+                raise ShellSyntaxError(f"syntax error: unexpected \"{c}\"")
+            items.append((node, background))
+        return CommandList(items)
+
+    def parse_and_or(self) -> AndOr:
+        first = self.parse_pipeline()
+        rest = []
+        while True:
+            self.skip_space()
+            op = self.peek(2)
+            if op not in ("&&", "||"):
+                break
+            self.i += 2
+            self.skip_space(newlines=True)
+            if self.at_end():
+                raise Incomplete()
+            rest.append((op, self.parse_pipeline()))
+        return AndOr(first, rest)
+
+    def parse_pipeline(self) -> Pipeline:
+        self.skip_space()
+        negate = False
+        if self.peek_reserved() == "!":
+            self.i += 1
+            negate = True
+        commands = [self.parse_command()]
+        while True:
+            self.skip_space()
+            if self.peek() != "|" or self.peek(2) == "||":
+                break
+            self.i += 1
+            self.skip_space(newlines=True)
+            if self.at_end():
+                raise Incomplete()
+            commands.append(self.parse_command())
+        return Pipeline(commands, negate)
+
+    def parse_command(self):
+        self.skip_space()
+        if self.at_end():
+            raise Incomplete()
+        word = self.peek_reserved()
+        if word == "{":
+            self.i += 1
+            body = self.parse_list(("}",))
+            self.expect("}")
+            return Group(body, False, self.parse_redirects())
+        if self.peek() == "(":
+            self.i += 1
+            body = self.parse_list((")",))
+            self.skip_space(newlines=True)
+            if self.at_end():
+                raise Incomplete()
+            self.i += 1
+            return Group(body, True, self.parse_redirects())
+        if word == "if":
+            return self.parse_if()
+        if word in ("while", "until"):
+            self.i += len(word)
+            condition = self.parse_list(("do",))
+            self.expect("do")
+            body = self.parse_list(("done",))
+            self.expect("done")
+            return Loop(word == "until", condition, body, self.parse_redirects())
+        if word == "for":
+            return self.parse_for()
+        if word is not None and word not in ("!",):
+            raise ShellSyntaxError(f"syntax error: unexpected \"{word}\"")
+        return self.parse_simple()
+
+    def parse_if(self) -> If:
+        self.i += 2
+        clauses = []
+        else_body = None
+        condition = self.parse_list(("then",))
+        self.expect("then")
+        body = self.parse_list(("elif", "else", "fi"))
+        clauses.append((condition, body))
+        while True:
+            self.skip_space(newlines=True)
+            if self.at_end():
+                raise Incomplete()
+            word = self.peek_reserved()
+            if word == "elif":
+                self.i += 4
+                condition = self.parse_list(("then",))
+                self.expect("then")
+                body = self.parse_list(("elif", "else", "fi"))
+                clauses.append((condition, body))
+            elif word == "else":
+                self.i += 4
+                else_body = self.parse_list(("fi",))
+            else:
+                break
+        self.expect("fi")
+        return If(clauses, else_body, self.parse_redirects())
+
+    def parse_for(self) -> For:
+        self.i += 3
+        self.skip_space()
+        m = _NAME.match(self.s, self.i)
+        if not m:
+            raise ShellSyntaxError("syntax error: bad for loop variable")
+        self.i = m.end()
+        self.skip_space(newlines=True)
+        words = None
+        if self.peek_reserved() == "in":
+            self.i += 2
+            words = []
+            while True:
+                self.skip_space()
+                if self.at_end():
+                    raise Incomplete()
+                if self.peek() in (";", "\n"):
+                    self.i += 1 if self.peek() == ";" else 0
+                    break
+                words.append(self.parse_word())
+        self.expect("do")
+        body = self.parse_list(("done",))
+        self.expect("done")
+        return For(m.group(0), words, body, self.parse_redirects())
+
+    def parse_redirects(self) -> list:
+        redirects = []
+        while True:
+            self.skip_space()
+            redirect = self.parse_redirect()
+            if redirect is None:
+                return redirects
+            redirects.append(redirect)
+
+    def parse_redirect(self) -> Optional[Redirect]:
+        m = re.compile(r"(\d*)(>>|>&|>\||<<-|<<|<&|<>|>|<)").match(self.s, self.i)
+        if not m:
+            return None
+        op = m.group(2)
+        fd = int(m.group(1)) if m.group(1) else (0 if op[0] == "<" else 1)
+        self.i = m.end()
+        self.skip_space()
+        if self.at_end():
+            raise Incomplete()
+        target = self.parse_word()
+        redirect = Redirect(fd, op if op != ">|" else ">", target)
+        if op in ("<<", "<<-"):
+            self._heredocs.append((redirect, target.text(), not target.quoted(), op == "<<-"))
+        return redirect
+
+    def parse_simple(self) -> Simple:
+        assigns = []
+        words = []
+        redirects = []
+        while True:
+            self.skip_space()
+            c = self.peek()
+            if c == "" or c in "\n;&|)":
+                break
+            if c == "(":
+                raise ShellSyntaxError("syntax error: unexpected \"(\"")
+            redirect = self.parse_redirect()
+            if redirect is not None:
+                redirects.append(redirect)
+                continue
+            word = self.parse_word()
+            first = word.parts[0] if word.parts else None
+            if not words and first and first[0] == "lit" and not first[2]:
+                m = _ASSIGNMENT.match(first[1])
+                if m:
+                    rest = first[1][m.end():]
+                    value = Word(([("lit", rest, False)] if rest else []) + word.parts[1:])
+                    assigns.append((m.group(1), value))
+                    continue
+            words.append(word)
+        if not (assigns or words or redirects):
+            raise ShellSyntaxError(f"syntax error: unexpected \"{self.peek() or 'end of file'}\"")
+        return Simple(assigns, words, redirects)
+
+    # Slova
+
+    def parse_word(self) -> Word:
+        parts: list = []
+        s = self.s
+        while self.i < len(s):
+            c = s[self.i]
+            if c in _WORD_END:
+                break
+            if c == "'":
+                end = s.find("'", self.i + 1)
+                if end < 0:
+                    raise Incomplete()
+                parts.append(("lit", s[self.i + 1:end], True))
+                self.i = end + 1
+            elif c == '"':
+                self.i += 1
+                parts.extend(self.parse_double_quoted().parts)
+                if self.at_end():
+                    raise Incomplete()
+                self.i += 1
+            elif c == "\\":
+                if self.i + 1 >= len(s):
+                    raise Incomplete()
+                if s[self.i + 1] != "\n":
+                    parts.append(("lit", s[self.i + 1], True))
+                self.i += 2
+            elif c == "$":
+                parts.append(self.parse_dollar(False))
+            elif c == "`":
+                raise ShellSyntaxError("syntax error: backquotes are not supported, use $(...)")
+            else:
+                if parts and parts[-1][0] == "lit" and not parts[-1][2]:
+                    parts[-1] = ("lit", parts[-1][1] + c, False)
+                else:
+                    parts.append(("lit", c, False))
+                self.i += 1
+        return Word(parts)
+
+    def parse_double_quoted(self, heredoc: bool = False) -> Word:
+        """Obsah uvozovek (nebo těla heredoc) až po `"`, resp. konec textu."""
+        parts: list = []
+        text = []
+        s = self.s
+        while self.i < len(s):
+            c = s[self.i]
+            if c == '"' and not heredoc:
+                break
+            if c == "\\" and self.i + 1 < len(s) and s[self.i + 1] in ("$`\\\n" + ("" if heredoc else '"')):
+                if s[self.i + 1] != "\n":
+                    text.append(s[self.i + 1])
+                self.i += 2
+            elif c == "$":
+                if text:
+                    parts.append(("lit", "".join(text), True))
+                    text = []
+                parts.append(self.parse_dollar(True))
+            else:
+                text.append(c)
+                self.i += 1
+        if text:
+            parts.append(("lit", "".join(text), True))
+        if not parts:
+            parts.append(("lit", "", True))
+        return Word(parts)
+
+    def parse_dollar(self, quoted: bool) -> tuple:
+        s = self.s
+        self.i += 1
+        c = self.peek()
+        if s.startswith("((", self.i):
+            start = self.i + 2
+            depth = 0
+            j = start
+            while j < len(s):
+                if s[j] == "(":
+                    depth += 1
+                elif s[j] == ")":
+                    if depth == 0:
+                        break
+                    depth -= 1
+                j += 1
+            if not s.startswith("))", j):
+                raise Incomplete()
+            self.i = j + 2
+            return ("arith", s[start:j], quoted)
+        if c == "(":
+            self.i += 1
+            body = self.parse_list((")",))
+            self.skip_space(newlines=True)
+            if self.at_end():
+                raise Incomplete()
+            self.i += 1
+            return ("cmd", body, quoted)
+        if c == "{":
+            end = s.find("}", self.i)
+            if end < 0:
+                raise Incomplete()
+            inner = s[self.i + 1:end]
+            self.i = end + 1
+            if inner.startswith("#") and len(inner) > 1:
+                return ("var", inner[1:], "#len", None, quoted)
+            m = re.compile(r"([A-Za-z_][A-Za-z0-9_]*|[0-9?$#!@*])").match(inner)
+            if not m:
+                raise ShellSyntaxError(f"syntax error: bad substitution ${{{inner}}}")
+            name = m.group(0)
+            rest = inner[m.end():]
+            if not rest:
+                return ("var", name, None, None, quoted)
+            op_match = re.compile(r"(:-|:=|:\+|:\?|%%|##|[-=+?%#])").match(rest)
+            if not op_match:
+                raise ShellSyntaxError(f"syntax error: bad substitution ${{{inner}}}")
+            arg = Parser(rest[op_match.end():]).parse_double_quoted(heredoc=True)
+            return ("var", name, op_match.group(0), arg, quoted)
+        m = _NAME.match(s, self.i)
+        if m:
+            self.i = m.end()
+            return ("var", m.group(0), None, None, quoted)
+        if c and c in "0123456789?$#!@*":
+            self.i += 1
+            return ("var", c, None, None, quoted)
+        return ("lit", "$", quoted)
+
+
+# Aritmetika $((...)) - jen celá čísla, bez přiřazení
+
+_ARITH_OPS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.FloorDiv: operator.floordiv, ast.Div: operator.floordiv, ast.Mod: operator.mod,
+    ast.LShift: operator.lshift, ast.RShift: operator.rshift,
+    ast.BitAnd: operator.and_, ast.BitOr: operator.or_, ast.BitXor: operator.xor,
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt,
+    ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+
+
+def _arith(node, names: dict) -> int:
+    if isinstance(node, ast.Expression):
+        return _arith(node.body, names)
+    if isinstance(node, ast.Constant) and isinstance(node.value, int):
+        return node.value
+    if isinstance(node, ast.Name):
+        return _to_int(names.get(node.id, "0"))
+    if isinstance(node, ast.UnaryOp):
+        value = _arith(node.operand, names)
+        if isinstance(node.op, ast.USub):
+            return -value
+        if isinstance(node.op, ast.Not):
+            return int(not value)
+        if isinstance(node.op, ast.Invert):
+            return ~value
+        return value
+    if isinstance(node, ast.BinOp) and type(node.op) in _ARITH_OPS:
+        return int(_ARITH_OPS[type(node.op)](_arith(node.left, names), _arith(node.right, names)))
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _ARITH_OPS:
+        return int(_ARITH_OPS[type(node.ops[0])](_arith(node.left, names), _arith(node.comparators[0], names)))
+    if isinstance(node, ast.BoolOp):
+        values = [_arith(v, names) for v in node.values]
+        return int(all(values) if isinstance(node.op, ast.And) else any(values))
+    raise ShellSyntaxError("arithmetic syntax error")
+
+
+def _to_int(value: str) -> int:
+    try:
+        return int(value or "0", 0)
+    except ValueError:
+        return 0
+
+
+# Vstup a výstup
+
+
+class Streams:
+    """stdin, stdout a stderr příkazu (objekty s read(n), resp. write(data))."""
+
+    __slots__ = ("stdin", "stdout", "stderr")
+
+    def __init__(self, stdin, stdout, stderr):
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def replace(self, **kwargs) -> "Streams":
+        return Streams(kwargs.get("stdin", self.stdin), kwargs.get("stdout", self.stdout),
+                       kwargs.get("stderr", self.stderr))
+
+    def err(self, message: str):
+        """Vypíše chybovou hlášku na stderr."""
+        self.stderr.write(message.encode("utf-8") + b"\n")
+
+
+# Interpret
+
+
+class Shell:
+    """
+    Stav shellu (proměnné, pracovní adresář, exit code) a vyhodnocení stromu.
+
+    Args:
+        system: Virtuální gateway (souborový systém, procesy, příkazy)
+    """
+
+    def __init__(self, system, variables: Optional[dict] = None, cwd: str = "/", args: tuple = ()):
+        self.system = system
+        self.fs = system.fs
+        self.vars = dict(variables if variables is not None else system.environment())
+        self.cwd = cwd
+        self.args = list(args)
+        self.status = 0
+
+    def path(self, value: str) -> str:
+        """Absolutní normalizovaná cesta vůči pracovnímu adresáři."""
+        return self.fs.normalize(value, self.cwd)
+
+    def subshell(self) -> "Shell":
+        sub = Shell(self.system, self.vars, self.cwd, tuple(self.args))
+        sub.status = self.status
+        return sub
+
+    def run_script(self, text: str, streams: Streams) -> int:
+        """Naparsuje a provede skript, vrací exit code (syntaktická chyba = 2)."""
+        try:
+            tree = Parser(text).parse()
+        except Incomplete:
+            streams.err("sh: syntax error: unexpected end of file")
+            return 2
+        except ShellSyntaxError as e:
+            streams.err(f"sh: {e}")
+            return 2
+        return self.run_tree(tree, streams)
+
+    def run_tree(self, tree, streams: Streams) -> int:
+        try:
+            return self.execute(tree, streams)
+        except ShellExit as e:
+            self.status = e.status
+            return e.status
+        except ShellSyntaxError as e:
+            streams.err(f"sh: {e}")
+            self.status = 2
+            return 2
+
+    # Vyhodnocení uzlů
+
+    def execute(self, node, streams: Streams) -> int:
+        if isinstance(node, CommandList):
+            for item, background in node.items:
+                if background:
+                    self.system.spawn_background(self.subshell(), item, streams)
+                    self.status = 0
+                else:
+                    self.status = self.execute(item, streams)
+            return self.status
+        if isinstance(node, AndOr):
+            status = self.execute(node.first, streams)
+            for op, pipeline in node.rest:
+                if (op == "&&" and status == 0) or (op == "||" and status != 0):
+                    status = self.execute(pipeline, streams)
+            self.status = status
+            return status
+        if isinstance(node, Pipeline):
+            status = self._pipeline(node, streams)
+            self.status = int(status == 0) if node.negate else status
+            return self.status
+        if isinstance(node, Simple):
+            self.status = self._simple(node, streams)
+            return self.status
+        return self._compound(node, streams)
+
+    def _pipeline(self, node: Pipeline, streams: Streams) -> int:
+        if len(node.commands) == 1:
+            return self.execute(node.commands[0], streams)
+        stdin = streams.stdin
+        status = 0
+        for index, command in enumerate(node.commands):
+            last = index == len(node.commands) - 1
+            output = streams.stdout if last else io.BytesIO()
+            # Každá část roury běží v subshellu, jen poslední zapisuje rovnou ven
+            status = self.subshell().run_tree(command, streams.replace(stdin=stdin, stdout=output))
+            if not last:
+                stdin = io.BytesIO(output.getvalue())
+        return status
+
+    def _compound(self, node, streams: Streams) -> int:
+        with self._redirected(node.redirects, streams) as redirected:
+            if redirected is None:
+                return 1
+            if isinstance(node, Group):
+                if node.subshell:
+                    return self.subshell().run_tree(node.body, redirected)
+                return self.execute(node.body, redirected)
+            if isinstance(node, If):
+                for condition, body in node.clauses:
+                    if self.execute(condition, redirected) == 0:
+                        return self.execute(body, redirected)
+                return self.execute(node.else_body, redirected) if node.else_body else 0
+            if isinstance(node, Loop):
+                status = 0
+                while (self.execute(node.condition, redirected) == 0) != node.until:
+                    status = self.execute(node.body, redirected)
+                return status
+            if isinstance(node, For):
+                values = self.args if node.words is None else [f for w in node.words for f in self.expand(w, redirected)]
+                status = 0
+                for value in values:
+                    self.vars[node.name] = value
+                    status = self.execute(node.body, redirected)
+                return status
+        raise ShellSyntaxError(f"Neznámý uzel {type(node).__name__}")
+
+    def _simple(self, node: Simple, streams: Streams) -> int:
+        self._substitution_status = None
+        for name, value in node.assigns:
+            self.vars[name] = self.expand_single(value, streams)
+        fields = []
+        for word in node.words:
+            fields.extend(self.expand(word, streams))
+        substitution_status = self._substitution_status
+        with self._redirected(node.redirects, streams) as redirected:
+            if redirected is None:
+                return 1
+            if not fields:
+                return substitution_status or 0
+            return self.system.run_command(self, fields, redirected)
+
+    # Přesměrování
+
+    class _Redirection:
+        def __init__(self, shell: "Shell", redirects, streams: Streams):
+            self.shell = shell
+            self.redirects = redirects
+            self.streams = streams
+            self.opened = []
+
+        def __enter__(self) -> Optional[Streams]:
+            streams = self.streams
+            for redirect in self.redirects:
+                try:
+                    streams = self.shell._apply(redirect, streams, self.opened)
+                except OSError as e:
+                    target = self.shell.expand_single(redirect.target, streams) if redirect.target else ""
+                    action = "open" if redirect.op == "<" else "create"
+                    streams.err(f"sh: can't {action} {target}: {e.strerror}")
+                    return None
+            return streams
+
+        def __exit__(self, *exc):
+            for handle in self.opened:
+                handle.close()
+            return False
+
+    def _redirected(self, redirects, streams: Streams) -> "_Redirection":
+        return Shell._Redirection(self, redirects, streams)
+
+    def _apply(self, redirect: Redirect, streams: Streams, opened: list) -> Streams:
+        names = {0: "stdin", 1: "stdout", 2: "stderr"}
+        if redirect.fd not in names:
+            return streams
+        name = names[redirect.fd]
+        if redirect.op in ("<<", "<<-"):
+            body = self.expand_single(redirect.heredoc, streams) if redirect.heredoc else ""
+            return streams.replace(stdin=io.BytesIO(body.encode("utf-8")))
+        target = self.expand_single(redirect.target, streams)
+        if redirect.op in (">&", "<&"):
+            if target == "-":
+                return streams.replace(**{name: self.system.null_device()})
+            source = {"0": streams.stdin, "1": streams.stdout, "2": streams.stderr}.get(target)
+            if source is None:
+                raise OSError(9, "Bad file descriptor")
+            return streams.replace(**{name: source})
+        handle = self.system.open_file(self.path(target), redirect.op)
+        opened.append(handle)
+        return streams.replace(**{name: handle})
+
+    # Expanze slov
+
+    def expand(self, word: Word, streams: Streams) -> list[str]:
+        """Expanduje slovo na seznam polí (nekvotované expanze se dělí podle mezer)."""
+        fields: list[str] = []
+        current: Optional[str] = None
+        for part in word.parts:
+            quoted = part[-1]
+            value = self._expand_part(part, streams)
+            if part[0] == "lit" or quoted:
+                current = (current or "") + value
+                continue
+            pieces = value.split()
+            if not pieces:
+                continue
+            if value[0].isspace() and current is not None:
+                fields.append(current)
+                current = None
+            for piece in pieces[:-1]:
+                fields.append((current or "") + piece)
+                current = None
+            current = (current or "") + pieces[-1]
+            if value[-1].isspace():
+                fields.append(current)
+                current = None
+        if current is not None:
+            fields.append(current)
+        return fields
+
+    def expand_single(self, word: Word, streams: Streams) -> str:
+        """Expanduje slovo bez dělení na pole (přiřazení, cíl přesměrování)."""
+        return "".join(self._expand_part(part, streams) for part in word.parts)
+
+    def _expand_part(self, part: tuple, streams: Streams) -> str:
+        kind = part[0]
+        if kind == "lit":
+            return part[1]
+        if kind == "cmd":
+            output = io.BytesIO()
+            sub = self.subshell()
+            status = sub.run_tree(part[1], streams.replace(stdout=output))
+            self._substitution_status = status
+            return output.getvalue().decode("utf-8", errors="replace").rstrip("\n")
+        if kind == "arith":
+            text = re.sub(r"\$\{?([A-Za-z_][A-Za-z0-9_]*)\}?", lambda m: self.vars.get(m.group(1), "0") or "0", part[1])
+            try:
+                return str(_arith(ast.parse(text.strip(), mode="eval"), self.vars))
+            except (SyntaxError, ZeroDivisionError) as e:
+                raise ShellSyntaxError(f"arithmetic syntax error: {e}")
+        _, name, op, arg, _ = part
+        value = self._variable(name)
+        if op is None:
+            return value or ""
+        if op == "#len":
+            return str(len(value or ""))
+        if op in (":-", "-"):
+            unset = value is None or (op == ":-" and value == "")
+            return self.expand_single(arg, streams) if unset else value
+        if op in (":=", "="):
+            if value is None or (op == ":=" and value == ""):
+                value = self.vars[name] = self.expand_single(arg, streams)
+            return value
+        if op in (":+", "+"):
+            isset = value is not None and (op == "+" or value != "")
+            return self.expand_single(arg, streams) if isset else ""
+        if op in (":?", "?"):
+            if value is None or (op == ":?" and value == ""):
+                streams.err(f"sh: {name}: {self.expand_single(arg, streams) or 'parameter not set'}")
+                raise ShellExit(1)
+            return value
+        return _strip_pattern(value or "", op, self.expand_single(arg, streams))
+
+    def _variable(self, name: str) -> Optional[str]:
+        if name == "?":
+            return str(self.status)
+        if name == "$":
+            return str(self.system.shell_pid)
+        if name == "#":
+            return str(len(self.args))
+        if name in ("@", "*"):
+            return " ".join(self.args)
+        if name == "0":
+            return "sh"
+        if name.isdigit():
+            index = int(name) - 1
+            return self.args[index] if index < len(self.args) else None
+        return self.vars.get(name)
+
+
+def _strip_pattern(value: str, op: str, pattern: str) -> str:
+    """${x%vzor}, ${x%%vzor}, ${x#vzor}, ${x##vzor}"""
+    regex = re.compile(fnmatch.translate(pattern), re.DOTALL)
+    positions = range(len(value) + 1)
+    if op in ("%", "%%"):
+        order = positions if op == "%%" else reversed(positions)
+        for start in order:
+            if regex.fullmatch(value[start:]):
+                return value[:start]
+    else:
+        order = reversed(positions) if op == "##" else positions
+        for end in order:
+            if regex.fullmatch(value[:end]):
+                return value[end:]
+    return value
+
+
+class InteractiveShell:
+    """
+    Shell kanál (invoke_shell): čte skript po řádcích a provádí kompletní příkazy.
+
+    Neúplný vstup (otevřená skupina, heredoc, uvozovky) se drží v bufferu,
+    dokud nedorazí zbytek.
+    """
+
+    def __init__(self, shell: Shell, streams: Streams):
+        self.shell = shell
+        self.streams = streams
+        self._buffer = b""
+        self._lock = threading.Lock()
+
+    def feed(self, data: bytes) -> Optional[int]:
+        """Přidá vstup a provede hotové příkazy; vrací exit code po `exit`, jinak None."""
+        with self._lock:
+            self._buffer += data
+            cut = self._buffer.rfind(b"\n")
+            if cut < 0:
+                return None
+            text = self._buffer[:cut + 1].decode("utf-8", errors="replace")
+            try:
+                tree = Parser(text).parse()
+            except Incomplete:
+                return None
+            except ShellSyntaxError as e:
+                self._buffer = self._buffer[cut + 1:]
+                self.streams.err(f"sh: {e}")
+                self.shell.status = 2
+                return None
+            self._buffer = self._buffer[cut + 1:]
+            try:
+                self.shell.execute(tree, self.streams)
+            except ShellExit as e:
+                return e.status
+            except ShellSyntaxError as e:
+                self.streams.err(f"sh: {e}")
+                self.shell.status = 2
+            return None
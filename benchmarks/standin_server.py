@@ -0,0 +1,337 @@
+"""
+Lokální náhradní SSH server pro benchmarky.
+
+Přijímá heslo, exec i shell kanály (příkazy spouští přes lokální /bin/sh)
+a SFTP subsystém nad lokálním souborovým systémem. Slouží pouze pro měření
+režie SSH vrstvy, nejde o emulaci gateway.
+
+Spuštění samostatně:
+    python -m benchmarks.standin_server --port 2222 --password standin
+"""
+import argparse
+import os
+import socket
+import subprocess
+import threading
+import time
+from typing import Optional
+import logging
+
+import paramiko
+
+logger = logging.getLogger(__name__)
+
+# Algoritmy starší verze sshd bez curve25519 a ECDH (jen klasický Diffie-Hellman)
+LEGACY_SSHD = {
+    "kex": (
+        "diffie-hellman-group16-sha512", "diffie-hellman-group14-sha256",
+        "diffie-hellman-group14-sha1", "diffie-hellman-group1-sha1",
+    ),
+    "ciphers": ("aes128-ctr", "aes256-ctr", "aes128-cbc", "aes256-cbc"),
+    "digests": ("hmac-sha2-256", "hmac-sha2-512", "hmac-sha1"),
+}
+
+_host_key: Optional[paramiko.RSAKey] = None
+_host_key_lock = threading.Lock()
+
+
+def get_host_key() -> paramiko.RSAKey:
+    """Vrací host klíč serveru (generuje se jednou za běh procesu)."""
+    global _host_key
+    with _host_key_lock:
+        if _host_key is None:
+            _host_key = paramiko.RSAKey.generate(2048)
+        return _host_key
+
+
+class LocalSFTPHandle(paramiko.SFTPHandle):
+    """SFTP handle nad lokálním souborem."""
+
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+
+class LocalSFTPInterface(paramiko.SFTPServerInterface):
+    """SFTP server nad lokálním souborovým systémem (volitelně pod kořenem `root`)."""
+
+    root = "/"
+
+    def _path(self, path: str) -> str:
+        return os.path.join(self.root, self.canonicalize(path).lstrip("/"))
+
+    def list_folder(self, path):
+        try:
+            real = self._path(path)
+            result = []
+            for name in os.listdir(real):
+                attr = paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(real, name)))
+                attr.filename = name
+                result.append(attr)
+            return result
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.lstat(self._path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        real = self._path(path)
+        try:
+            fd = os.open(real, flags | getattr(os, "O_BINARY", 0), 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        try:
+            f = os.fdopen(fd, mode)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = LocalSFTPHandle(flags)
+        handle.filename = real
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self._path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(self._path(oldpath), self._path(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def posix_rename(self, oldpath, newpath):
+        try:
+            os.replace(self._path(oldpath), self._path(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self._path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rmdir(self, path):
+        try:
+            os.rmdir(self._path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        try:
+            if attr._flags & attr.FLAG_PERMISSIONS:
+                os.chmod(self._path(path), attr.st_mode)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    """Autentizace heslem a povolení exec/shell/SFTP kanálů."""
+
+    def __init__(self, server: "StandInServer"):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if password == self.server.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        self.server.spawn(channel, ["/bin/sh", "-c", command.decode("utf-8", errors="replace")])
+        return True
+
+    def check_channel_shell_request(self, channel):
+        self.server.spawn(channel, ["/bin/sh"])
+        return True
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_global_request(self, kind, msg):
+        # keepalive@openssh.com apod. - odpovídáme jako OpenSSH (selháním)
+        return False
+
+
+class StandInServer:
+    """
+    Náhradní SSH server běžící ve vlákně na 127.0.0.1.
+
+    Args:
+        port: Port (0 = náhodný volný port)
+        password: Heslo pro uživatele root
+        root: Kořen pro SFTP a pracovní adresář příkazů
+        spawn_delay: Umělá prodleva při otevření každého kanálu (pomalý sshd)
+        sshd_algorithms: Podporované algoritmy (klíče kex, ciphers, digests, key_types
+            jako u paramiko SecurityOptions, např. LEGACY_SSHD; None = výchozí paramiko)
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, password: str = "standin",
+                 root: str = "/", spawn_delay: float = 0.0, sshd_algorithms: Optional[dict] = None):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.root = root
+        self.spawn_delay = spawn_delay
+        self.sshd_algorithms = sshd_algorithms or {}
+        self._sock: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._transports: list[paramiko.Transport] = []
+        self._stopping = threading.Event()
+
+    def start(self) -> int:
+        """Spustí server na pozadí a vrací port (po stop() lze spustit znovu)."""
+        self._stopping.clear()
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen(128)
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True, name="standin-accept")
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        """Zastaví server a zavře všechna spojení."""
+        self._stopping.set()
+        if self._sock:
+            self._sock.close()
+        for transport in self._transports:
+            transport.close()
+
+    def _accept_loop(self):
+        while not self._stopping.is_set():
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handshake, args=(client,), daemon=True).start()
+
+    def _handshake(self, client: socket.socket):
+        sftp_interface = type("RootedSFTPInterface", (LocalSFTPInterface,), {"root": self.root})
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport = paramiko.Transport(client)
+        transport.add_server_key(get_host_key())
+        options = transport.get_security_options()
+        for field, algorithms in self.sshd_algorithms.items():
+            setattr(options, field, tuple(algorithms))
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, sftp_interface)
+        try:
+            transport.start_server(server=_ServerInterface(self))
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            logger.debug(f"Handshake selhal: {e}")
+            return
+        self._transports = [t for t in self._transports if t.is_active()]
+        self._transports.append(transport)
+
+    def spawn(self, channel: paramiko.Channel, argv: list[str]):
+        """Spustí proces pro kanál a propojí jeho stdin/stdout/stderr."""
+        threading.Thread(target=self._run, args=(channel, argv), daemon=True).start()
+
+    def _run(self, channel: paramiko.Channel, argv: list[str]):
+        if self.spawn_delay:
+            time.sleep(self.spawn_delay)
+        proc = subprocess.Popen(
+            argv, cwd=self.root,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+        def pump_out(stream, send):
+            for chunk in iter(lambda: stream.read1(32768), b""):
+                send(chunk)
+
+        def pump_in():
+            try:
+                while True:
+                    data = channel.recv(32768)
+                    if not data:
+                        break
+                    proc.stdin.write(data)
+                    proc.stdin.flush()
+            except (OSError, ValueError):
+                pass
+            finally:
+                try:
+                    proc.stdin.close()
+                except OSError:
+                    pass
+
+        pumps = [
+            threading.Thread(target=pump_out, args=(proc.stdout, channel.sendall), daemon=True),
+            threading.Thread(target=pump_out, args=(proc.stderr, channel.sendall_stderr), daemon=True),
+        ]
+        for pump in pumps:
+            pump.start()
+        threading.Thread(target=pump_in, daemon=True).start()
+        exit_code = proc.wait()
+        if exit_code < 0:
+            # Proces ukončený signálem - stejně jako shell vracíme 128 + číslo signálu
+            exit_code = 128 - exit_code
+        for pump in pumps:
+            pump.join()
+        try:
+            channel.send_exit_status(exit_code)
+            channel.close()
+        except (OSError, EOFError):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokální náhradní SSH server pro benchmarky")
+    parser.add_argument("--port", type=int, default=2222)
+    parser.add_argument("--password", default="standin")
+    parser.add_argument("--root", default="/")
+    parser.add_argument("--spawn-delay", type=float, default=0.0,
+                        help="Prodleva při otevření kanálu v sekundách")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = StandInServer(port=args.port, password=args.password,
+                           root=args.root, spawn_delay=args.spawn_delay)
+    port = server.start()
+    logger.info(f"Náhradní SSH server běží na 127.0.0.1:{port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
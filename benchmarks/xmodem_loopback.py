@@ -0,0 +1,281 @@
+"""
+Náhradní přijímač XMODEM na pty pro ověření a měření odesílače v aplikaci.
+
+Přijímač na master straně pseudoterminálu se chová jako menu Gecko
+bootloaderu: po volbě `1` vypíše "begin upload" a výzvami 'C' čeká na
+XMODEM-1K/CRC přenos. Volitelně emuluje rychlost UART (doba přenosu bloku
+po lince) a chyby (každý N-tý blok odmítne jako poškozený).
+
+Odesílač se k pty připojí buď přímo (`--direct`), nebo stejně jako
+k gateway: přes lokální náhradní SSH server s mostem `cat` na slave stranu
+pty (volitelně za proxy s latencí). Pro každé okno se ověří, že přijatá
+data odpovídají souboru, a vypíší se statistiky přenosu.
+
+Spuštění:
+    python -m benchmarks.xmodem_loopback --size 200000 --latency-ms 20 --windows 1,4,8 --error-every 50
+"""
+import argparse
+import binascii
+import hashlib
+import json
+import os
+import select
+import threading
+import time
+import tty
+from typing import Optional
+
+from app.ssh_operations import SSHSession
+from app.xmodem import ACK, CAN, CRC_START, EOT, NAK, PAD, SOH, STX, SerialBridge, XmodemError, XmodemSender
+from benchmarks.bench_transfer import ThrottledProxy
+from benchmarks.standin_server import StandInServer
+
+
+class LoopbackReceiver:
+    """
+    XMODEM-CRC přijímač nad file descriptorem (master strana pty).
+
+    Args:
+        fd: File descriptor linky
+        baud: Emulovaná rychlost UART (0 = bez zdržení)
+        error_every: Každý N-tý přijatý blok odmítne jako poškozený (0 = bez chyb)
+        sequence_error: Reakce na blok mimo pořadí - "nak" nebo "cancel" (jako lrzsz)
+        start_interval: Interval výzev 'C' před prvním blokem v sekundách
+    """
+
+    def __init__(self, fd: int, baud: int = 115200, error_every: int = 0,
+                 sequence_error: str = "nak", start_interval: float = 1.0):
+        self.fd = fd
+        self.baud = baud
+        self.error_every = error_every
+        self.sequence_error = sequence_error
+        self.start_interval = start_interval
+        self.data = bytearray()
+        self.received_blocks = 0
+        self.rejected = 0
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+        self._buffer = bytearray()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="xmodem-receiver")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _fill(self, timeout: float) -> bool:
+        """Načte další data z linky, False po vypršení `timeout`."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            chunk = os.read(self.fd, 65536)
+        except OSError:
+            chunk = b""
+        if not chunk:
+            raise EOFError("Linka byla zavřena")
+        self._buffer += chunk
+        return True
+
+    def _take(self, size: int, timeout: float) -> Optional[bytes]:
+        deadline = time.monotonic() + timeout
+        while len(self._buffer) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._fill(remaining):
+                return None
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def _send(self, data: bytes):
+        os.write(self.fd, data)
+
+    def _run(self):
+        try:
+            self._menu()
+            self._receive()
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.done.set()
+
+    def _menu(self):
+        """Čeká na volbu `1` (upload gbl) jako menu bootloaderu."""
+        while not self._stop.is_set():
+            if b"1" in self._buffer:
+                self._buffer.clear()
+                self._send(b"\r\nbegin upload\r\n")
+                return
+            self._fill(0.1)
+
+    def _receive(self):
+        expected = 1
+        started = False
+        while not self._stop.is_set():
+            if not started:
+                # Výzva k zahájení přenosu v CRC režimu, dokud nepřijde první blok
+                self._send(bytes([CRC_START]))
+                header = self._take(1, self.start_interval)
+                if header is None:
+                    continue
+                started = True
+            else:
+                header = self._take(1, 10.0)
+                if header is None:
+                    self._send(bytes([NAK]))
+                    continue
+            kind = header[0]
+            if kind == EOT:
+                self._send(bytes([ACK]))
+                return
+            if kind == CAN:
+                raise XmodemError("Odesílač přenos zrušil")
+            if kind not in (SOH, STX):
+                continue
+            size = 1024 if kind == STX else 128
+            rest = self._take(2 + size + 2, 1.0)
+            if rest is None:
+                self._buffer.clear()
+                self._send(bytes([NAK]))
+                continue
+            seq, inverse, payload, crc = rest[0], rest[1], rest[2:2 + size], rest[2 + size:]
+            if self.baud:
+                # Doba bloku na lince UART (10 bitů na byte)
+                time.sleep((size + 5) * 10 / self.baud)
+            self.received_blocks += 1
+            corrupted = self.error_every and self.received_blocks % self.error_every == 0
+            if seq != 0xFF - inverse or corrupted or binascii.crc_hqx(payload, 0).to_bytes(2, "big") != crc:
+                self.rejected += 1
+                self._send(bytes([NAK]))
+                continue
+            if seq == (expected - 1) & 0xFF:
+                # Opakovaný předchozí blok (ztracené ACK)
+                self._send(bytes([ACK]))
+                continue
+            if seq != expected & 0xFF:
+                self.rejected += 1
+                if self.sequence_error == "cancel":
+                    self._send(bytes([CAN, CAN]))
+                    raise XmodemError(f"Blok mimo pořadí: {seq}, očekáván {expected & 0xFF}")
+                self._send(bytes([NAK]))
+                continue
+            self.data += payload
+            expected += 1
+            self._send(bytes([ACK]))
+
+
+class FdPort:
+    """Linka nad file descriptorem (slave strana pty) s rozhraním SerialBridge."""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            written = os.write(self.fd, view)
+            view = view[written:]
+
+    def read(self, timeout: float) -> bytes:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        return os.read(self.fd, 65536) if ready else b""
+
+
+def run_once(payload: bytes, window: int, args, ssh_port: Optional[int], password: str) -> dict:
+    """Jeden přenos přes novou pty; vrací statistiky odesílače a výsledek ověření."""
+    master, slave = os.openpty()
+    receiver = LoopbackReceiver(master, args.baud, args.error_every, args.sequence_error)
+    receiver.start()
+    session = None
+    result: dict = {"window": window}
+    try:
+        sender_kwargs = {"window": window, "ack_timeout": args.ack_timeout, "start_timeout": 10}
+        if ssh_port is None:
+            tty.setraw(slave)
+            port = FdPort(slave)
+            port.write(b"1\n")
+            stats = XmodemSender(port, **sender_kwargs).send(payload)
+        else:
+            session = SSHSession()
+            session.connect("127.0.0.1", ssh_port, password)
+            with SerialBridge(session.client.get_transport(), os.ttyname(slave)) as port:
+                port.write(b"1\n")
+                stats = XmodemSender(port, **sender_kwargs).send(payload)
+        receiver.done.wait(5)
+        received = bytes(receiver.data)
+        result.update(stats)
+        result["verified"] = (
+            received[:len(payload)] == payload and not received[len(payload):].strip(bytes([PAD]))
+        )
+    except XmodemError as e:
+        result["error"] = str(e)
+    finally:
+        result["receiver_rejected"] = receiver.rejected
+        if receiver.error:
+            result["receiver_error"] = receiver.error
+        receiver.stop()
+        if session:
+            session.disconnect()
+        os.close(slave)
+        os.close(master)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="XMODEM odesílač proti přijímači na pty")
+    parser.add_argument("--file", help="Odesílaný soubor (jinak náhodná data)")
+    parser.add_argument("--size", type=int, default=200_000, help="Velikost náhodných dat v bytech")
+    parser.add_argument("--baud", type=int, default=115200, help="Emulovaná rychlost UART (0 = bez zdržení)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Jednosměrná latence SSH linky v ms")
+    parser.add_argument("--windows", default="1,4", help="Porovnávaná okna (čárkou oddělená)")
+    parser.add_argument("--error-every", type=int, default=0, help="Každý N-tý blok přijímač odmítne")
+    parser.add_argument("--sequence-error", choices=("nak", "cancel"), default="nak",
+                        help="Reakce přijímače na blok mimo pořadí")
+    parser.add_argument("--ack-timeout", type=float, default=3, help="Čekání odesílače na potvrzení v sekundách")
+    parser.add_argument("--direct", action="store_true", help="Bez SSH, odesílač přímo na pty")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            payload = f.read()
+    else:
+        payload = os.urandom(args.size)
+    windows = [int(w) for w in args.windows.split(",") if w.strip()]
+
+    server = proxy = None
+    ssh_port = None
+    password = ""
+    if not args.direct:
+        server = StandInServer()
+        ssh_port = server.start()
+        password = server.password
+        if args.latency_ms:
+            proxy = ThrottledProxy(ssh_port, 0, args.latency_ms / 1000)
+            ssh_port = proxy.start()
+    try:
+        results = [run_once(payload, window, args, ssh_port, password) for window in windows]
+    finally:
+        if proxy:
+            proxy.stop()
+        if server:
+            server.stop()
+
+    print(json.dumps({
+        "bytes": len(payload),
+        "sha256": hashlib.sha256(payload).hexdigest(),
+        "baud": args.baud,
+        "latency_ms": args.latency_ms,
+        "transport": "pty" if args.direct else "ssh",
+        "error_every": args.error_every,
+        "sequence_error": args.sequence_error,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
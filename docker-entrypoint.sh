@@ -0,0 +1,36 @@
+#!/bin/sh
+# Spuštění aplikace v kontejneru.
+#
+# S WEB_WORKERS > 1 běží vedle uvicorn workerů SSH broker. Broker hlídá
+# smyčka, která ho po pádu znovu spustí (SSH session se ztratí, workery
+# se k novému brokeru připojí při dalším požadavku). Uvicorn se spustí až
+# ve chvíli, kdy broker vytvořil socket.
+set -e
+
+WEB_WORKERS="${WEB_WORKERS:-1}"
+
+if [ "$WEB_WORKERS" -gt 1 ]; then
+    export SSH_BROKER_SOCKET="${SSH_BROKER_SOCKET:-/tmp/ssh-broker.sock}"
+    # Socket z předchozího běhu kontejneru by čekání níže hned ukončil
+    rm -f "$SSH_BROKER_SOCKET"
+
+    (
+        while true; do
+            python -m app.broker && status=0 || status=$?
+            echo "SSH broker skončil (kód $status), nové spuštění za ${SSH_BROKER_RESTART_DELAY:-1} s" >&2
+            sleep "${SSH_BROKER_RESTART_DELAY:-1}"
+        done
+    ) &
+
+    waited=0
+    while [ ! -S "$SSH_BROKER_SOCKET" ]; do
+        if [ "$waited" -ge "$((${SSH_BROKER_START_TIMEOUT:-30} * 10))" ]; then
+            echo "SSH broker nevytvořil socket $SSH_BROKER_SOCKET do ${SSH_BROKER_START_TIMEOUT:-30} s" >&2
+            exit 1
+        fi
+        sleep 0.1
+        waited=$((waited + 1))
+    done
+fi
+
+exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers "$WEB_WORKERS"
@@ -47,6 +47,22 @@ function copyToClipboard(text) {
     });
 }
 
+/**
+ * Naformátuje počet bytů do čitelné podoby.
+ * @param {number} bytes - Počet bytů
+ * @returns {string}
+ */
+function formatBytes(bytes) {
+    const units = ['B', 'KiB', 'MiB', 'GiB'];
+    let value = bytes;
+    let unit = 0;
+    while (value >= 1024 && unit < units.length - 1) {
+        value /= 1024;
+        unit++;
+    }
+    return `${value.toFixed(unit === 0 ? 0 : 1)} ${units[unit]}`;
+}
+
 // HTMX error handling
 document.body.addEventListener('htmx:responseError', function(event) {
     const detail = event.detail;